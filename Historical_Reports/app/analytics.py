@@ -0,0 +1,359 @@
+# analytics.py
+"""Columnar snapshot of the closed days, for the long date-range reports.
+
+A nightly export writes every closed UTC day of the report sources to Parquet
+under ANALYTICS_DIR, one hive partition per day:
+
+    calls/day=2024-09-01/part-0.parquet          call_facts, one row per call
+    cdr/day=2024-09-01/part-0.parquet            the cdr columns of the CDR report
+    agent_states/day=2024-09-01/part-0.parquet   historical_agents_metrics snapshots
+
+    python -m app.analytics export    # nightly, after the rollup job has passed midnight
+
+manifest.json records the first and last day written per source. The report
+crud runs the same aggregates on an embedded DuckDB for the part of a window
+the snapshot holds, and on Postgres for the rest (today, in practice), so a
+date range over months scans a few columns of Parquet instead of cdr rows.
+
+A day is closed EXPORT_SETTLE after it ends, and for calls once the
+call_facts refresh has also got that far, so legs written just after
+midnight are merged into their call first. Days are exported in order and
+each replaces its partition file in one rename, so an export can be re-run
+at any time, reports running alongside included.
+
+duckdb (reading) and pyarrow (exporting) are optional; without them, or
+without ANALYTICS_DIR, every report reads Postgres as before.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterator, Optional
+
+import pytz
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import rollups
+from app.config import settings
+from app.utils import ReportWindow
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional dependency
+    pyarrow = None
+
+MANIFEST = "manifest.json"
+
+EXPORT_SETTLE = timedelta(hours=1)
+
+# Rows per round trip and per Parquet row group
+EXPORT_BATCH = 50000
+
+# Each source's rows in [start_time, end_time) of its timestamp. Columns are cast to
+# what the Parquet schema holds.
+EXPORT_QUERIES = {
+    "calls": text("""
+        SELECT call_uuid::text, timestamp, direction, cc_agent, cc_queue, start_stamp, answer_stamp,
+               end_stamp, duration, billsec, waitsec, legs, bridged, wait_seconds::float8,
+               talk_seconds::float8, outcome
+        FROM call_facts
+        WHERE timestamp >= :start_time AND timestamp < :end_time
+    """),
+    "cdr": text("""
+        SELECT uuid::text, bleg_uuid::text, timestamp, direction, cc_agent, cc_queue, caller_id_number,
+               destination_number, start_stamp, answer_stamp, end_stamp, duration, billsec, waitsec,
+               hangup_cause
+        FROM cdr
+        WHERE timestamp >= :start_time AND timestamp < :end_time
+    """),
+    "agent_states": text("""
+        SELECT timestamp, agent_id, name, status, state
+        FROM historical_agents_metrics
+        WHERE timestamp >= :start_time AND timestamp < :end_time
+    """),
+}
+
+SOURCE_TABLES = {"calls": "call_facts", "cdr": "cdr", "agent_states": "historical_agents_metrics"}
+
+
+def _schema(source: str):
+    # Naive UTC columns stay naive, historical_agents_metrics.timestamp is timestamptz
+    timestamp, utc_timestamp, string = pyarrow.timestamp("us"), pyarrow.timestamp("us", tz="UTC"), pyarrow.string()
+    integer = pyarrow.int64()
+    fields = {
+        "calls": [("call_uuid", string), ("timestamp", timestamp), ("direction", string), ("cc_agent", string),
+                  ("cc_queue", string), ("start_stamp", timestamp), ("answer_stamp", timestamp),
+                  ("end_stamp", timestamp), ("duration", integer), ("billsec", integer), ("waitsec", integer),
+                  ("legs", integer), ("bridged", pyarrow.bool_()), ("wait_seconds", pyarrow.float64()),
+                  ("talk_seconds", pyarrow.float64()), ("outcome", string)],
+        "cdr": [("uuid", string), ("bleg_uuid", string), ("timestamp", timestamp), ("direction", string),
+                ("cc_agent", string), ("cc_queue", string), ("caller_id_number", string),
+                ("destination_number", string), ("start_stamp", timestamp), ("answer_stamp", timestamp),
+                ("end_stamp", timestamp), ("duration", integer), ("billsec", integer), ("waitsec", integer),
+                ("hangup_cause", string)],
+        "agent_states": [("timestamp", utc_timestamp), ("agent_id", integer), ("name", string),
+                         ("status", string), ("state", string)],
+    }[source]
+    return pyarrow.schema(fields)
+
+
+# ------------------------------------------ manifest ----------------------------------->
+
+_manifest_cache = {"mtime": None, "days": {}}
+
+
+def _manifest_path() -> str:
+    return os.path.join(settings.ANALYTICS_DIR, MANIFEST)
+
+
+def read_manifest() -> Dict[str, dict]:
+    """{source: {"first_day": ..., "last_day": ...}}, re-read whenever the exporter rewrites it."""
+    try:
+        mtime = os.stat(_manifest_path()).st_mtime
+    except OSError:
+        return {}
+    if mtime != _manifest_cache["mtime"]:
+        with open(_manifest_path()) as f:
+            _manifest_cache["days"] = json.load(f)
+        _manifest_cache["mtime"] = mtime
+    return _manifest_cache["days"]
+
+
+def _write_manifest(days: Dict[str, dict]) -> None:
+    path = _manifest_path()
+    with open(path + ".tmp", "w") as f:
+        json.dump(days, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _day_start(day: date) -> datetime:
+    return pytz.utc.localize(datetime.combine(day, datetime.min.time()))
+
+
+def snapshot_span(source: str):
+    """[start, end) in UTC held by the snapshot of source, or None."""
+    if duckdb is None or not settings.ANALYTICS_DIR:
+        return None
+    days = read_manifest().get(source)
+    if not days:
+        return None
+    return (_day_start(date.fromisoformat(days["first_day"])),
+            _day_start(date.fromisoformat(days["last_day"]) + timedelta(days=1)))
+
+
+def covers(window: ReportWindow, source: str) -> bool:
+    span = snapshot_span(source)
+    return span is not None and span[0] <= window.start_utc and window.end_utc < span[1]
+
+
+# ------------------------------------------ reading ----------------------------------->
+
+# Sources of the report queries, pruned to the days of the window (the agent states
+# from the day before, for the status each agent starts the window in); aliased as
+# the Postgres tables they stand in for
+CALLS_SQL = ("SELECT * FROM calls WHERE day BETWEEN $start_day AND $end_day"
+             " AND timestamp >= :start_time AND timestamp <= :end_time")
+CDR_SQL = "(SELECT * FROM cdr WHERE day BETWEEN $start_day AND $end_day) AS cdr"
+AGENT_STATES_SQL = ("(SELECT * FROM agent_states WHERE day BETWEEN $start_day - 1 AND $end_day)"
+                    " AS historical_agents_metrics")
+
+_connection = None
+_connection_lock = threading.Lock()
+# Sources with a view on the connection
+_views = set()
+
+
+def query(sql: str) -> str:
+    """A report query in DuckDB's parameter style: :name becomes $name, casts stay."""
+    return re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
+
+
+def _cursor():
+    global _connection
+    with _connection_lock:
+        if _connection is None:
+            connection = duckdb.connect()
+            # Naive parameters against the timestamptz snapshots are UTC, and NULLs sort as in Postgres
+            connection.execute("SET TimeZone = 'UTC'")
+            connection.execute("SET default_null_order = 'nulls_last_on_asc_first_on_desc'")
+            _connection = connection
+        # Only the sources with days written: read_parquet fails on a glob matching no files,
+        # and a source is only read once the manifest lists it (see snapshot_span)
+        for source in read_manifest():
+            if source in SOURCE_TABLES and source not in _views:
+                pattern = os.path.join(settings.ANALYTICS_DIR, source, "*", "*.parquet")
+                _connection.execute(f"CREATE VIEW {source} AS SELECT * FROM read_parquet('{pattern}', "
+                                    f"hive_partitioning = true, hive_types = {{'day': DATE}})")
+                _views.add(source)
+        # One cursor per caller: a DuckDB connection is not shared across threads
+        return _connection.cursor()
+
+
+def _params(start_time: datetime, end_time: datetime) -> dict:
+    start_time, end_time = start_time.astimezone(pytz.utc), end_time.astimezone(pytz.utc)
+    return {'start_time': start_time.replace(tzinfo=None), 'end_time': end_time.replace(tzinfo=None),
+            'start_day': start_time.date(), 'end_day': end_time.date()}
+
+
+def fetch_rows(sql: str, start_time: datetime, end_time: datetime) -> list:
+    """Rows of a query() over [start_time, end_time] of the snapshot."""
+    cursor = _cursor()
+    try:
+        return cursor.execute(sql, _params(start_time, end_time)).fetchall()
+    finally:
+        cursor.close()
+
+
+async def fetch_rows_async(sql: str, start_time: datetime, end_time: datetime) -> list:
+    # DuckDB runs in a worker thread, off the event loop
+    return await asyncio.to_thread(fetch_rows, sql, start_time, end_time)
+
+
+def iter_rows(sql: str, start_time: datetime, end_time: datetime, batch: int) -> Iterator[tuple]:
+    cursor = _cursor()
+    try:
+        cursor.execute(sql, _params(start_time, end_time))
+        while rows := cursor.fetchmany(batch):
+            yield from rows
+    finally:
+        cursor.close()
+
+
+async def fetch_window_totals_async(source: str, sql: str, window: ReportWindow, from_rows: Callable,
+                                    fetch_rest: Callable[[datetime, datetime], Awaitable[Dict[str, dict]]]
+                                    ) -> Dict[str, dict]:
+    """Per-key totals of window: the days in the snapshot of source from DuckDB, the rest
+    from fetch_rest(start_time, end_time) on Postgres.
+
+    Windows starting before the snapshot are left to Postgres whole.
+    """
+    span = snapshot_span(source)
+    if span is None or not span[0] <= window.start_utc < span[1]:
+        return await fetch_rest(window.start_utc, window.end_utc)
+
+    snapshot_end = min(window.end_utc, span[1] - timedelta(microseconds=1))
+    fetches = [fetch_rows_async(sql, window.start_utc, snapshot_end)]
+    if window.end_utc >= span[1]:
+        fetches.append(fetch_rest(span[1], window.end_utc))
+    results = await asyncio.gather(*fetches)
+    parts = [from_rows(results[0])] + list(results[1:])
+    return parts[0] if len(parts) == 1 else rollups.combine_totals(parts)
+
+
+# ------------------------------------------ exporting ----------------------------------->
+
+def _utc_date(value: datetime) -> date:
+    # cdr and call_facts timestamps are naive UTC
+    return value.astimezone(pytz.utc).date() if value.tzinfo else value.date()
+
+
+def closed_until(db: Session, source: str, now: datetime) -> Optional[datetime]:
+    """End of the last day of source that can be exported, None while there is none."""
+    limit = now
+    if source == "calls":
+        # Up to where the legs have been merged into call_facts
+        watermark = rollups.get_watermark(db, "call_facts")
+        if watermark is None:
+            return None
+        limit = min(limit, watermark)
+    return _day_start((limit - EXPORT_SETTLE).date())
+
+
+def export_day(db: Session, source: str, day: date) -> int:
+    """Write one day of source to its partition, replacing it. Returns the rows written."""
+    start_time = _day_start(day)
+    end_time = start_time + timedelta(days=1)
+    if source != "agent_states":
+        start_time, end_time = start_time.replace(tzinfo=None), end_time.replace(tzinfo=None)
+
+    staging = os.path.join(settings.ANALYTICS_DIR, ".staging", source, day.isoformat())
+    target = os.path.join(settings.ANALYTICS_DIR, source, f"day={day.isoformat()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    schema = _schema(source)
+    rows = 0
+    result = db.execute(EXPORT_QUERIES[source].execution_options(stream_results=True, yield_per=EXPORT_BATCH),
+                        {'start_time': start_time, 'end_time': end_time})
+    # Empty days get an empty file too, so the days in the manifest are all there
+    with pyarrow.parquet.ParquetWriter(os.path.join(staging, "part-0.parquet"), schema,
+                                       compression="zstd") as writer:
+        for batch in result.partitions(EXPORT_BATCH):
+            columns = list(zip(*batch))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema))
+            rows += len(batch)
+
+    # Swapping the file rather than the directory keeps the day readable throughout:
+    # the rename is atomic and readers holding the old file keep reading it
+    os.makedirs(target, exist_ok=True)
+    os.replace(os.path.join(staging, "part-0.parquet"), os.path.join(target, "part-0.parquet"))
+    shutil.rmtree(staging, ignore_errors=True)
+    return rows
+
+
+def export(db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Export every closed day not in the snapshot yet. Returns the days written per source."""
+    if pyarrow is None:
+        raise RuntimeError("pyarrow is required to export the analytics snapshot")
+    now = now or datetime.now(pytz.utc)
+    os.makedirs(settings.ANALYTICS_DIR, exist_ok=True)
+    manifest = dict(read_manifest())
+
+    done = {}
+    for source, table in SOURCE_TABLES.items():
+        days = manifest.get(source)
+        if days:
+            day = date.fromisoformat(days["last_day"]) + timedelta(days=1)
+        else:
+            first_row = db.execute(text(f"SELECT MIN(timestamp) FROM {table}")).scalar()
+            if first_row is None:
+                continue
+            day = _utc_date(first_row)
+            days = {"first_day": day.isoformat()}
+
+        until = closed_until(db, source, now)
+        done[source] = 0
+        while until is not None and _day_start(day) + timedelta(days=1) <= until:
+            rows = export_day(db, source, day)
+            print(f"Exported {rows} rows of {source} for {day}")
+            days["last_day"] = day.isoformat()
+            manifest[source] = dict(days)
+            _write_manifest(manifest)
+            done[source] += 1
+            day += timedelta(days=1)
+    return done
+
+
+def main():
+    from database import read_session, replica_lag_allowance
+
+    parser = argparse.ArgumentParser(description="Columnar snapshot of the closed report days.")
+    parser.add_argument("command", choices=("export",))
+    parser.parse_args()
+
+    if not settings.ANALYTICS_DIR:
+        raise SystemExit("ANALYTICS_DIR is not set")
+
+    # Closed days are long on any replica that is up
+    db = read_session(replica_lag_allowance(datetime.now(pytz.utc) - EXPORT_SETTLE))
+    try:
+        print(f"Days exported: {export(db)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
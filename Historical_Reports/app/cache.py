@@ -0,0 +1,166 @@
+# cache.py
+"""Short lived response cache for the polled report endpoints.
+
+Keys are (endpoint, user_time_zone, window bucket): rolling windows fall into
+CACHE_TTL_SECONDS wide buckets of wall clock time, so every supervisor polling
+the same report in the same bucket shares one computation. Entries live in a
+size bounded in-process LRU, or in Redis when REDIS_URL is set so that all
+uvicorn workers share them.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from app import responses
+from app.config import settings
+from app.utils import ReportWindow
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+class RedisBackend:
+    """Shared between workers; hit/miss counters are kept in Redis too."""
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "reports-cache:"):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        return _MISSING if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        # Encoded as the responses are, so a hit renders the same as a miss
+        self.client.set(self.prefix + key, responses.dumps(value), px=max(int(ttl * 1000), 1))
+
+    def incr(self, stat: str) -> None:
+        self.client.incr(f"{self.prefix}stats:{stat}")
+
+    def stats(self) -> dict:
+        hits, misses = self.client.mget(f"{self.prefix}stats:hits", f"{self.prefix}stats:misses")
+        return {"hits": int(hits or 0), "misses": int(misses or 0)}
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds: int, max_entries: int, redis_url: Optional[str] = None,
+                 enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.errors = 0
+        self.backend = MemoryBackend(max_entries)
+        if redis_url:
+            if redis is None:
+                print("REDIS_URL is set but the redis package is not installed, using the in-process cache")
+            else:
+                self.backend = RedisBackend(redis_url)
+
+    def bucket(self, now: Optional[float] = None) -> int:
+        return int((now or time.time()) // self.ttl_seconds)
+
+    def report_key(self, endpoint: str, window: ReportWindow) -> str:
+        # Date ranges are fixed windows; rolling ones move with the clock
+        if window.kind == "range":
+            return f"{endpoint}:{window.key}"
+        return f"{endpoint}:{window.key}:{self.bucket()}"
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await compute()
+
+        try:
+            value = await self._backend_call(self.backend.get, key)
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            self.errors += 1
+            return await compute()
+
+        if value is not _MISSING:
+            await self._backend_call(self._count, "hits")
+            return value
+
+        await self._backend_call(self._count, "misses")
+        value = await compute()
+        try:
+            await self._backend_call(self.backend.set, key, value,
+                                     self.ttl_seconds - time.time() % self.ttl_seconds)
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+            self.errors += 1
+        return value
+
+    async def _backend_call(self, method: Callable, *args):
+        # The in-process LRU answers immediately; Redis round trips go to a thread
+        if isinstance(self.backend, MemoryBackend):
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    def _count(self, stat: str) -> None:
+        try:
+            self.backend.incr(stat)
+        except Exception:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        try:
+            stats = self.backend.stats()
+        except Exception as e:
+            stats = {"hits": 0, "misses": 0, "error": str(e)}
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "backend": self.backend.name,
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+        })
+        return stats
+
+
+response_cache = ResponseCache(settings.CACHE_TTL_SECONDS, settings.CACHE_MAX_ENTRIES,
+                               settings.REDIS_URL, settings.CACHE_ENABLED)
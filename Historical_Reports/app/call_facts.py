@@ -0,0 +1,116 @@
+# call_facts.py
+"""One row per call, merged from the FreeSWITCH legs in cdr.
+
+A bridged call leaves an a-leg and a b-leg in cdr, and the a-leg names the
+b-leg in bleg_uuid. call_facts folds every b-leg into the row of its a-leg
+(call_uuid is the a-leg's uuid), so reports count calls rather than legs and
+scan one row per call.
+
+The table and rollup_watermarks come with migrations/003_call_facts.sql; the
+rollup job (``python -m app.rollups``) keeps the table up to date past the
+"call_facts" watermark. CALLS_SQL reads it for a window and merges the legs
+newer than the watermark on the fly, so reports never lag behind cdr.
+"""
+from sqlalchemy import text
+
+CALL_FACT_COLUMNS = ('call_uuid', 'timestamp', 'direction', 'cc_agent', 'cc_queue',
+                     'start_stamp', 'answer_stamp', 'end_stamp', 'duration', 'billsec', 'waitsec',
+                     'legs', 'bridged', 'wait_seconds', 'talk_seconds', 'outcome')
+
+# Legs of one call are written within this much of each other. Bounding the leg
+# lookups by it keeps them to a partition or two of cdr (see app/partitions.py).
+CALL_LEG_SPREAD = "interval '1 day'"
+
+LEG_COLUMNS = ('uuid', 'bleg_uuid', 'timestamp', 'direction', 'cc_agent', 'cc_queue',
+               'start_stamp', 'answer_stamp', 'end_stamp', 'duration', 'billsec', 'waitsec')
+
+# The calls with a leg matching {leg_filter} (on alias c), and every leg of them.
+# A leg named in another leg's bleg_uuid belongs to that leg's call; two legs naming
+# each other are one call under the lower uuid.
+CALL_LEGS_CTES = f"""
+    touched AS (
+        SELECT DISTINCT
+            COALESCE(a.uuid, c.uuid) AS call_uuid,
+            COALESCE(a.timestamp, c.timestamp) AS call_timestamp
+        FROM cdr c
+        LEFT JOIN cdr a ON a.bleg_uuid = c.uuid AND a.uuid <> c.uuid
+                       AND (c.bleg_uuid IS DISTINCT FROM a.uuid OR a.uuid < c.uuid)
+                       AND a.timestamp BETWEEN c.timestamp - {CALL_LEG_SPREAD} AND c.timestamp + {CALL_LEG_SPREAD}
+        WHERE {{leg_filter}}
+    ), roots AS (
+        SELECT {', '.join(f"r.{column}" for column in LEG_COLUMNS)}
+        FROM touched t
+        JOIN cdr r ON r.uuid = t.call_uuid AND r.timestamp = t.call_timestamp
+    ), legs AS (
+        SELECT uuid AS call_uuid, {', '.join(LEG_COLUMNS)}
+        FROM roots
+        UNION ALL
+        SELECT r.uuid, {', '.join(f"b.{column}" for column in LEG_COLUMNS)}
+        FROM roots r
+        JOIN cdr b ON b.uuid = r.bleg_uuid AND b.uuid <> r.uuid
+                  AND b.timestamp BETWEEN r.timestamp - {CALL_LEG_SPREAD} AND r.timestamp + {CALL_LEG_SPREAD}
+    )"""
+
+# Timestamp, direction, duration and waitsec are the a-leg's; agent and queue
+# fall back to the b-leg when the a-leg has none.
+CALL_FACTS_SELECT = """
+    SELECT
+        call_uuid,
+        MAX(timestamp) FILTER (WHERE uuid = call_uuid) AS timestamp,
+        MAX(direction) FILTER (WHERE uuid = call_uuid) AS direction,
+        COALESCE(MAX(cc_agent) FILTER (WHERE uuid = call_uuid), MAX(cc_agent)) AS cc_agent,
+        COALESCE(MAX(cc_queue) FILTER (WHERE uuid = call_uuid), MAX(cc_queue)) AS cc_queue,
+        MIN(start_stamp) AS start_stamp,
+        MIN(answer_stamp) AS answer_stamp,
+        MAX(end_stamp) AS end_stamp,
+        MAX(duration) FILTER (WHERE uuid = call_uuid) AS duration,
+        MAX(billsec) AS billsec,
+        MAX(waitsec) FILTER (WHERE uuid = call_uuid) AS waitsec,
+        COUNT(*) AS legs,
+        bool_or(bleg_uuid IS NOT NULL) AS bridged,
+        EXTRACT(EPOCH FROM (MIN(answer_stamp) - MIN(start_stamp))) AS wait_seconds,
+        EXTRACT(EPOCH FROM (MAX(end_stamp) - MIN(answer_stamp))) AS talk_seconds,
+        CASE
+            WHEN MIN(answer_stamp) IS NOT NULL THEN 'answered'
+            WHEN MAX(direction) FILTER (WHERE uuid = call_uuid) = 'outbound' THEN 'unanswered'
+            ELSE 'abandoned'
+        END AS outcome
+    FROM legs
+    GROUP BY call_uuid"""
+
+# Refresh job for [start_time, end_time) of cdr.timestamp. A b-leg written before its
+# a-leg is a call of its own until then; that row goes once the a-leg shows up.
+CALL_FACTS_REFRESH_QUERY = text(f"""
+    WITH {CALL_LEGS_CTES.format(leg_filter="c.timestamp >= :start_time AND c.timestamp < :end_time")},
+    superseded AS (
+        DELETE FROM call_facts f
+        USING legs
+        WHERE f.call_uuid = legs.uuid AND legs.uuid <> legs.call_uuid
+    )
+    INSERT INTO call_facts ({', '.join(CALL_FACT_COLUMNS)})
+    {CALL_FACTS_SELECT}
+    ON CONFLICT (call_uuid) DO UPDATE SET
+        {', '.join(f"{column} = EXCLUDED.{column}" for column in CALL_FACT_COLUMNS[1:])}
+""")
+
+# The calls of [start_time, end_time], for use as a subquery: call_facts up to its
+# watermark, legs past it merged here.
+CALLS_SQL = f"""
+    WITH facts_cutoff AS (
+        SELECT COALESCE(
+            (SELECT processed_until AT TIME ZONE 'UTC' FROM rollup_watermarks WHERE name = 'call_facts'),
+            '-infinity'::timestamp) AS until
+    ), {CALL_LEGS_CTES.format(
+        leg_filter="c.timestamp >= GREATEST(:start_time, (SELECT until FROM facts_cutoff))"
+                   " AND c.timestamp <= :end_time")}
+    SELECT {', '.join(CALL_FACT_COLUMNS)}
+    FROM call_facts
+    WHERE timestamp >= :start_time AND timestamp <= :end_time
+      AND timestamp < (SELECT until FROM facts_cutoff)
+    UNION ALL
+    SELECT {', '.join(CALL_FACT_COLUMNS)}
+    FROM ({CALL_FACTS_SELECT}
+    ) AS live
+    WHERE live.timestamp >= GREATEST(:start_time, (SELECT until FROM facts_cutoff))
+      AND live.timestamp <= :end_time
+"""
@@ -0,0 +1,120 @@
+# conditional.py
+"""Conditional GET for the polled report endpoints.
+
+Most polls during quiet periods get the same report back. Before running the
+metric queries, an endpoint reads a data watermark for its window: the first
+and last cdr timestamp in it, and the last historical_agents_metrics snapshot
+when agent states are reported. Both come off the timestamp indexes. The ETag
+hashes the watermark with the path, the query string and the body format, and
+a client sending it back in If-None-Match gets a 304 without the report being
+built.
+
+New legs are written with the latest timestamp and a rolling window drops its
+oldest rows first, so the first and last timestamp move whenever the calls in
+the window do. Agent state times run on to the end of a rolling window, so
+those reports also carry the response cache time bucket the window ends in:
+they match for the bucket, the time a cached copy of them is served for.
+
+The watermark is kept in the response cache for the same time bucket as the
+reports, so polls answered from the cache cost no database round trip; a tag
+is at most as stale as the cached report it stands for.
+
+A window whose watermark cannot be read gets no ETag and is served as before.
+"""
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import text
+
+from app import responses
+from app.cache import response_cache
+from app.config import settings
+from app.utils import ReportWindow
+from database import fetch_rows_async
+
+# Bumped whenever a report's payload changes shape, so old tags stop matching
+REPORT_FORMAT_VERSION = "1"
+
+CDR_WATERMARK_QUERY = text("""
+    SELECT MIN(timestamp), MAX(timestamp)
+    FROM cdr
+    WHERE timestamp >= :start_time AND timestamp <= :end_time
+""")
+
+AGENT_STATE_WATERMARK_QUERY = text("""
+    SELECT MAX(timestamp)
+    FROM historical_agents_metrics
+    WHERE timestamp >= :start_time AND timestamp <= :end_time
+""")
+
+
+def _isoformat(value) -> str:
+    return value.isoformat() if value is not None else "-"
+
+
+async def _watermark(window: ReportWindow, states: bool) -> List[str]:
+    # cdr.timestamp is naive UTC, historical_agents_metrics.timestamp is timestamptz
+    fetches = [fetch_rows_async(CDR_WATERMARK_QUERY, {'start_time': window.start_utc.replace(tzinfo=None),
+                                                      'end_time': window.end_utc.replace(tzinfo=None)})]
+    if states:
+        fetches.append(fetch_rows_async(AGENT_STATE_WATERMARK_QUERY, window.params))
+    results = await asyncio.gather(*fetches)
+    # Strings, so they come back the same from either cache backend
+    return [_isoformat(value) for rows in results for value in rows[0]]
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Whether an If-None-Match header names etag; weak comparison, as RFC 9110 asks for GETs."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+async def report_etag(request: Request, window: ReportWindow, states: bool = False) -> Optional[str]:
+    """The ETag of a report over window, or None when conditional GETs are off or it cannot be read.
+
+    states is set when the report includes the agent state groups.
+    """
+    if not settings.CONDITIONAL_GET_ENABLED:
+        return None
+
+    try:
+        watermark = await response_cache.get_or_compute_async(
+            response_cache.report_key("watermark:states" if states else "watermark", window),
+            lambda: _watermark(window, states))
+    except Exception as e:
+        print(f"Error fetching report watermark: {e}")
+        return None
+
+    parts = [REPORT_FORMAT_VERSION, request.url.path,
+             "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items())),
+             "msgpack" if settings.FAST_RESPONSES_ENABLED and responses.wants_msgpack(request) else "json"]
+    parts.extend(watermark)
+    if states and window.kind != "range":
+        parts.append(str(response_cache.bucket(window.end_utc.timestamp())))
+
+    digest = hashlib.blake2b("\n".join(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+async def conditional_report(request: Request, response: Response, window: ReportWindow,
+                             compute: Callable[[], Awaitable], states: bool = False):
+    """304 when the client's copy is current, otherwise the report from compute() with its ETag."""
+    etag = await report_etag(request, window, states)
+    if etag is None:
+        return responses.report_response(request, await compute())
+
+    if etag_matches(etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept"})
+
+    # Reaches the client through FastAPI when fast responses are off
+    response.headers["ETag"] = etag
+    return responses.report_response(request, await compute(), headers={"ETag": etag})
@@ -1,2093 +1,495 @@
-from fastapi import HTTPException
-from sqlalchemy import func, text
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from app import schemas
-from app.utils import seconds_to_hms
+import asyncio
 from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
 import pytz
-from typing import List, Union
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
 from sqlalchemy import text
-from typing import List, Dict
-
-
-#-------------------------------- metrics for 15 minutes time interval ---------------------->
-
-# Working with the cdr table. 
-def get_recent_agent_names_last_15_minutes(db: Session, user_time_zone: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-    default_tz = pytz.utc
-    now_utc = datetime.utcnow().replace(tzinfo=pytz.utc)
-    start_time_utc = now_utc - timedelta(minutes=15)
-
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {now_utc}")
 
-    query = text("""
-        SELECT DISTINCT cc_agent
-        FROM cdr
+from app import analytics, call_facts, querystats, rollups, series, singleflight, timeline, today
+from app.utils import ReportWindow, seconds_to_hms, select_metric_groups
+from database import fetch_rows_async
+
+
+#-------------------------------- agent metrics engine ---------------------->
+
+# Every per-agent call metric of a window comes out of this single pass over its calls
+# (one row per call, see app/call_facts.py). The columns are plain counts and sums so
+# that totals of adjacent windows can be added.
+AGENT_CALL_AGGREGATES = """
+        COUNT(*) FILTER (WHERE answer_stamp IS NOT NULL AND billsec > 0) AS calls_answered,
+        COUNT(*) FILTER (WHERE answer_stamp IS NULL OR billsec = 0) AS calls_missed,
+        COUNT(*) FILTER (WHERE answer_stamp IS NULL) AS unanswered_calls,
+        COUNT(*) FILTER (WHERE answer_stamp IS NOT NULL) AS contacts_handled,
+        COUNT(*) FILTER (WHERE answer_stamp IS NOT NULL AND end_stamp IS NOT NULL) AS talk_calls,
+        COALESCE(SUM(talk_seconds) FILTER (WHERE answer_stamp IS NOT NULL AND end_stamp IS NOT NULL), 0) AS talk_seconds
+"""
+
+AGENT_CALL_TOTALS_SELECT = f"""
+    SELECT
+        cc_agent,{AGENT_CALL_AGGREGATES}
+    FROM ({{calls}}) AS calls
+    WHERE cc_agent IS NOT NULL
+    GROUP BY cc_agent
+"""
+
+AGENT_CALL_TOTALS_QUERY = text(AGENT_CALL_TOTALS_SELECT.format(calls=call_facts.CALLS_SQL))
+
+AGENT_CALL_TOTAL_COLUMNS = ('calls_answered', 'calls_missed', 'unanswered_calls',
+                           'contacts_handled', 'talk_calls', 'talk_seconds')
+
+# Status based metrics from the historical_agents_metrics snapshots, for the edge of a
+# window the interval table does not cover yet. Each snapshot lasts until the next one,
+# the latest until the end of the window. Whole seconds, like the interval totals.
+# The latest snapshot of each agent before the window (within a day) is carried in as
+# of its start, so the window is counted from its first second, as the interval table
+# counts it, and a window cut at the watermark adds up to the uncut one.
+AGENT_STATE_PERIODS_SQL = """
+    WITH snapshots AS (
+        SELECT name, status, state, timestamp, 1 AS seen
+        FROM {snapshots}
         WHERE timestamp >= :start_time AND timestamp <= :end_time
-          AND cc_agent IS NOT NULL
-    """)
-    
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} records from the database.")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-
-    agent_names = [row[0] for row in data]  # Get the agent names from the fetched data
-
-    print("Agent names:", agent_names)  # Check what names were added
-    return agent_names
-
-# Working with the cdr table.
-def fetch_agent_answer_rate_last_15_minutes(db: Session, user_time_zone: str) -> list:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # SQL query to calculate the answer rate based on the `timestamp` column
-    query = text("""  
-        WITH agent_call_data AS (
-            SELECT
-                cc_agent AS agent_name,
-                COUNT(CASE WHEN answer_stamp IS NOT NULL AND billsec > 0 THEN 1 END) AS calls_answered,
-                COUNT(CASE WHEN answer_stamp IS NULL OR billsec = 0 THEN 1 END) AS no_answer_count
-            FROM cdr
-            WHERE timestamp >= :start_time
-            AND timestamp <= :end_time
-            AND cc_agent IS NOT NULL  -- Filter out records without an agent
-            GROUP BY cc_agent
-        )
+        UNION ALL
+        (SELECT DISTINCT ON (name) name, status, state, CAST(:start_time AS TIMESTAMPTZ), 0
+         FROM {snapshots}
+         WHERE timestamp < :start_time AND timestamp >= CAST(:start_time AS TIMESTAMPTZ) - INTERVAL '1 day'
+         ORDER BY name, timestamp DESC)
+    ), status_periods AS (
         SELECT
-            agent_name,
-            ROUND(
-                (SUM(calls_answered) * 100.0 / 
-                 CASE
-                    WHEN (SUM(no_answer_count) + SUM(calls_answered)) = 0 THEN 1
-                    ELSE (SUM(no_answer_count) + SUM(calls_answered))
-                 END
-                )
-            ) AS agent_answer_rate
-        FROM agent_call_data
-        GROUP BY agent_name;
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    return results
-
-# Working with the cdr table.
-def fetch_agent_non_response_last_15_minutes(
-        db: Session, user_time_zone: str) -> List[schemas.AgentNonResponse]:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-
-    # Calculate the start time as 15 minutes before the current time in the user's time zone
-    start_time_user = now_user - timedelta(minutes=15)
-
-    # Convert to UTC for the query
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    # SQL query to sum non-answered calls for each agent in the last 15 minutes
-    query = text("""  
+            name,
+            status,
+            state,
+            timestamp,
+            -- A snapshot taken at the start itself replaces the carried one
+            LEAD(timestamp) OVER (PARTITION BY name ORDER BY timestamp, seen) AS next_timestamp
+        FROM snapshots
+    )
+"""
+
+AGENT_STATE_TOTALS_SELECT = AGENT_STATE_PERIODS_SQL + """
+    SELECT
+        name,
+        ROUND(SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, :end_time) - timestamp)))
+            FILTER (WHERE status = 'Available'))::bigint AS online_seconds,
+        ROUND(SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, :end_time) - timestamp)))
+            FILTER (WHERE status = 'On Break'))::bigint AS break_seconds,
+        ROUND(SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, :end_time) - timestamp)))
+            FILTER (WHERE status = 'Available' AND state = 'In a queue call'))::bigint AS occupancy_seconds
+    FROM status_periods
+    WHERE name IS NOT NULL
+    GROUP BY name
+"""
+
+AGENT_STATE_TOTALS_QUERY = text(AGENT_STATE_TOTALS_SELECT.format(snapshots="historical_agents_metrics"))
+
+AGENT_STATE_TOTAL_COLUMNS = ('online_seconds', 'break_seconds', 'occupancy_seconds')
+
+# agent_state_intervals collapses the snapshots into one row per stretch of the same
+# status and state. The refresh job feeds it the new snapshots of each chunk; the open
+# interval of every agent goes back in with them, so it is extended or closed by the
+# first snapshot in another status or state.
+AGENT_STATE_INTERVALS_QUERY = rollups.upsert_query(
+    "agent_state_intervals", ("name", "started_at"), ("status", "state", "ended_at", "last_seen_at"), """
+    WITH snapshots AS (
+        -- One snapshot per agent and instant, or two intervals could start together
+        (SELECT DISTINCT ON (name, timestamp) name, status, state, timestamp
+         FROM historical_agents_metrics
+         WHERE timestamp >= :start_time AND timestamp < :end_time
+           AND name IS NOT NULL
+         ORDER BY name, timestamp, agent_id)
+        UNION ALL
+        SELECT name, status, state, unnest(ARRAY[started_at, last_seen_at])
+        FROM agent_state_intervals
+        WHERE ended_at IS NULL
+    ), changes AS (
         SELECT
-            cc_agent AS name,
-            COUNT(*) AS no_answer_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time AND
-            timestamp <= :end_time AND
-            answer_stamp IS NULL
-        GROUP BY
-            cc_agent;
-    """)
-
-    # Execute the query
-    result = db.execute(query, {'start_time': start_time_utc, 'end_time': now_utc}).fetchall()
-
-    # Process the data, ensuring no None values for name, and divide the count by 3
-    processed_result = [
-        schemas.AgentNonResponse( 
-            name=row[0],  # Agent name
-            no_answer_count=(row[1] // 3) if row[1] is not None else 0  # Count of non-responses divided by 3
-        ) for row in result if row[0] is not None  # Filter out None names
-    ]
-
-    # Ensure all agents are represented, even if they have 0 non-responses
-    if not processed_result:
-        return [schemas.AgentNonResponse(name="No Agents", no_answer_count=0)]
-
-    return processed_result
-
-# Working with the cdr table..
-def fetch_agent_contacts_handled_last_15_minutes(db: Session, user_time_zone: str) -> List[Dict[str, str]]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Get current time in user's time zone and convert it to UTC
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=15)
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-
-        # SQL query to track and sum the count of answered calls for each agent in the last 15 minutes from the cdr table
-        query = text("""
-            SELECT 
-                cc_agent AS name, 
-                COUNT(answer_stamp) AS total_calls_answered
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time
-                AND answer_stamp IS NOT NULL
-                AND cc_agent IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the SQL query using UTC for querying
-        result = db.execute(query, {
-            'start_time': start_time_utc
-        }).fetchall()
-
-        # Format the results, ensuring "0" is returned when the count is zero
-        formatted_result = [
-            {
-                "name": row[0],  # Access tuple elements by index
-                "contacts_handled": row[1]  # Directly use the integer result
-            } for row in result
-        ]
-
-        # Handle case where no agents are returned
-        if not formatted_result:
-            return [{"name": "No Agents", "contacts_handled": 0}]  # Return a default entry
-
-        return formatted_result
+            *,
+            CASE WHEN (status, state) IS NOT DISTINCT FROM (LAG(status) OVER w, LAG(state) OVER w)
+                 THEN 0 ELSE 1 END AS changed
+        FROM snapshots
+        WINDOW w AS (PARTITION BY name ORDER BY timestamp)
+    ), numbered AS (
+        SELECT
+            *,
+            SUM(changed) OVER (PARTITION BY name ORDER BY timestamp ROWS UNBOUNDED PRECEDING) AS interval_no
+        FROM changes
+    )
+    SELECT
+        name,
+        MIN(timestamp) AS started_at,
+        status,
+        state,
+        LEAD(MIN(timestamp)) OVER (PARTITION BY name ORDER BY MIN(timestamp)) AS ended_at,
+        MAX(timestamp) AS last_seen_at
+    FROM numbered
+    GROUP BY name, interval_no, status, state
+""")
+
+# No snapshot before the watermark has ended an open interval, so it lasts at least
+# until then, and the table is only read up to the watermark (rollups.split_at_watermark):
+# its span runs on, and it is counted to the end of the window. Counting it only to its
+# latest snapshot would drop the time until the first snapshot the raw edge starts from.
+AGENT_STATE_INTERVAL_SPAN_SQL = "tstzrange(started_at, ended_at, '[)')"
+AGENT_STATE_INTERVAL_END_SQL = "LEAST(COALESCE(ended_at, :end_time), :end_time)"
+AGENT_STATE_INTERVAL_SECONDS_SQL = (f"EXTRACT(EPOCH FROM ({AGENT_STATE_INTERVAL_END_SQL}"
+                                    " - GREATEST(started_at, :start_time)))")
+
+# The time each interval overlaps [start_time, end_time), through the GiST index on its span
+AGENT_STATE_INTERVAL_TOTALS_QUERY = text(f"""
+    SELECT
+        name,
+        ROUND(SUM({AGENT_STATE_INTERVAL_SECONDS_SQL})
+            FILTER (WHERE status = 'Available'))::bigint AS online_seconds,
+        ROUND(SUM({AGENT_STATE_INTERVAL_SECONDS_SQL})
+            FILTER (WHERE status = 'On Break'))::bigint AS break_seconds,
+        ROUND(SUM({AGENT_STATE_INTERVAL_SECONDS_SQL})
+            FILTER (WHERE status = 'Available' AND state = 'In a queue call'))::bigint AS occupancy_seconds
+    FROM agent_state_intervals
+    WHERE {AGENT_STATE_INTERVAL_SPAN_SQL} && tstzrange(:start_time, :end_time, '[)')
+    GROUP BY name
+""")
+
+# Every Available stretch overlapping [start_time, end_time), as epoch seconds for the
+# occupancy timeline (see app/timeline.py)
+AGENT_STATE_SPANS_QUERY = text(f"""
+    SELECT
+        state = 'In a queue call',
+        EXTRACT(EPOCH FROM started_at)::float8,
+        EXTRACT(EPOCH FROM {AGENT_STATE_INTERVAL_END_SQL})::float8
+    FROM agent_state_intervals
+    WHERE status = 'Available'
+      AND {AGENT_STATE_INTERVAL_SPAN_SQL} && tstzrange(:start_time, :end_time, '[)')
+""")
+
+# The same spans from the snapshots, for the part of a window past the watermark
+AGENT_STATE_SNAPSHOT_SPANS_QUERY = text((AGENT_STATE_PERIODS_SQL + """
+    SELECT
+        state = 'In a queue call',
+        EXTRACT(EPOCH FROM timestamp)::float8,
+        EXTRACT(EPOCH FROM COALESCE(next_timestamp, :end_time))::float8
+    FROM status_periods
+    WHERE status = 'Available' AND name IS NOT NULL
+""").format(snapshots="historical_agents_metrics"))
+
+# 15 minute rollups of the call totals, see app/rollups.py
+AGENT_CALL_ROLLUP_QUERY = rollups.upsert_query(
+    "agent_call_rollup_15m", ("bucket_start", "cc_agent"), AGENT_CALL_TOTAL_COLUMNS, f"""
+    SELECT
+        {rollups.CDR_BUCKET_SQL} AS bucket_start,
+        cc_agent,{AGENT_CALL_AGGREGATES}
+    FROM call_facts
+    WHERE timestamp >= :start_time AND timestamp < :end_time
+      AND cc_agent IS NOT NULL
+    GROUP BY 1, 2
+""")
+
+AGENT_CALL_ROLLUP_TOTALS_QUERY = rollups.sum_query(
+    "agent_call_rollup_15m", "cc_agent", AGENT_CALL_TOTAL_COLUMNS)
+
+# Per-interval call totals for the series endpoint, see app/series.py
+AGENT_CALL_SERIES_QUERY = text(f"""
+    SELECT
+        {series.BUCKET_SQL.format(column="timestamp")} AS interval_start,
+        cc_agent,{AGENT_CALL_AGGREGATES}
+    FROM ({call_facts.CALLS_SQL}) AS calls
+    WHERE cc_agent IS NOT NULL
+    GROUP BY 1, 2
+""")
+
+AGENT_CALL_ROLLUP_SERIES_QUERY = series.rollup_series_query(
+    "agent_call_rollup_15m", "cc_agent", AGENT_CALL_TOTAL_COLUMNS)
+
+# The same totals over the Parquet snapshot of the closed days, see app/analytics.py
+AGENT_CALL_SNAPSHOT_QUERY = analytics.query(AGENT_CALL_TOTALS_SELECT.format(calls=analytics.CALLS_SQL))
+AGENT_STATE_SNAPSHOT_QUERY = analytics.query(AGENT_STATE_TOTALS_SELECT.format(snapshots=analytics.AGENT_STATES_SQL))
+
+# The interval table is cheap for any window, the rolling ones included
+AGENT_STATE_INTERVAL_WINDOW_KINDS = ("15m", "30m", "today", "range")
+
+# Metric groups of schemas.AgentMetricsResponse, by the totals they are built from
+AGENT_CALL_GROUPS = ("recent_agents", "answer_rates", "non_responses", "on_contact_times",
+                     "contacts_handled", "after_contact_work_time", "agent_interaction_time")
+AGENT_STATE_GROUPS = ("online_times", "non_productive_times", "occupancy_times")
+AGENT_METRIC_GROUPS = AGENT_CALL_GROUPS + AGENT_STATE_GROUPS
+
+# Columns of the CSV and XLSX exports, one row per agent
+AGENT_EXPORT_FIELDS = ("name", "contacts_handled", "calls_answered", "calls_missed", "unanswered_calls",
+                       "agent_answer_rate", "talk_time", "average_talk_time",
+                       "online_time", "non_productive_time", "occupancy_time")
+
+# What a group not asked for comes back as
+EMPTY_AGENT_GROUPS = {
+    "recent_agents": {"agents": []},
+    "non_responses": {"agents": []},
+    "on_contact_times": {"status": "success", "data": [], "message": ""},
+    "online_times": {"status": "success", "data": [], "message": ""},
+    **{group: {"status": "success", "data": []}
+       for group in ("answer_rates", "non_productive_times", "occupancy_times", "contacts_handled",
+                     "after_contact_work_time", "agent_interaction_time")},
+}
+
+
+def reports_agent_states(fields: Optional[Tuple[str, ...]]) -> bool:
+    """Whether a report of these fields (all when None) includes the snapshot based groups."""
+    return fields is None or bool(set(fields) & set(AGENT_STATE_GROUPS))
+
+
+NO_DATA_MESSAGES = {
+    "15m": "No data available for the last 15 minutes.",
+    "30m": "No data available for the last 30 minutes.",
+    "today": "No data available today.",
+}
+
+
+# Working with the calls.
+def agent_call_totals_from_rows(rows) -> Dict[str, dict]:
+    totals = {}
+    for row in rows:
+        if not row[0]:
+            continue
+        totals[row[0]] = {
+            column: float(value or 0) if column == 'talk_seconds' else int(value or 0)
+            for column, value in zip(AGENT_CALL_TOTAL_COLUMNS, row[1:])
+        }
+    return totals
 
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table..
-def fetch_agent_on_contact_time_last_15_minutes(db: Session, user_time_zone: str) -> list:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-    start_time_user = now_user - timedelta(minutes=15)
-
-    # Convert user's time to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    # Query to fetch all relevant data within the time frame from the CDR table
-    query = text("""
-        SELECT 
-            cc_agent, 
-            end_stamp, 
-            answer_stamp,
-            timestamp
-        FROM 
-            cdr
-        WHERE 
-            timestamp >= :start_time 
-            AND timestamp <= :end_time
-        ORDER BY timestamp
-    """)
-
-    # Execute the query
-    result = db.execute(query, {
-        'start_time': start_time_utc,
-        'end_time': now_utc
-    }).fetchall()
-
-    formatted_result = []
-    total_contact_time = {}  # Dictionary to store total contact time per agent
-
-    for row in result:
-        agent_name = row[0]  # cc_agent
-        end_stamp = row[1]   # end_stamp
-        answer_stamp = row[2] # answer_stamp
-        call_timestamp = row[3]  # timestamp
-
-        # Ensure that we only process records with a valid agent name and non-null stamps
-        if agent_name and end_stamp and answer_stamp:
-            # Calculate the contact duration as the difference between end_stamp and answer_stamp
-            contact_duration = (end_stamp - answer_stamp).total_seconds()
-
-            # Convert call's timestamp to the user's local time for comparison
-            call_timestamp_local = call_timestamp.astimezone(user_tz)
-
-            # Check if the call falls within the last 15 minutes in the user's local time
-            if start_time_user <= call_timestamp_local <= now_user:
-                # Accumulate contact time for each agent
-                if agent_name not in total_contact_time:
-                    total_contact_time[agent_name] = 0  # Initialize if not already in dict
-                total_contact_time[agent_name] += contact_duration  # Sum up the durations
-
-    # Format the results for output
-    for agent_name, total_seconds in total_contact_time.items():
-        # Convert total seconds to timedelta for formatting
-        delta = timedelta(seconds=total_seconds)
-        formatted_time = str(delta).split()[-1]  # Get the time part
-
-        formatted_result.append({
-            "name": agent_name,
-            "total_on_contact_time_seconds": formatted_time  # Format total time as a string
-        })
-
-    return formatted_result
 
 # working with historical agent's table.
-def fetch_agent_online_time_last_15_minutes(db: Session, user_time_zone: str) -> List[schemas.AgentOnlineTime]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=15)
-
-        # Convert user's local times to UTC for querying
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)  # Current UTC time
-
-        # SQL query to calculate online time for each "Available" period
-        query = text("""
-            WITH available_periods AS (
-                SELECT 
-                    name,
-                    timestamp AS available_timestamp,
-                    LEAD(timestamp) OVER (PARTITION BY name ORDER BY timestamp) AS next_timestamp,
-                    status
-                FROM historical_agents_metrics
-                WHERE timestamp >= :start_time AND timestamp <= :end_time
-                ORDER BY name, timestamp
-            )
-            SELECT 
-                name,
-                SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, now()) - available_timestamp))) AS online_time
-            FROM available_periods
-            WHERE status = 'Available'
-            GROUP BY name;
-        """)
-
-        # Fetch the results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Format results
-        formatted_result = []
-        for row in result:
-            name, total_online_time = row
-            # Convert total_online_time to HH:MM:SS without microseconds
-            formatted_result.append({
-                "name": name,
-                "online_time": seconds_to_hms(int(total_online_time))  # Ensure only seconds are used
-            })
-
-        return formatted_result
-    except Exception as e:
-        print(f"Error in fetch_agent_online_time_last_15_minutes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# working from the historical agent's table
-def fetch_non_productive_time_last_15_minutes(db: Session, user_time_zone: str) -> list:
-    try:
-        # Convert the user's timezone to UTC
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=15)
-
-        # Convert to UTC
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)
-
-        # SQL query to fetch all status records (including "On break" statuses)
-        query = text("""
-            WITH status_changes AS (
-                SELECT 
-                    ham.name,
-                    ham.status,
-                    ham.timestamp,
-                    LEAD(ham.status) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_status,
-                    LEAD(ham.timestamp) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_timestamp
-                FROM historical_agents_metrics ham
-                WHERE ham.timestamp >= :start_time 
-                  AND ham.timestamp <= :end_time
-            )
-            SELECT 
-                csp.name,
-                csp.status,
-                csp.timestamp,
-                csp.next_status,
-                csp.next_timestamp
-            FROM status_changes csp
-            WHERE csp.status = 'On Break'
-              AND csp.next_status != 'On Break';
-        """)
-
-        # Fetch results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Calculate the non-productive time for each agent
-        formatted_result = []
-        for row in result:
-            name, status, on_break_timestamp, next_status, next_timestamp = row
-
-            # Calculate non-productive time in seconds
-            non_productive_time_seconds = (next_timestamp - on_break_timestamp).total_seconds()
-
-            # Convert seconds to HH:MM:SS format
-            formatted_result.append({
-                "name": name,
-                "non_productive_time_seconds": seconds_to_hms(int(non_productive_time_seconds)) if non_productive_time_seconds else "00:00:00"
-            })
-
-        # Group results by agent and sum non-productive times
-        agent_times = {}
-        for entry in formatted_result:
-            name = entry["name"]
-            if name in agent_times:
-                # Sum non-productive times for the same agent
-                current_time = agent_times[name]
-                agent_times[name] = seconds_to_hms(int(current_time.split(":")[0]) * 3600 + int(current_time.split(":")[1]) * 60 + int(current_time.split(":")[2]) + int(entry["non_productive_time_seconds"].split(":")[2]))
-            else:
-                agent_times[name] = entry["non_productive_time_seconds"]
-
-        # Return the result in the desired format
-        return [{"name": name, "non_productive_time_seconds": time} for name, time in agent_times.items()]
-
-    except Exception as e:
-        print(f"Error in fetch_non_productive_time_last_15_minutes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_last_15_minutes(
-        db: Session, user_time_zone: str) -> List[Dict[str, any]]:
+def agent_state_totals_from_rows(rows) -> Dict[str, dict]:
+    # None marks "no such periods" so that agents without any are left out of the lists
+    return {
+        row[0]: {
+            column: int(value) if value is not None else None
+            for column, value in zip(AGENT_STATE_TOTAL_COLUMNS, row[1:])
+        }
+        for row in rows
+    }
+
+
+# Since-today call totals, topped up with the calls of each poll (see app/today.py)
+agent_call_today = today.TodayAggregator(
+    "agent_call_15m", AGENT_CALL_TOTALS_QUERY, AGENT_CALL_ROLLUP_TOTALS_QUERY, agent_call_totals_from_rows,
+    naive_utc=True)
+
+
+async def fetch_agent_totals_async(window: ReportWindow,
+                                   fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Dict[str, dict]]:
+    """Per-agent "calls" and "states" totals of a window, each fetched only when fields need it."""
+    fields = set(fields or AGENT_METRIC_GROUPS)
+    fetches = {}
     try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=15)
-
-        # Convert user's time to UTC for querying
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)
-
-        # SQL query to fetch answer_stamp and end_stamp from cdr table
-        query = text("""
-            SELECT 
-                cc_agent,
-                SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_acw_duration,
-                COUNT(*) AS total_contacts
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time 
-                AND timestamp <= :end_time 
-                AND end_stamp IS NOT NULL
-                AND answer_stamp IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the query
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Format the results
-        formatted_result = []
-        for row in result:
-            agent_name = row[0]  # Agent's name
-
-            # Skip if agent_name is None
-            if agent_name is None:
-                continue
-
-            total_acw_duration = row[1] or 0  # Total ACW duration in seconds
-            total_contacts = row[2] or 0  # Total contacts handled
-
-            # Calculate average after contact work time
-            if total_contacts > 0:
-                avg_after_contact_work_time = total_acw_duration / total_contacts
+        if fields & set(AGENT_CALL_GROUPS):
+            if today.enabled_for(window):
+                fetches["calls"] = agent_call_today.totals(window)
             else:
-                avg_after_contact_work_time = 0
-
-            # Append result with formatted time
-            formatted_result.append({
-                "name": agent_name,
-                "average_after_contact_work_time_seconds": seconds_to_hms(int(avg_after_contact_work_time)) if avg_after_contact_work_time > 0 else "00:00:00"
-            })
-
-        return formatted_result
-
-    except Exception as e:
-        print(f"Error in fetch_average_after_contact_work_time_last_15_minutes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_last_15_minutes(db: Session, user_time_zone: str) -> List[schemas.AverageAgentInteractionTimeResponse]:
-    # Get the user's timezone
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-    start_time_user = now_user - timedelta(minutes=15)
-
-    # Convert user's time to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    print("Start Time (UTC):", start_time_utc)
-    print("Now Time (UTC):", now_utc)
-
-    # SQL query to calculate total interaction time and count for each agent, only where required fields are not null
-    query = text("""
-        SELECT
-            cc_agent AS name,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,
-            COUNT(uuid) AS call_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time
-            AND answer_stamp IS NOT NULL
-            AND end_stamp IS NOT NULL
-            AND cc_agent IS NOT NULL
-        GROUP BY
-            cc_agent;
-    """)
-
-    try:
-        # Execute the query
-        result = db.execute(query, {'start_time': start_time_utc}).fetchall()
-        print("Query Result:", result)  # Log the raw query results
-
-        processed_result = []
-        for row in result:
-            agent_name = row[0]  # Accessing the agent name
-            total_interaction_time = row[1]  # Total interaction time in seconds
-            call_count = row[2]  # Count of calls answered
-
-            # Calculate the average interaction time in seconds
-            average_interaction_time = total_interaction_time / call_count if call_count > 0 else 0
-
-            # Create response object, converting seconds to HH:MM:SS format
-            if agent_name:  # Ensure agent_name is a valid string before appending
-                processed_result.append(
-                    schemas.AverageAgentInteractionTimeResponse(
-                        name=str(agent_name),
-                        average_agent_interaction_time_seconds=seconds_to_hms(int(average_interaction_time))
-                    )
-                )
-
-        return processed_result
-
-    except Exception as e:
-        print(f"Error fetching average agent interaction time: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-
-#-------------------------------- metrics for 30 minutes time interval ---------------------->
-
-# Working with the cdr table.
-def get_recent_agent_names_last_30_minutes(db: Session, user_time_zone: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-    default_tz = pytz.utc
-    now_utc = datetime.utcnow().replace(tzinfo=pytz.utc)
-    start_time_utc = now_utc - timedelta(minutes=30)
-
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {now_utc}")
-
-    query = text("""
-        SELECT DISTINCT cc_agent
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-          AND cc_agent IS NOT NULL
-    """)
-    
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} records from the database.")
+                fetches["calls"] = analytics.fetch_window_totals_async(
+                    "calls", AGENT_CALL_SNAPSHOT_QUERY, window, agent_call_totals_from_rows,
+                    lambda start_time, end_time: rollups.fetch_window_totals_async(
+                        "agent_call_15m", window.kind, start_time, end_time,
+                        AGENT_CALL_TOTALS_QUERY, AGENT_CALL_ROLLUP_TOTALS_QUERY, agent_call_totals_from_rows,
+                        naive_utc=True))
+        if fields & set(AGENT_STATE_GROUPS):
+            fetches["states"] = analytics.fetch_window_totals_async(
+                "agent_states", AGENT_STATE_SNAPSHOT_QUERY, window, agent_state_totals_from_rows,
+                lambda start_time, end_time: rollups.fetch_window_totals_async(
+                    "agent_state_intervals", window.kind, start_time, end_time,
+                    AGENT_STATE_TOTALS_QUERY, AGENT_STATE_INTERVAL_TOTALS_QUERY, agent_state_totals_from_rows,
+                    plan=rollups.split_at_watermark, kinds=AGENT_STATE_INTERVAL_WINDOW_KINDS))
+        return dict(zip(fetches, await asyncio.gather(*fetches.values())))
     except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-
-    agent_names = [row[0] for row in data]  # Get the agent names from the fetched data
-
-    print("Agent names:", agent_names)  # Check what names were added
-    return agent_names
-
-# Working with the cdr table.
-def fetch_agent_answer_rate_last_30_minutes(db: Session, user_time_zone: str) -> list:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # SQL query to calculate the answer rate based on the `timestamp` column
-    query = text("""  
-        WITH agent_call_data AS (
-            SELECT
-                cc_agent AS agent_name,
-                COUNT(CASE WHEN answer_stamp IS NOT NULL AND billsec > 0 THEN 1 END) AS calls_answered,
-                COUNT(CASE WHEN answer_stamp IS NULL OR billsec = 0 THEN 1 END) AS no_answer_count
-            FROM cdr
-            WHERE timestamp >= :start_time
-            AND timestamp <= :end_time
-            AND cc_agent IS NOT NULL  -- Filter out records without an agent
-            GROUP BY cc_agent
-        )
-        SELECT
-            agent_name,
-            ROUND(
-                (SUM(calls_answered) * 100.0 / 
-                 CASE
-                    WHEN (SUM(no_answer_count) + SUM(calls_answered)) = 0 THEN 1
-                    ELSE (SUM(no_answer_count) + SUM(calls_answered))
-                 END
-                )
-            ) AS agent_answer_rate
-        FROM agent_call_data
-        GROUP BY agent_name;
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    return results
-
-# Working with the cdr table.
-def fetch_agent_non_response_last_30_minutes(
-        db: Session, user_time_zone: str) -> List[schemas.AgentNonResponse]:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-
-    # Calculate the start time as 30 minutes before the current time in the user's time zone
-    start_time_user = now_user - timedelta(minutes=30)
-
-    # Convert to UTC for the query
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    # SQL query to sum non-answered calls for each agent in the last 15 minutes
-    query = text("""  
-        SELECT
-            cc_agent AS name,
-            COUNT(*) AS no_answer_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time AND
-            timestamp <= :end_time AND
-            answer_stamp IS NULL
-        GROUP BY
-            cc_agent;
-    """)
-
-    # Execute the query
-    result = db.execute(query, {'start_time': start_time_utc, 'end_time': now_utc}).fetchall()
-
-    # Process the data, ensuring no None values for name, and divide the count by 3
-    processed_result = [
-        schemas.AgentNonResponse(
-            name=row[0],  # Agent name
-            no_answer_count=(row[1] // 3) if row[1] is not None else 0  # Count of non-responses divided by 3
-        ) for row in result if row[0] is not None  # Filter out None names
-    ]
+        print(f"Error in fetch_agent_totals_async ({window.kind}): {e}")
+        raise
 
-    # Ensure all agents are represented, even if they have 0 non-responses
-    if not processed_result:
-        return [schemas.AgentNonResponse(name="No Agents", no_answer_count=0)]
-
-    return processed_result
-
-# working from the historical agent's table
-def fetch_agent_on_contact_time_last_30_minutes(db: Session, user_time_zone: str) -> list:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-    start_time_user = now_user - timedelta(minutes=30)
-
-    # Convert user's time to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    # Query to fetch all relevant data within the time frame from the CDR table
-    query = text("""
-        SELECT 
-            cc_agent, 
-            end_stamp, 
-            answer_stamp,
-            timestamp
-        FROM 
-            cdr
-        WHERE 
-            timestamp >= :start_time 
-            AND timestamp <= :end_time
-        ORDER BY timestamp
-    """)
-
-    # Execute the query
-    result = db.execute(query, {
-        'start_time': start_time_utc,
-        'end_time': now_utc
-    }).fetchall()
-
-    formatted_result = []
-    total_contact_time = {}  # Dictionary to store total contact time per agent
-
-    for row in result:
-        agent_name = row[0]  # cc_agent
-        end_stamp = row[1]   # end_stamp
-        answer_stamp = row[2] # answer_stamp
-        call_timestamp = row[3]  # timestamp
-
-        # Ensure that we only process records with a valid agent name and non-null stamps
-        if agent_name and end_stamp and answer_stamp:
-            # Calculate the contact duration as the difference between end_stamp and answer_stamp
-            contact_duration = (end_stamp - answer_stamp).total_seconds()
-
-            # Convert call's timestamp to the user's local time for comparison
-            call_timestamp_local = call_timestamp.astimezone(user_tz)
-
-            # Check if the call falls within the last 15 minutes in the user's local time
-            if start_time_user <= call_timestamp_local <= now_user:
-                # Accumulate contact time for each agent
-                if agent_name not in total_contact_time:
-                    total_contact_time[agent_name] = 0  # Initialize if not already in dict
-                total_contact_time[agent_name] += contact_duration  # Sum up the durations
-
-    # Format the results for output
-    for agent_name, total_seconds in total_contact_time.items():
-        # Convert total seconds to timedelta for formatting
-        delta = timedelta(seconds=total_seconds)
-        formatted_time = str(delta).split()[-1]  # Get the time part
-
-        formatted_result.append({
-            "name": agent_name,
-            "total_on_contact_time_seconds": formatted_time  # Format total time as a string
-        })
-
-    return formatted_result
-
-# Working with the cdr table.
-def fetch_agent_online_time_last_30_minutes(db: Session, user_time_zone: str) -> List[schemas.AgentOnlineTime]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=30)
-
-        # Convert user's local times to UTC for querying
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)  # Current UTC time
-
-        # SQL query to calculate online time for each "Available" period
-        query = text("""
-            WITH available_periods AS (
-                SELECT 
-                    name,
-                    timestamp AS available_timestamp,
-                    LEAD(timestamp) OVER (PARTITION BY name ORDER BY timestamp) AS next_timestamp,
-                    status
-                FROM historical_agents_metrics
-                WHERE timestamp >= :start_time AND timestamp <= :end_time
-                ORDER BY name, timestamp
-            )
-            SELECT 
-                name,
-                SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, now()) - available_timestamp))) AS online_time
-            FROM available_periods
-            WHERE status = 'Available'
-            GROUP BY name;
-        """)
-
-        # Fetch the results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Format results
-        formatted_result = []
-        for row in result:
-            name, total_online_time = row
-            # Convert total_online_time to HH:MM:SS without microseconds
-            formatted_result.append({
-                "name": name,
-                "online_time": seconds_to_hms(int(total_online_time))  # Ensure only seconds are used
-            })
-
-        return formatted_result
-    except Exception as e:
-        print(f"Error in fetch_agent_online_time_last_15_minutes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
 
-# working from the historical agent's table.
-def fetch_non_productive_time_last_30_minutes(db: Session, user_time_zone: str) -> list:
-    try:
-        # Convert the user's timezone to UTC
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=30)
-
-        # Convert to UTC
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)
-
-        # SQL query to fetch all status records (including "On break" statuses)
-        query = text("""
-            WITH status_changes AS (
-                SELECT 
-                    ham.name,
-                    ham.status,
-                    ham.timestamp,
-                    LEAD(ham.status) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_status,
-                    LEAD(ham.timestamp) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_timestamp
-                FROM historical_agents_metrics ham
-                WHERE ham.timestamp >= :start_time 
-                  AND ham.timestamp <= :end_time
-            )
-            SELECT 
-                csp.name,
-                csp.status,
-                csp.timestamp,
-                csp.next_status,
-                csp.next_timestamp
-            FROM status_changes csp
-            WHERE csp.status = 'On Break'
-              AND csp.next_status != 'On Break';
-        """)
-
-        # Fetch results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Calculate the non-productive time for each agent
-        formatted_result = []
-        for row in result:
-            name, status, on_break_timestamp, next_status, next_timestamp = row
-
-            # Calculate non-productive time in seconds
-            non_productive_time_seconds = (next_timestamp - on_break_timestamp).total_seconds()
-
-            # Convert seconds to HH:MM:SS format
-            formatted_result.append({
-                "name": name,
-                "non_productive_time_seconds": seconds_to_hms(int(non_productive_time_seconds)) if non_productive_time_seconds else "00:00:00"
-            })
-
-        # Group results by agent and sum non-productive times
-        agent_times = {}
-        for entry in formatted_result:
-            name = entry["name"]
-            if name in agent_times:
-                # Sum non-productive times for the same agent
-                current_time = agent_times[name]
-                agent_times[name] = seconds_to_hms(int(current_time.split(":")[0]) * 3600 + int(current_time.split(":")[1]) * 60 + int(current_time.split(":")[2]) + int(entry["non_productive_time_seconds"].split(":")[2]))
-            else:
-                agent_times[name] = entry["non_productive_time_seconds"]
+@singleflight.coalesce_async("agent-metrics")
+@querystats.attributed
+async def fetch_agent_metrics_async(window: ReportWindow, fields: Optional[Tuple[str, ...]] = None) -> dict:
+    """Per-agent metrics of a window, with the call and state queries running concurrently.
 
-        # Return the result in the desired format
-        return [{"name": name, "non_productive_time_seconds": time} for name, time in agent_times.items()]
+    fields limits the work to those metric groups; the others come back empty.
+    """
+    totals = await fetch_agent_totals_async(window, fields)
+    fields = set(fields or AGENT_METRIC_GROUPS)
+    metrics = build_agent_metrics(window, totals.get("calls", {}), totals.get("states", {}))
+    return select_metric_groups(metrics, fields, EMPTY_AGENT_GROUPS)
 
-    except Exception as e:
-        print(f"Error in fetch_non_productive_time_last_15_minutes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
 
-# Working with the cdr table.
-def fetch_agent_contacts_handled_last_30_minutes(db: Session, user_time_zone: str) -> List[Dict[str, str]]:
+@querystats.attributed
+async def fetch_agent_series_async(window: ReportWindow, step: str) -> dict:
+    """Per-interval call metrics of a date range, for the intraday charts."""
     try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Get current time in user's time zone and convert it to UTC
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=30)
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-
-        # SQL query to track and sum the count of answered calls for each agent in the last 15 minutes from the cdr table
-        query = text("""
-            SELECT 
-                cc_agent AS name, 
-                COUNT(answer_stamp) AS total_calls_answered
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time
-                AND answer_stamp IS NOT NULL
-                AND cc_agent IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the SQL query using UTC for querying
-        result = db.execute(query, {
-            'start_time': start_time_utc
-        }).fetchall()
-
-        # Format the results, ensuring "0" is returned when the count is zero
-        formatted_result = [
-            {
-                "name": row[0],  # Access tuple elements by index
-                "contacts_handled": row[1]  # Directly use the integer result
-            } for row in result
-        ]
-
-        # Handle case where no agents are returned
-        if not formatted_result:
-            return [{"name": "No Agents", "contacts_handled": 0}]  # Return a default entry
-
-        return formatted_result
-
+        intervals = await series.fetch_window_series_async(
+            "agent_call_15m", window, step,
+            AGENT_CALL_SERIES_QUERY, AGENT_CALL_ROLLUP_SERIES_QUERY, agent_call_totals_from_rows)
     except Exception as e:
-        print(f"Error executing query: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_last_30_minutes(
-        db: Session, user_time_zone: str) -> List[Dict[str, any]]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user - timedelta(minutes=30)
-
-        # Convert user's time to UTC for querying
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)
-
-        # SQL query to fetch answer_stamp and end_stamp from cdr table
-        query = text("""
-            SELECT 
-                cc_agent,
-                SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_acw_duration,
-                COUNT(*) AS total_contacts
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time 
-                AND timestamp <= :end_time 
-                AND end_stamp IS NOT NULL
-                AND answer_stamp IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the query
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Format the results
-        formatted_result = []
-        for row in result:
-            agent_name = row[0]  # Agent's name
-
-            # Skip if agent_name is None
-            if agent_name is None:
-                continue
-
-            total_acw_duration = row[1] or 0  # Total ACW duration in seconds
-            total_contacts = row[2] or 0  # Total contacts handled
-
-            # Calculate average after contact work time
-            if total_contacts > 0:
-                avg_after_contact_work_time = total_acw_duration / total_contacts
-            else:
-                avg_after_contact_work_time = 0
-
-            # Append result with formatted time
-            formatted_result.append({
-                "name": agent_name,
-                "average_after_contact_work_time_seconds": seconds_to_hms(int(avg_after_contact_work_time)) if avg_after_contact_work_time > 0 else "00:00:00"
-            })
-
-        return formatted_result
+        print(f"Error in fetch_agent_series_async ({step}): {e}")
+        raise
 
-    except Exception as e:
-        print(f"Error in fetch_average_after_contact_work_time_last_15_minutes: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return build_agent_series(window, step, intervals)
 
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_last_30_minutes(db: Session, user_time_zone: str) -> List[schemas.AverageAgentInteractionTimeResponse]:
-    # Get the user's timezone
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-    start_time_user = now_user - timedelta(minutes=30)
 
-    # Convert user's time to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
+@querystats.attributed
+async def fetch_agent_export_async(window: ReportWindow) -> Iterator[dict]:
+    """Rows of the CSV/XLSX export: one per agent, however long the window."""
+    totals = await fetch_agent_totals_async(window)
+    return agent_export_rows(totals.get("calls", {}), totals.get("states", {}))
 
-    print("Start Time (UTC):", start_time_utc)
-    print("Now Time (UTC):", now_utc)
 
-    # SQL query to calculate total interaction time and count for each agent, only where required fields are not null
-    query = text("""
-        SELECT
-            cc_agent AS name,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,
-            COUNT(uuid) AS call_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time
-            AND answer_stamp IS NOT NULL
-            AND end_stamp IS NOT NULL
-            AND cc_agent IS NOT NULL
-        GROUP BY
-            cc_agent;
-    """)
+@querystats.attributed
+async def fetch_agent_occupancy_async(window: ReportWindow) -> dict:
+    """Agents available and on queue calls per minute of a window, see app/timeline.py.
 
+    The spans come from the interval table up to its watermark and from the raw
+    snapshots after it, or all of them when the refresh job has not run yet.
+    """
     try:
-        # Execute the query
-        result = db.execute(query, {'start_time': start_time_utc}).fetchall()
-        print("Query Result:", result)  # Log the raw query results
-
-        processed_result = []
-        for row in result:
-            agent_name = row[0]  # Accessing the agent name
-            total_interaction_time = row[1]  # Total interaction time in seconds
-            call_count = row[2]  # Count of calls answered
-
-            # Calculate the average interaction time in seconds
-            average_interaction_time = total_interaction_time / call_count if call_count > 0 else 0
-
-            # Create response object, converting seconds to HH:MM:SS format
-            if agent_name:  # Ensure agent_name is a valid string before appending
-                processed_result.append(
-                    schemas.AverageAgentInteractionTimeResponse(
-                        name=str(agent_name),
-                        average_agent_interaction_time_seconds=seconds_to_hms(int(average_interaction_time))
-                    )
-                )
-
-        return processed_result
-
+        watermark = await rollups.get_watermark_async("agent_state_intervals")
+        parts = await asyncio.gather(*(
+            fetch_rows_async(AGENT_STATE_SPANS_QUERY if rolled_up else AGENT_STATE_SNAPSHOT_SPANS_QUERY,
+                             {'start_time': start_time, 'end_time': end_time})
+            for rolled_up, start_time, end_time
+            in rollups.split_at_watermark(window.start_utc, window.end_utc, watermark)))
+        rows = [row for part in parts for row in part]
     except Exception as e:
-        print(f"Error fetching average agent interaction time: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-
-#-------------------------------- metrics for Today(Since 12 am) minutes time interval ---------------------->
-
-# Working with the cdr table.
-def get_recent_agent_names_today(db: Session, user_time_zone: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-    default_tz = pytz.utc
-    now_utc = datetime.utcnow().replace(tzinfo=pytz.utc)
-
-    # Get the start of today in UTC
-    start_time_utc = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {now_utc}")
+        print(f"Error in fetch_agent_occupancy_async ({window.kind}): {e}")
+        raise
+    return timeline.build_agent_occupancy(window, rows)
 
-    query = text("""  
-        SELECT DISTINCT cc_agent 
-        FROM cdr 
-        WHERE timestamp >= :start_time AND timestamp <= :end_time 
-          AND cc_agent IS NOT NULL
-    """)
 
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} records from the database.")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-
-    agent_names = [row[0] for row in data]  # Get the agent names from the fetched data
-
-    print("Agent names:", agent_names)  # Check what names were added
-    return agent_names
-
-# Working with the cdr table.
-def fetch_agent_answer_rate_today(db: Session, user_time_zone: str) -> list:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    
-    # Get the start of today in the user's time zone
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # SQL query to calculate the answer rate based on the `timestamp` column
-    query = text("""
-        WITH agent_call_data AS (
-            SELECT
-                cc_agent AS agent_name,
-                COUNT(CASE WHEN answer_stamp IS NOT NULL AND billsec > 0 THEN 1 END) AS calls_answered,
-                COUNT(CASE WHEN answer_stamp IS NULL OR billsec = 0 THEN 1 END) AS no_answer_count
-            FROM cdr
-            WHERE timestamp >= :start_time
-            AND timestamp <= :end_time
-            AND cc_agent IS NOT NULL  -- Filter out records without an agent
-            GROUP BY cc_agent
-        )
-        SELECT
-            agent_name,
-            ROUND(  -- Round to get whole percentage
-                (SUM(calls_answered) * 100.0 / 
-                 CASE
-                    WHEN (SUM(no_answer_count) + SUM(calls_answered)) = 0 THEN 1
-                    ELSE (SUM(no_answer_count) + SUM(calls_answered))
-                 END
-                )
-            ) AS agent_answer_rate
-        FROM agent_call_data
-        GROUP BY agent_name;
-    """)
+#-------------------------------- response formatting ---------------------->
 
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
+def _answer_rate(calls_answered: int, calls_missed: int) -> float:
+    # Same as ROUND(answered * 100.0 / total) in Postgres, which rounds halves away from zero
+    total = (calls_answered + calls_missed) or 1
+    return float((200 * calls_answered + total) // (2 * total))
 
-    return results
 
-# Working with the cdr table.
-def fetch_agent_non_response_today(
-        db: Session, user_time_zone: str) -> List[schemas.AgentNonResponse]:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
+def _average_hms(total_seconds: float, count: int) -> str:
+    average = total_seconds / count if count > 0 else 0
+    return seconds_to_hms(int(average)) if average > 0 else "00:00:00"
 
-    # Get the start of today in the user's time zone
-    start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    # Convert to UTC for the query
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
+def build_agent_metrics(window: ReportWindow, call_totals: Dict[str, dict],
+                        state_totals: Dict[str, dict]) -> dict:
+    """Shape per-agent totals into the schemas.AgentMetricsResponse layout."""
+    agents = list(call_totals)
 
-    # SQL query to sum non-answered calls for each agent
-    query = text("""  
-        SELECT
-            cc_agent AS name,
-            COUNT(*) AS no_answer_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time AND
-            timestamp <= :end_time AND
-            answer_stamp IS NULL
-        GROUP BY
-            cc_agent;
-    """)
-
-    # Execute the query
-    result = db.execute(query, {'start_time': start_time_utc, 'end_time': now_utc}).fetchall()
-
-    # Process the data, ensuring no None values for name, and divide the count by 3
-    processed_result = [
-        schemas.AgentNonResponse(
-            name=row[0],  # Agent name
-            no_answer_count=(row[1] // 3) if row[1] is not None else 0  # Count of non-responses divided by 3
-        ) for row in result if row[0] is not None  # Filter out None names
+    answer_rates = [
+        {"name": name,
+         "agent_answer_rate": _answer_rate(totals['calls_answered'], totals['calls_missed'])}
+        for name, totals in call_totals.items()
     ]
 
-    # Ensure all agents are represented, even if they have 0 non-responses
-    if not processed_result:
-        return [schemas.AgentNonResponse(name="No Agents", no_answer_count=0)]
-
-    return processed_result
-
-# Working with the cdr table.
-def fetch_agent_contacts_handled_today(db: Session, user_time_zone: str) -> List[Dict[str, str]]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Get current time in user's time zone and set the start time to today's midnight
-        now_user = datetime.now(user_tz)
-        start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-
-        # SQL query to track and sum the count of answered calls for each agent since 12 AM
-        query = text("""
-            SELECT 
-                cc_agent AS name, 
-                COUNT(answer_stamp) AS total_calls_answered
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time
-                AND answer_stamp IS NOT NULL
-                AND cc_agent IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the SQL query using UTC for querying
-        result = db.execute(query, {
-            'start_time': start_time_utc
-        }).fetchall()
-
-        # Format the results, ensuring "0" is returned when the count is zero
-        formatted_result = [
-            {
-                "name": row[0],  # Access tuple elements by index
-                "contacts_handled": row[1]  # Directly use the integer result
-            } for row in result
-        ]
-
-        # Handle case where no agents are returned
-        if not formatted_result:
-            return [{"name": "No Agents", "contacts_handled": 0}]  # Return a default entry
-
-        return formatted_result
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_agent_on_contact_time_today(db: Session, user_time_zone: str) -> list:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-
-    # Get the start of today in the user's local time
-    start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert user's time to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    # Query to fetch relevant data from the CDR table since 12 AM
-    query = text("""
-        SELECT 
-            cc_agent, 
-            answer_stamp, 
-            end_stamp, 
-            timestamp
-        FROM 
-            cdr
-        WHERE 
-            timestamp >= :start_time 
-            AND timestamp <= :end_time
-            AND answer_stamp IS NOT NULL
-            AND end_stamp IS NOT NULL
-        ORDER BY timestamp
-    """)
-
-    # Execute the query
-    result = db.execute(query, {
-        'start_time': start_time_utc,
-        'end_time': now_utc
-    }).fetchall()
-
-    formatted_result = []
-    total_contact_time = {}  # Dictionary to store total contact time per agent
-
-    for row in result:
-        agent_name = row[0]  # cc_agent
-        answer_stamp = row[1]  # Start of contact
-        end_stamp = row[2]  # End of contact
-        call_timestamp = row[3]  # timestamp
-
-        # Ensure that we only process records with a valid agent name
-        if agent_name:
-            # Convert call's timestamp to the user's local time for comparison
-            call_timestamp_local = call_timestamp.astimezone(user_tz)
-
-            # Check if the call falls within today in the user's local time
-            if start_time_user <= call_timestamp_local <= now_user:
-                # Calculate the contact time as the difference between end_stamp and answer_stamp
-                contact_duration = (end_stamp - answer_stamp).total_seconds()
-
-                # Accumulate contact time for each agent
-                if agent_name not in total_contact_time:
-                    total_contact_time[agent_name] = 0  # Initialize if not already in dict
-                total_contact_time[agent_name] += contact_duration  # Sum up the durations
-
-    # Format the results for output
-    for agent_name, total_seconds in total_contact_time.items():
-        # Convert total seconds to timedelta for formatting
-        delta = timedelta(seconds=total_seconds)
-        formatted_time = str(delta).split()[-1]  # Get the time part
-
-        formatted_result.append({
-            "name": agent_name,
-            "total_on_contact_time_seconds": formatted_time  # Format total time as a string
-        })
-
-    return formatted_result
-
-# working from the historical agent's table
-def fetch_agent_online_time_today(db: Session, user_time_zone: str) -> List[schemas.AgentOnlineTime]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-        
-        # Get the current time in the user's timezone
-        now_user = datetime.now(user_tz)
-        
-        # Set start_time_user to 12 AM of the current day in the user's timezone
-        start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        # Convert user's local times to UTC for querying
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)  # Current UTC time
-
-        # SQL query to calculate online time for each "Available" period
-        query = text("""
-            WITH available_periods AS (
-                SELECT 
-                    name,
-                    timestamp AS available_timestamp,
-                    LEAD(timestamp) OVER (PARTITION BY name ORDER BY timestamp) AS next_timestamp,
-                    status
-                FROM historical_agents_metrics
-                WHERE timestamp >= :start_time AND timestamp <= :end_time
-                ORDER BY name, timestamp
-            )
-            SELECT 
-                name,
-                SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, now()) - available_timestamp))) AS online_time
-            FROM available_periods
-            WHERE status = 'Available'
-            GROUP BY name;
-        """)
-
-        # Fetch the results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Format results
-        formatted_result = []
-        for row in result:
-            name, total_online_time = row
-            # Convert total_online_time to HH:MM:SS without microseconds
-            formatted_result.append({
-                "name": name,
-                "online_time": seconds_to_hms(int(total_online_time))  # Ensure only seconds are used
-            })
-
-        return formatted_result
-    except Exception as e:
-        print(f"Error in fetch_agent_online_time_today_since_12_am: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# working from the historical agent's table
-def fetch_non_productive_time_today(db: Session, user_time_zone: str) -> list:
-    try:
-        # Convert the user's timezone to UTC
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-        
-        # Set the start time to today's midnight (00:00:00) in the user's timezone
-        start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        # Convert both start and end times to UTC
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)
-
-        # SQL query to fetch all status records (including "On break" statuses) for today since 12 AM
-        query = text("""
-            WITH status_changes AS (
-                SELECT 
-                    ham.name,
-                    ham.status,
-                    ham.timestamp,
-                    LEAD(ham.status) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_status,
-                    LEAD(ham.timestamp) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_timestamp
-                FROM historical_agents_metrics ham
-                WHERE ham.timestamp >= :start_time 
-                  AND ham.timestamp <= :end_time
-            )
-            SELECT 
-                csp.name,
-                csp.status,
-                csp.timestamp,
-                csp.next_status,
-                csp.next_timestamp
-            FROM status_changes csp
-            WHERE csp.status = 'On Break'
-              AND csp.next_status != 'On Break';
-        """)
-
-        # Fetch results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Calculate the non-productive time for each agent
-        formatted_result = []
-        for row in result:
-            name, status, on_break_timestamp, next_status, next_timestamp = row
-
-            # Calculate non-productive time in seconds
-            non_productive_time_seconds = (next_timestamp - on_break_timestamp).total_seconds()
-
-            # Convert seconds to HH:MM:SS format
-            formatted_result.append({
-                "name": name,
-                "non_productive_time_seconds": seconds_to_hms(int(non_productive_time_seconds)) if non_productive_time_seconds else "00:00:00"
-            })
-
-        # Group results by agent and sum non-productive times
-        agent_times = {}
-        for entry in formatted_result:
-            name = entry["name"]
-            if name in agent_times:
-                # Sum non-productive times for the same agent
-                current_time = agent_times[name]
-                agent_times[name] = seconds_to_hms(int(current_time.split(":")[0]) * 3600 + int(current_time.split(":")[1]) * 60 + int(current_time.split(":")[2]) + int(entry["non_productive_time_seconds"].split(":")[2]))
-            else:
-                agent_times[name] = entry["non_productive_time_seconds"]
-
-        # Return the result in the desired format
-        return [{"name": name, "non_productive_time_seconds": time} for name, time in agent_times.items()]
-
-    except Exception as e:
-        print(f"Error in fetch_non_productive_time_today: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_today(
-        db: Session, user_time_zone: str) -> List[Dict[str, any]]:
-    try:
-        # Convert the user's timezone to UTC for querying
-        user_tz = pytz.timezone(user_time_zone)
-        now_user = datetime.now(user_tz)
-
-        # Get the start of today in the user's local time
-        start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        # Convert user's time to UTC for querying
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        now_utc = now_user.astimezone(pytz.utc)
-
-        # SQL query to fetch after contact work duration from cdr table using the timestamp column
-        query = text("""
-            SELECT 
-                cc_agent,
-                SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_acw_duration,
-                COUNT(*) AS total_contacts
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time 
-                AND timestamp <= :end_time 
-                AND end_stamp IS NOT NULL
-                AND answer_stamp IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the query
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': now_utc
-        }).fetchall()
-
-        # Format the results
-        formatted_result = []
-        for row in result:
-            agent_name = row[0] if row[0] is not None else "Unknown Agent"  # Handle None names
-            total_acw_duration = row[1] or 0  # Total ACW duration in seconds
-            total_contacts = row[2] or 0  # Total contacts handled
-
-            # Calculate average after contact work time
-            if total_contacts > 0:
-                avg_after_contact_work_time = total_acw_duration / total_contacts
-            else:
-                avg_after_contact_work_time = 0
-
-            # Append result with formatted time
-            formatted_result.append({
-                "name": agent_name,
-                "average_after_contact_work_time_seconds": seconds_to_hms(int(avg_after_contact_work_time)) if avg_after_contact_work_time > 0 else "00:00:00"
-            })
-
-        return formatted_result
-
-    except Exception as e:
-        print(f"Error in fetch_average_after_contact_work_time_today: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_today(db: Session, user_time_zone: str) -> List[schemas.AverageAgentInteractionTimeResponse]:
-    # Get the user's timezone and set the start of the day (12 AM)
-    user_tz = pytz.timezone(user_time_zone)
-    now_user = datetime.now(user_tz)
-    start_time_user = now_user.replace(hour=0, minute=0, second=0, microsecond=0)  # Set to today at 12 AM in user's timezone
-
-    # Convert user's start and end times to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    now_utc = now_user.astimezone(pytz.utc)
-
-    print("Start Time (UTC):", start_time_utc)
-    print("Now Time (UTC):", now_utc)
-
-    # SQL query to calculate total interaction time and count for each agent
-    query = text("""
-        SELECT
-            cc_agent AS name,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,
-            COUNT(uuid) AS call_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time
-            AND answer_stamp IS NOT NULL
-            AND end_stamp IS NOT NULL
-            AND cc_agent IS NOT NULL
-        GROUP BY
-            cc_agent;
-    """)
-
-    try:
-        # Execute the query
-        result = db.execute(query, {'start_time': start_time_utc}).fetchall()
-        print("Query Result:", result)  # Log the raw query results
-
-        processed_result = []
-        for row in result:
-            agent_name = row[0]  # Accessing the agent name
-            total_interaction_time = row[1]  # Total interaction time in seconds
-            call_count = row[2]  # Count of calls answered
-
-            # Calculate the average interaction time in seconds
-            average_interaction_time = total_interaction_time / call_count if call_count > 0 else 0
-
-            # Create response object, converting seconds to HH:MM:SS format
-            if agent_name:  # Ensure agent_name is a valid string before appending
-                processed_result.append(
-                    schemas.AverageAgentInteractionTimeResponse(
-                        name=str(agent_name),
-                        average_agent_interaction_time_seconds=seconds_to_hms(int(average_interaction_time))
-                    )
-                )
-
-        return processed_result
-
-    except Exception as e:
-        print(f"Error fetching average agent interaction time: {e}")
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
-
-# ------------------------ to get the metrics for custom date range ------------------->
-
-# Working with the cdr table.
-def get_recent_agent_names_for_date_range(db: Session, user_time_zone: str,
-                                          start_date: str,
-                                          end_date: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert start and end date strings to datetime objects
-    start_time_user_tz = datetime.fromisoformat(start_date).astimezone(user_tz)
-    end_time_user_tz = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-    # Convert both to UTC to match the database timestamps
-    start_time_utc = start_time_user_tz.astimezone(pytz.utc)
-    end_time_utc = end_time_user_tz.astimezone(pytz.utc)
-
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {end_time_utc}")
+    non_responses = [
+        {"name": name, "no_answer_count": totals['unanswered_calls']}
+        for name, totals in call_totals.items() if totals['unanswered_calls'] > 0
+    ] or [{"name": "No Agents", "no_answer_count": 0}]
 
-    query = text("""  
-        SELECT DISTINCT cc_agent 
-        FROM cdr 
-        WHERE timestamp >= :start_time AND timestamp <= :end_time 
-          AND cc_agent IS NOT NULL
-    """)
+    contacts_handled = [
+        {"name": name, "contacts_handled": totals['contacts_handled']}
+        for name, totals in call_totals.items() if totals['contacts_handled'] > 0
+    ] or [{"name": "No Agents", "contacts_handled": 0}]
 
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} records from the database.")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-
-    agent_names = [row[0] for row in data]  # Get the agent names from the fetched data
-
-    print("Agent names:", agent_names)  # Check what names were added
-    return agent_names
-
-# Working with the cdr table.
-def fetch_agent_answer_rate_for_date_range(db: Session, user_time_zone: str,
-                                           start_date: str,
-                                           end_date: str) -> list:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-    # Convert the user's local times to UTC for querying the database
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    # SQL query to calculate the answer rate based on the `timestamp` column
-    query = text("""  
-        WITH agent_call_data AS (
-            SELECT
-                cc_agent AS agent_name,
-                COUNT(CASE WHEN answer_stamp IS NOT NULL AND billsec > 0 THEN 1 END) AS calls_answered,
-                COUNT(CASE WHEN answer_stamp IS NULL OR billsec = 0 THEN 1 END) AS no_answer_count
-            FROM cdr
-            WHERE timestamp >= :start_time
-            AND timestamp <= :end_time
-            AND cc_agent IS NOT NULL  -- Filter out records without an agent
-            GROUP BY cc_agent
-        )
-        SELECT
-            agent_name,
-            ROUND(  -- Round to get whole percentage
-                (SUM(calls_answered) * 100.0 / 
-                 CASE
-                    WHEN (SUM(no_answer_count) + SUM(calls_answered)) = 0 THEN 1
-                    ELSE (SUM(no_answer_count) + SUM(calls_answered))
-                 END
-                )
-            ) AS agent_answer_rate
-        FROM agent_call_data
-        GROUP BY agent_name;
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
+    talking = {name: totals for name, totals in call_totals.items() if totals['talk_calls'] > 0}
 
-    return results
-
-# Working with the cdr table.
-def fetch_agent_non_response_for_date_range(
-        db: Session, user_time_zone: str, start_date: str,
-        end_date: str) -> list[schemas.AgentNonResponse]:
-
-    # Convert the user's timezone based on input
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the start and end dates from the UI (ISO format) to the user's timezone
-    start_time_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-    end_time_user = datetime.fromisoformat(end_date).astimezone(user_tz)
+    on_contact_times = [
+        {"name": name,
+         "total_on_contact_time_seconds": str(timedelta(seconds=totals['talk_seconds'])).split()[-1]}
+        for name, totals in talking.items()
+    ]
+    if not on_contact_times and window.kind == "range":
+        on_contact_times = [{"name": "No Agents", "total_on_contact_time_seconds": "00:00:00"}]
 
-    # Convert the times to UTC for querying the database
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    end_time_utc = end_time_user.astimezone(pytz.utc)
+    after_contact_work_time = [
+        {"name": name,
+         "average_after_contact_work_time_seconds": _average_hms(totals['talk_seconds'], totals['talk_calls'])}
+        for name, totals in talking.items()
+    ]
 
-    # SQL query to sum non-answered calls for each agent within the specified date range
-    query = text("""
-        SELECT
-            cc_agent AS name,
-            COUNT(*) AS no_answer_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time AND
-            timestamp <= :end_time AND
-            answer_stamp IS NULL
-        GROUP BY
-            cc_agent;
-    """)
+    agent_interaction_time = [
+        {"name": name,
+         "average_agent_interaction_time_seconds": _average_hms(totals['talk_seconds'], totals['talk_calls'])}
+        for name, totals in talking.items()
+    ]
 
-    try:
-        # Execute the query with the date range
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-        print("Query result:", result)  # Debugging line to see the raw query results
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    # Process the data, filtering out None names and dividing the count by 3
-    processed_result = [
-        schemas.AgentNonResponse(
-            name=row[0],  # Agent name
-            no_answer_count=(row[1] // 3) if row[1] is not None else 0  # Count of non-responses divided by 3
-        ) for row in result if row[0] is not None  # Filter out None names
+    online_times = [
+        {"name": name, "online_time": seconds_to_hms(totals['online_seconds'])}
+        for name, totals in state_totals.items() if totals['online_seconds'] is not None
     ]
 
-    # Return a default response if no valid data was found
-    if not processed_result:
-        return [schemas.AgentNonResponse(name="No Agents", no_answer_count=0)]
-
-    return processed_result
-
-# Working with the cdr table.
-def fetch_agent_on_contact_time_for_date_range(db: Session,
-                                               user_time_zone: str,
-                                               start_date: str,
-                                               end_date: str) -> list:
-    # Convert the user's timezone to UTC for querying
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Parse the start and end dates from the string format
-    start_time_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-    end_time_user = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-    # Convert user's time to UTC for querying
-    start_time_utc = start_time_user.astimezone(pytz.utc)
-    end_time_utc = end_time_user.astimezone(pytz.utc)
-
-    # SQL query to fetch agent on-contact time within the date range
-    query = text("""
-        SELECT 
-            cc_agent, 
-            answer_stamp, 
-            end_stamp, 
-            timestamp
-        FROM 
-            cdr
-        WHERE 
-            timestamp >= :start_time 
-            AND timestamp <= :end_time
-            AND answer_stamp IS NOT NULL
-            AND end_stamp IS NOT NULL
-        ORDER BY timestamp
-    """)
-
-    result = db.execute(query, {
-        'start_time': start_time_utc,
-        'end_time': end_time_utc
-    }).fetchall()
-
-    formatted_result = []
-    total_contact_time = {}  # Dictionary to store total contact time per agent
-
-    # Process each row of the result
-    for row in result:
-        agent_name = row[0]  # cc_agent
-        answer_stamp = row[1]  # Start of contact
-        end_stamp = row[2]  # End of contact
-        call_timestamp = row[3]  # timestamp
-
-        # Ensure that we only process records with a valid agent name
-        if agent_name:
-            # Convert call's timestamp to the user's local time for comparison
-            call_timestamp_local = call_timestamp.astimezone(user_tz)
-
-            # Check if the call falls within the specified date range in the user's local time
-            if start_time_user <= call_timestamp_local <= end_time_user:
-                # Calculate the contact time as the difference between end_stamp and answer_stamp
-                contact_duration = (end_stamp - answer_stamp).total_seconds()
-
-                # Accumulate contact time for each agent
-                if agent_name not in total_contact_time:
-                    total_contact_time[agent_name] = 0  # Initialize if not already in dict
-                total_contact_time[agent_name] += contact_duration  # Sum up the durations
-
-    # Format the results for output
-    for agent_name, total_seconds in total_contact_time.items():
-        # Convert total seconds to timedelta for formatting
-        delta = timedelta(seconds=total_seconds)
-        formatted_time = str(delta).split()[-1]  # Get the time part
-
-        formatted_result.append({
-            "name": agent_name,
-            "total_on_contact_time_seconds": formatted_time  # Format total time as a string
-        })
-
-    # Handle case where no agents are returned
-    if not formatted_result:
-        return [{"name": "No Agents", "total_on_contact_time_seconds": "00:00:00"}]
-
-    return formatted_result
-
-# Working with the cdr table.
-def fetch_agent_online_time_for_date_range(db: Session, user_time_zone: str,
-                                           start_date: str,
-                                           end_date: str) -> List[schemas.AgentOnlineTime]:
-    try:
-        # Convert the user's timezone based on input
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Convert the start and end dates from the UI (ISO format) to the user's timezone
-        start_time_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-        end_time_user = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-        # Convert the times to UTC for querying the database
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        end_time_utc = end_time_user.astimezone(pytz.utc)
-
-        # SQL query to calculate online time for "Available" status within the date range
-        query = text("""
-            WITH available_periods AS (
-                SELECT 
-                    name,
-                    timestamp AS available_timestamp,
-                    LEAD(timestamp) OVER (PARTITION BY name ORDER BY timestamp) AS next_timestamp,
-                    status
-                FROM historical_agents_metrics
-                WHERE timestamp >= :start_time AND timestamp <= :end_time
-                ORDER BY name, timestamp
-            )
-            SELECT 
-                name,
-                SUM(EXTRACT(EPOCH FROM (COALESCE(next_timestamp, :end_time) - available_timestamp))) AS online_time
-            FROM available_periods
-            WHERE status = 'Available'
-            GROUP BY name;
-        """)
-
-        # Fetch the results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Process the results and format the online time
-        formatted_result = []
-        for row in result:
-            name, total_online_time = row
-            # Convert total_online_time to HH:MM:SS without microseconds
-            formatted_result.append({
-                "name": name,
-                "online_time": seconds_to_hms(int(total_online_time))  # Ensure only seconds are used
-            })
-
-        return formatted_result
+    non_productive_times = [
+        {"name": name,
+         "non_productive_time_seconds": seconds_to_hms(totals['break_seconds']) if totals['break_seconds'] else "00:00:00"}
+        for name, totals in state_totals.items() if totals['break_seconds'] is not None
+    ]
 
-    except Exception as e:
-        print(f"Error in fetch_agent_online_time_for_date_range: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    occupancy_times = [
+        {"name": name, "occupancy_time": seconds_to_hms(totals['occupancy_seconds'])}
+        for name, totals in state_totals.items() if totals['occupancy_seconds'] is not None
+    ]
 
-# Working with the cdr table.
-def fetch_non_productive_time_for_date_range(db: Session, user_time_zone: str,
-                                             start_date: str,
-                                             end_date: str) -> list:
-    try:
-        # Convert the user's timezone based on input
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Convert the start and end dates from the UI (ISO format) to the user's timezone
-        start_time_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-        end_time_user = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-        # Convert the times to UTC for querying the database
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        end_time_utc = end_time_user.astimezone(pytz.utc)
-
-        # SQL query to fetch all records for the interval
-        query = text("""
-            WITH status_periods AS (
-                SELECT 
-                    ham.name,
-                    ham.timestamp,
-                    ham.status,
-                    LEAD(ham.timestamp) OVER (PARTITION BY ham.name ORDER BY ham.timestamp) AS next_timestamp
-                FROM historical_agents_metrics ham
-                WHERE ham.timestamp >= :start_time
-                  AND ham.timestamp <= :end_time
-            ),
-            on_break_periods AS (
-                SELECT
-                    name,
-                    timestamp AS on_break_timestamp,
-                    next_timestamp
-                FROM status_periods
-                WHERE status = 'On Break'
-            )
-            SELECT
-                obp.name,
-                SUM(EXTRACT(EPOCH FROM (LEAST(obp.next_timestamp, :end_time) - obp.on_break_timestamp))) AS non_productive_time_seconds
-            FROM on_break_periods obp
-            GROUP BY obp.name;
-        """)
-
-        # Fetch results from the database
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Format the results to HH:MM:SS
-        formatted_result = [
+    return {
+        "recent_agents": {"agents": agents},
+        "answer_rates": {"status": "success", "data": answer_rates},
+        "non_responses": {"agents": non_responses},
+        "on_contact_times": {
+            "status": "success",
+            "data": on_contact_times,
+            "message": "" if on_contact_times else NO_DATA_MESSAGES.get(window.kind, "")
+        },
+        "online_times": {"status": "success", "data": online_times, "message": ""},
+        "non_productive_times": {"status": "success", "data": non_productive_times},
+        "occupancy_times": {"status": "success", "data": occupancy_times},
+        "contacts_handled": {"status": "success", "data": contacts_handled},
+        "after_contact_work_time": {"status": "success", "data": after_contact_work_time},
+        "agent_interaction_time": {
+            "status": "success" if agent_interaction_time or window.kind == "range" else "error",
+            "data": agent_interaction_time
+        },
+    }
+
+
+def agent_export_rows(call_totals: Dict[str, dict], state_totals: Dict[str, dict]) -> Iterator[dict]:
+    """One flat row per agent with AGENT_EXPORT_FIELDS, for the CSV and XLSX exports."""
+    for name in sorted(set(call_totals) | set(state_totals)):
+        calls = call_totals.get(name) or dict.fromkeys(AGENT_CALL_TOTAL_COLUMNS, 0)
+        states = state_totals.get(name, {})
+        yield {
+            "name": name,
+            "contacts_handled": calls['contacts_handled'],
+            "calls_answered": calls['calls_answered'],
+            "calls_missed": calls['calls_missed'],
+            "unanswered_calls": calls['unanswered_calls'],
+            "agent_answer_rate": _answer_rate(calls['calls_answered'], calls['calls_missed']),
+            "talk_time": seconds_to_hms(int(calls['talk_seconds'])),
+            "average_talk_time": _average_hms(calls['talk_seconds'], calls['talk_calls']),
+            "online_time": seconds_to_hms(states.get('online_seconds') or 0),
+            "non_productive_time": seconds_to_hms(states.get('break_seconds') or 0),
+            "occupancy_time": seconds_to_hms(states.get('occupancy_seconds') or 0),
+        }
+
+
+def build_agent_series(window: ReportWindow, step: str, intervals: Dict[datetime, Dict[str, dict]]) -> dict:
+    """Shape per-interval totals into the schemas.AgentSeriesResponse layout, quiet intervals included."""
+    user_tz = pytz.timezone(window.user_time_zone)
+    return {
+        "status": "success",
+        "step": step,
+        "user_time_zone": window.user_time_zone,
+        "intervals": [
             {
-                "name": name,
-                "non_productive_time_seconds": seconds_to_hms(int(non_productive_time_seconds)) if non_productive_time_seconds else "00:00:00"
+                "interval_start": interval_start.astimezone(user_tz),
+                "agents": [
+                    {"name": name,
+                     "contacts_handled": totals['contacts_handled'],
+                     "calls_answered": totals['calls_answered'],
+                     "calls_missed": totals['calls_missed'],
+                     "unanswered_calls": totals['unanswered_calls'],
+                     "agent_answer_rate": _answer_rate(totals['calls_answered'], totals['calls_missed']),
+                     "talk_time": seconds_to_hms(int(totals['talk_seconds'])),
+                     "average_talk_time": _average_hms(totals['talk_seconds'], totals['talk_calls'])}
+                    for name, totals in intervals.get(interval_start, {}).items()
+                ],
             }
-            for name, non_productive_time_seconds in result
-        ]
-
-        return formatted_result
-
-    except Exception as e:
-        print(f"Error in fetch_non_productive_time_for_date_range: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_agent_contacts_handled_for_date_range(
-        db: Session, user_time_zone: str, start_date: str,
-        end_date: str) -> List[Dict[str, str]]:
-    try:
-        # Convert the user's timezone based on input
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Convert the start and end dates from the UI (ISO format) to the user's timezone
-        start_time_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-        end_time_user = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-        # Convert the times to UTC for querying the database
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        end_time_utc = end_time_user.astimezone(pytz.utc)
-
-        # Log the UTC conversion for debugging
-        print(f"Start Time UTC: {start_time_utc}, End Time UTC: {end_time_utc}")
-
-        # SQL query to track and sum the count of answered calls for each agent within the date range
-        query = text("""
-            SELECT 
-                cc_agent AS name, 
-                COUNT(answer_stamp) AS total_calls_answered
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time
-                AND timestamp <= :end_time
-                AND answer_stamp IS NOT NULL
-                AND cc_agent IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the SQL query using UTC timestamps
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Check if the result is empty
-        if not result:
-            print("No records found for the given date range.")
-            return [{"name": "No Agents", "contacts_handled": 0}]
-
-        # Format the results, ensuring "0" is returned when the count is zero
-        formatted_result = [
-            {
-                "name": row[0],  # Access tuple elements by index
-                "contacts_handled": row[1] or 0  # Default to 0 if None
-            } for row in result
-        ]
-
-        return formatted_result
-
-    except Exception as e:
-        # Log the error details
-        print(f"Error in fetch_agent_contacts_handled_for_date_range: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_for_date_range(
-        db: Session, user_time_zone: str, start_date: str,
-        end_date: str) -> List[Dict[str, any]]:
-    try:
-        # Convert the user's timezone based on input
-        user_tz = pytz.timezone(user_time_zone)
-
-        # Convert the start and end dates from the UI (ISO format) to the user's timezone
-        start_time_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-        end_time_user = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-        # Convert the times to UTC for querying the database
-        start_time_utc = start_time_user.astimezone(pytz.utc)
-        end_time_utc = end_time_user.astimezone(pytz.utc)
-
-        # SQL query to calculate average after contact work time
-        query = text("""
-            SELECT 
-                cc_agent,
-                SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_acw_duration,
-                COUNT(*) AS total_contacts
-            FROM 
-                cdr
-            WHERE 
-                timestamp >= :start_time 
-                AND timestamp <= :end_time 
-                AND end_stamp IS NOT NULL
-                AND answer_stamp IS NOT NULL
-            GROUP BY 
-                cc_agent
-        """)
-
-        # Execute the query
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Format the results
-        formatted_result = []
-        for row in result:
-            agent_name = row[0] if row[0] is not None else "Unknown Agent"  # Handle None names
-            total_acw_duration = row[1] or 0  # Total ACW duration in seconds
-            total_contacts = row[2] or 0  # Total contacts handled
-
-            # Calculate average after contact work time
-            if total_contacts > 0:
-                avg_after_contact_work_time = total_acw_duration / total_contacts
-            else:
-                avg_after_contact_work_time = 0
-
-            # Append result with formatted time
-            formatted_result.append({
-                "name": agent_name,
-                "average_after_contact_work_time_seconds": seconds_to_hms(int(avg_after_contact_work_time)) if avg_after_contact_work_time > 0 else "00:00:00"
-            })
-
-        return formatted_result
-
-    except Exception as e:
-        print(f"Error in fetch_average_after_contact_work_time_for_date_range: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[schemas.AverageAgentInteractionTimeResponse]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    # Query to fetch the average agent interaction time and total calls per agent in the specified date range
-    query = text("""
-        SELECT
-            cc_agent AS name,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,
-            COUNT(uuid) AS call_count
-        FROM
-            cdr
-        WHERE
-            timestamp >= :start_time
-            AND timestamp <= :end_time
-            AND answer_stamp IS NOT NULL
-            AND end_stamp IS NOT NULL
-            AND cc_agent IS NOT NULL
-        GROUP BY
-            cc_agent;
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        processed_result = []
-        for row in result:
-            agent_name = row[0]  # Accessing the agent name
-            total_interaction_time = row[1]  # Total interaction time in seconds
-            call_count = row[2]  # Count of calls answered
-
-            # Calculate the average interaction time in seconds
-            average_interaction_time = total_interaction_time / call_count if call_count > 0 else 0
-
-            # Create response object, converting seconds to HH:MM:SS format
-            if agent_name:  # Ensure agent_name is a valid string before appending
-                processed_result.append(
-                    schemas.AverageAgentInteractionTimeResponse(
-                        name=str(agent_name),
-                        average_agent_interaction_time_seconds=seconds_to_hms(int(average_interaction_time))
-                    )
-                )
-
-        return processed_result
-
-    except Exception as e:
-        print(f"Error fetching average agent interaction time: {e}")
-        return [{"name": "Error", "average_agent_interaction_time_seconds": "00:00:00"}]
\ No newline at end of file
+            for interval_start in series.bucket_starts(window, step)
+        ],
+    }
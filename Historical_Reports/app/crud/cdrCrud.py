@@ -3,7 +3,7 @@ from fastapi import HTTPException
 from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from app import schemas
+from app import analytics, schemas
 from app.utils import seconds_to_hms
 from datetime import datetime, timedelta
 import pytz
@@ -11,12 +11,17 @@ from typing import List, Union
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
 from sqlalchemy import text
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Tuple
+import base64
+import json
+from dataclasses import dataclass
+from app.utils import date_range_window
+from database import read_session, replica_lag_allowance
 
 
 # ------------------------------------------ CDR Reports ----------------------------------->
 
-def fetch_cdr_today(db: Session, user_time_zone: str) -> list:
+def fetch_cdr_today(db: Session, user_time_zone: str) -> List["CDRReportRow"]:
     user_tz = pytz.timezone(user_time_zone)
     now_user_time = datetime.now(user_tz)
     start_time_user = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -24,19 +29,8 @@ def fetch_cdr_today(db: Session, user_time_zone: str) -> list:
     start_utc = start_time_user.astimezone(pytz.utc)
     end_utc = now_user_time.astimezone(pytz.utc)
 
-    query = text("""
-        SELECT
-            cc_agent,
-            cc_queue,
-            destination_number,
-            caller_id_number,
-            uuid,
-            answer_stamp,
-            direction,
-            duration,
-            start_stamp,
-            end_stamp,
-            billsec
+    query = text(f"""
+        SELECT {CDR_REPORT_COLUMNS}
         FROM cdr
         WHERE timestamp >= :start_time AND timestamp <= :end_time
         ORDER BY start_stamp DESC
@@ -48,34 +42,29 @@ def fetch_cdr_today(db: Session, user_time_zone: str) -> list:
         print(f"Error fetching CDR today: {e}")
         return []
 
-    return [
-        {
-            'name': row[0],
-            'queue': row[1],
-            'destination_number': row[2],
-            'caller_id': row[3],
-            'uuid': str(row[4]),  # ✅ Cast UUID to string
-            'answer_time': row[5],
-            'direction': row[6],
-            'duration': row[7],
-            'start_time': row[8],
-            'end_time': row[9],
-            'billsec': row[10]
-        }
-        for row in results
-    ]
-
-
-def fetch_cdr_custom_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list:
-    user_tz = pytz.timezone(user_time_zone)
-    start_user = datetime.fromisoformat(start_date).astimezone(user_tz)
-    end_user = datetime.fromisoformat(end_date).astimezone(user_tz)
+    return [cdr_report_row(row) for row in results]
 
-    start_utc = start_user.astimezone(pytz.utc)
-    end_utc = end_user.astimezone(pytz.utc)
 
-    query = text("""
-        SELECT
+def fetch_cdr_custom_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> List["CDRReportRow"]:
+    window = date_range_window(user_time_zone, start_date, end_date)
+
+    query = text(CDR_RANGE_QUERY.format(source="cdr"))
+
+    try:
+        if analytics.covers(window, "cdr"):
+            results = analytics.fetch_rows(CDR_RANGE_SNAPSHOT_QUERY, window.start_utc, window.end_utc)
+        else:
+            results = db.execute(query, window.params).fetchall()
+    except Exception as e:
+        print(f"Error fetching CDR custom range: {e}")
+        return []
+
+    return [cdr_report_row(row) for row in results]
+
+
+# ---- keyset pages and streaming exports ---->
+
+CDR_REPORT_COLUMNS = """
             cc_agent,
             cc_queue,
             destination_number,
@@ -86,31 +75,139 @@ def fetch_cdr_custom_range(db: Session, user_time_zone: str, start_date: str, en
             duration,
             start_stamp,
             end_stamp,
-            billsec
-        FROM cdr
+            billsec"""
+
+CDR_REPORT_FIELDS = ('name', 'queue', 'destination_number', 'caller_id', 'uuid', 'answer_time',
+                     'direction', 'duration', 'start_time', 'end_time', 'billsec')
+
+CDR_RANGE_QUERY = f"""
+        SELECT {CDR_REPORT_COLUMNS}
+        FROM {{source}}
         WHERE timestamp >= :start_time AND timestamp <= :end_time
         ORDER BY start_stamp DESC
-    """)
+"""
+
+# Pages walk (start_stamp, uuid) downwards; calls without a start_stamp come last.
+CDR_PAGE_QUERY = """
+        SELECT {columns}
+        FROM {source}
+        WHERE timestamp >= :start_time AND timestamp <= :end_time
+          {after_cursor}
+        ORDER BY start_stamp DESC NULLS LAST, uuid DESC
+        LIMIT :limit
+"""
 
+CDR_AFTER_CURSOR = "AND ((start_stamp, uuid) < (:cursor_start, :cursor_uuid) OR start_stamp IS NULL)"
+CDR_AFTER_NULL_CURSOR = "AND start_stamp IS NULL AND uuid < :cursor_uuid"
+
+# Rows fetched per round trip by the server-side cursor of a streaming export
+CDR_STREAM_BATCH = 2000
+
+# The custom range and its streaming export over the Parquet snapshot of the closed
+# days, see app/analytics.py
+CDR_RANGE_SNAPSHOT_QUERY = analytics.query(CDR_RANGE_QUERY.format(source=analytics.CDR_SQL))
+CDR_STREAM_SNAPSHOT_QUERY = analytics.query(
+    CDR_PAGE_QUERY.format(source=analytics.CDR_SQL, columns=CDR_REPORT_COLUMNS, after_cursor="")
+    .replace("LIMIT :limit", ""))
+
+
+@dataclass(frozen=True)
+class CDRReportRow:
+    """A schemas.CDRReportEntry as a plain row, which orjson writes out without the model."""
+    name: Optional[str]
+    queue: Optional[str]
+    destination_number: Optional[str]
+    caller_id: Optional[str]
+    uuid: str
+    answer_time: Optional[datetime]
+    direction: Optional[str]
+    duration: Optional[int]
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    billsec: Optional[int]
+
+
+def cdr_report_row(row) -> CDRReportRow:
+    return CDRReportRow(row[0], row[1], row[2], row[3], str(row[4]), *row[5:])
+
+
+def cdr_report_dict(row) -> dict:
+    # Streaming exports write dicts
+    entry = dict(zip(CDR_REPORT_FIELDS, row))
+    entry['uuid'] = str(entry['uuid'])
+    return entry
+
+
+def encode_cdr_cursor(entry: CDRReportRow) -> str:
+    start_time = entry.start_time.isoformat() if entry.start_time else None
+    payload = json.dumps({'s': start_time, 'u': entry.uuid}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cdr_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    """Raises ValueError for anything that is not a cursor handed out by a previous page."""
     try:
-        results = db.execute(query, {'start_time': start_utc, 'end_time': end_utc}).fetchall()
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        start_time = datetime.fromisoformat(payload['s']) if payload['s'] else None
+        return start_time, str(payload['u'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def fetch_cdr_page(db: Session, user_time_zone: str, start_date: str, end_date: str,
+                   limit: int, cursor: Optional[str] = None) -> Tuple[List[CDRReportRow], Optional[str]]:
+    """One page of the custom range report and the cursor of the next page (None on the last)."""
+    window = date_range_window(user_time_zone, start_date, end_date)
+    params = dict(window.params, limit=limit + 1)
+
+    after_cursor = ""
+    if cursor:
+        cursor_start, params['cursor_uuid'] = decode_cdr_cursor(cursor)
+        if cursor_start is None:
+            after_cursor = CDR_AFTER_NULL_CURSOR
+        else:
+            after_cursor = CDR_AFTER_CURSOR
+            params['cursor_start'] = cursor_start
+
+    query = text(CDR_PAGE_QUERY.format(source="cdr", columns=CDR_REPORT_COLUMNS, after_cursor=after_cursor))
+    try:
+        results = db.execute(query, params).fetchall()
     except Exception as e:
-        print(f"Error fetching CDR custom range: {e}")
-        return []
+        print(f"Error fetching CDR page: {e}")
+        raise
+
+    entries = [cdr_report_row(row) for row in results[:limit]]
+    next_cursor = encode_cdr_cursor(entries[-1]) if len(results) > limit else None
+    return entries, next_cursor
 
-    return [
-        {
-            'name': row[0],
-            'queue': row[1],
-            'destination_number': row[2],
-            'caller_id': row[3],
-            'uuid': str(row[4]),  # ✅ Cast UUID to string
-            'answer_time': row[5],
-            'direction': row[6],
-            'duration': row[7],
-            'start_time': row[8],
-            'end_time': row[9],
-            'billsec': row[10]
-        }
-        for row in results
-    ]
\ No newline at end of file
+
+def iter_cdr_custom_range(user_time_zone: str, start_date: str, end_date: str) -> Iterator[dict]:
+    """Every row of the custom range report, streamed through a server-side cursor.
+
+    Opens its own session: the generator outlives the request's get_read_db session.
+    """
+    window = date_range_window(user_time_zone, start_date, end_date)
+    if analytics.covers(window, "cdr"):
+        try:
+            for row in analytics.iter_rows(CDR_STREAM_SNAPSHOT_QUERY, window.start_utc, window.end_utc,
+                                           CDR_STREAM_BATCH):
+                yield cdr_report_dict(row)
+        except Exception as e:
+            print(f"Error streaming CDR custom range: {e}")
+            raise
+        return
+
+    query = text(CDR_PAGE_QUERY.format(source="cdr", columns=CDR_REPORT_COLUMNS, after_cursor="")
+                 .replace("LIMIT :limit", ""))
+
+    db = read_session(replica_lag_allowance(window.end_utc))
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=CDR_STREAM_BATCH),
+                            window.params)
+        for row in result:
+            yield cdr_report_dict(row)
+    except Exception as e:
+        print(f"Error streaming CDR custom range: {e}")
+        raise
+    finally:
+        db.close()
@@ -1,2353 +1,373 @@
 # app/crud.py
-from fastapi import HTTPException
-from sqlalchemy import func, text
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from app import schemas
-from app.utils import seconds_to_hms
+import asyncio
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
 import pytz
-from typing import List, Union
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
 from sqlalchemy import text
-from typing import List, Dict
-
-# --------------------------------------- Queue metrics ---------------------------------->
-
-# 15 minutes time intervals
-
-# Working with the cdr table.
-def fetch_unique_queue_names(db: Session, user_time_zone: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {end_time_utc}")
-
-    # Fetch distinct queue names from the 'cdr' table
-    query = text("""
-        SELECT DISTINCT cc_queue
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} unique queues from the database.")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-        return []
-
-    # Collect unique queue names
-    queue_names = {row[0] for row in data}  # Using a set to ensure uniqueness
-
-    print("Unique queue names:", queue_names)  # Check what names were added
-    return list(queue_names)  # Convert set back to list if needed
-
-# Working with the cdr table.
-def fetch_service_level_60_seconds_per_queue_last_15_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '60 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_60_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        print(f"Executing query with start_time: {start_time_utc}, end_time: {end_time_utc}")
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        print(f"Query results: {results}")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"service_level_60_seconds": {"error": str(e)}}]
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_60_seconds": f"{int(row[1])}%",  # Service level rounded down to nearest whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels
-
-# Working with the cdr table.
-def fetch_service_level_120_seconds_per_queue_last_15_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '120 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_120_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []  # Return an empty list on error
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_120_seconds": f"{int(row[1])}%",  # Service level rounded down to nearest whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels if service_levels else []  # Return empty list if no data
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_for_queues(db: Session, user_time_zone: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(COALESCE(end_stamp - answer_stamp, interval '0 seconds')) AS total_acw,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": None, "avg_time": 0, "avg_time_formatted": "00:00:00"}]
-
-    avg_aacw_results = []
-
-    for row in results:
-        total_acw = row[1] if row[1] is not None else timedelta(seconds=0)
-        total_calls = row[2] if row[2] is not None else 0
-
-        # Calculate average ACW, handling division by zero
-        if total_calls > 0:
-            avg_acw_seconds = total_acw.total_seconds() / total_calls
-        else:
-            avg_acw_seconds = 0  # No calls, so average ACW is 0
-
-        # Convert average seconds to HH:MM:SS format
-        avg_acw_formatted = seconds_to_hms(int(avg_acw_seconds))
-
-        avg_aacw_results.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_acw_seconds,
-            "avg_time_formatted": avg_acw_formatted
-        })
-
-    return avg_aacw_results
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_for_queues(db: Session, user_time_zone: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Query to fetch the average agent interaction time and total calls per queue in the last 15 minutes
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,  -- Sum of interaction time in seconds
-            COUNT(*) AS total_calls  -- Total number of calls
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL  -- Only consider answered calls
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL  -- Filter by non-null queues
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    avg_interaction_times = []
-
-    # Loop through the results to calculate the average interaction time per queue
-    for row in results:
-        total_interaction_time = row[1]  # Total interaction time in seconds
-        total_calls = row[2]  # Total number of calls
-
-        # Calculate the average interaction time in seconds
-        avg_interaction_seconds = total_interaction_time / total_calls if total_calls > 0 else 0
-
-        # Convert the average time to HH:MM:SS format
-        avg_interaction_formatted = seconds_to_hms(int(avg_interaction_seconds))
-
-        avg_interaction_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_interaction_seconds,
-            "avg_time_formatted": avg_interaction_formatted,
-            "total_calls": total_calls
-        })
-
-    return avg_interaction_times
-
-# Working with the cdr table. 
-def fetch_average_queue_answer_time_per_queue(db: Session, user_time_zone: str) -> dict:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Print the time range being used for the query
-    print(f"Querying data from {start_time_utc} to {end_time_utc}")
-
-    query = text("""
-        SELECT cc_queue, AVG(EXTRACT(EPOCH FROM (answer_stamp - start_stamp))) AS avg_queue_answer_time
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Print the raw result for debugging
-        print(f"Raw result: {result}")
-
-        # Create a dictionary to store average answer time per queue
-        queue_avg_times = {}
-        for row in result:
-            queue_name = row[0]
-            avg_seconds = float(row[1]) if row[1] is not None else 0  # Convert decimal to float
-            avg_queue_answer_time = str(timedelta(seconds=avg_seconds))  # Convert to timedelta
-            queue_avg_times[queue_name] = avg_queue_answer_time
-
-        return queue_avg_times
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_average_handle_time_for_queues(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT 
-            cc_queue,
-            AVG(
-                (duration * INTERVAL '1 second') + (waitsec * INTERVAL '1 second') + (end_stamp - answer_stamp)
-            ) AS avg_aht,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    avg_handle_times = []
-
-    # If no results, return a default value for every queue
-    if not results:
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    for row in results:
-        avg_aht = row[1] if row[1] is not None else timedelta(seconds=0)
-        avg_aht_seconds = avg_aht.total_seconds()
-        avg_aht_formatted = seconds_to_hms(int(avg_aht_seconds))
-
-        avg_handle_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_aht_seconds,
-            "avg_time_formatted": avg_aht_formatted,
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return avg_handle_times
-
-# Working with the cdr table. 
-def fetch_contacts_handled_per_queue(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Convert result to a dictionary (queue -> contacts_handled)
-        queue_contacts_handled = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return queue_contacts_handled
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_contacts_handled_incoming(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_incoming
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND (
-            direction = 'inbound'
-            OR bleg_uuid IS NOT NULL -- Transferred contacts
-        )
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts handled incoming per queue
-        contacts_handled_incoming_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return contacts_handled_incoming_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of error
-
-# Working with the cdr table.
-def fetch_contacts_queued(db: Session, user_time_zone: str) -> dict:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(*) AS contacts_queued
-        FROM cdr
-        WHERE cc_queue IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts queued per queue and divide by 3
-        queue_contacts_queued = {row[0]: row[1] // 3 for row in result}  # Dividing by 3
-
-        return queue_contacts_queued
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_contacts_abandoned(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(*) AS abandoned_contacts
-        FROM cdr
-        WHERE answer_stamp IS NULL
-        AND end_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        abandoned_contacts = []
-        for row in results:
-            count = row[1]
-            # Divide by 3 if count is greater than 0, else keep it 0
-            abandoned_contacts.append({
-                "queue": row[0],  # cc_queue
-                "abandoned_count": count // 3 if count > 0 else 0  # Conditional check for 0
-            })
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    return abandoned_contacts
-
-# Working with the cdr table.
-def fetch_contacts_handled_outbound(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-        FROM cdr
-        WHERE direction = 'outbound'
-        AND cc_queue IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts handled outbound per queue
-        contacts_handled_outbound_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return contacts_handled_outbound_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of error
-
-
-# ---------------------------------------- 30 minutes time interval --------------------------------------------------->
-
-# 30 minutes time intervals
-# Working with the cdr table.
-def fetch_unique_queue_names_for_30_minutes(db: Session, user_time_zone: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
 
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {end_time_utc}")
+from app import analytics, call_facts, querystats, rollups, series, singleflight, staffing, timeline, today
+from app.utils import ReportWindow, seconds_to_hms, select_metric_groups
+from database import fetch_rows_async
+
+# --------------------------------------- Queue metrics engine ---------------------------------->
+
+# Answer-time thresholds reported in schemas.QueueMetricsResponse
+SERVICE_LEVEL_THRESHOLDS = (60, 120)
+
+# Per-queue counts and sums for a window, all from one pass over its calls (one row
+# per call, see app/call_facts.py), so counts are of calls rather than cdr legs.
+QUEUE_AGGREGATES = """
+        COUNT(*) AS total_calls,
+        COALESCE(SUM(talk_seconds), 0) AS acw_seconds,
+        COUNT(*) FILTER (WHERE answer_stamp IS NOT NULL) AS answered_calls,
+        COALESCE(SUM(talk_seconds) FILTER (WHERE answer_stamp IS NOT NULL), 0) AS interaction_seconds,
+        COUNT((duration * INTERVAL '1 second') + (waitsec * INTERVAL '1 second') + (end_stamp - answer_stamp)) AS aht_calls,
+        COALESCE(SUM(EXTRACT(EPOCH FROM (
+            (duration * INTERVAL '1 second') + (waitsec * INTERVAL '1 second') + (end_stamp - answer_stamp)
+        ))), 0) AS aht_seconds,
+        COUNT(*) FILTER (WHERE answer_stamp IS NOT NULL AND start_stamp IS NOT NULL) AS answer_wait_calls,
+        COALESCE(SUM(wait_seconds)
+                 FILTER (WHERE answer_stamp IS NOT NULL AND start_stamp IS NOT NULL), 0) AS answer_wait_seconds,
+        COUNT(*) FILTER (WHERE answer_stamp IS NOT NULL
+                         AND (direction = 'inbound' OR bridged)) AS handled_incoming,
+        COUNT(*) FILTER (WHERE direction = 'outbound'
+                         AND start_stamp IS NOT NULL
+                         AND end_stamp IS NOT NULL
+                         AND answer_stamp IS NULL) AS handled_outbound,
+        COUNT(*) FILTER (WHERE end_stamp IS NOT NULL AND answer_stamp IS NULL) AS unanswered_calls"""
+
+QUEUE_TOTALS_SELECT = """
+    SELECT
+        cc_queue,{aggregates}
+    FROM ({calls}) AS calls
+    WHERE cc_queue IS NOT NULL
+    GROUP BY cc_queue
+"""
+
+QUEUE_SERIES_SELECT = """
+    SELECT
+        {interval_start} AS interval_start,
+        cc_queue,{aggregates}
+    FROM ({calls}) AS calls
+    WHERE cc_queue IS NOT NULL
+    GROUP BY 1, 2
+"""
+
+QUEUE_TOTAL_COLUMNS = ('total_calls', 'acw_seconds', 'answered_calls', 'interaction_seconds',
+                       'aht_calls', 'aht_seconds', 'answer_wait_calls', 'answer_wait_seconds',
+                       'handled_incoming', 'handled_outbound', 'unanswered_calls')
+
+# Metric groups of schemas.QueueMetricsResponse. They all come out of the same pass
+# over the calls, so fields= only trims the payload.
+QUEUE_LIST_GROUPS = ("unique_queue_names", "service_levels_60_seconds", "service_levels_120_seconds",
+                     "avg_after_contact_work_time", "avg_interaction_times", "avg_handle_times",
+                     "abandoned_contacts")
+QUEUE_DICT_GROUPS = ("contacts_queued", "contacts_handled_per_queue", "contacts_handled_incoming",
+                     "contacts_handled_outbound", "avg_queue_answer_time")
+QUEUE_METRIC_GROUPS = QUEUE_LIST_GROUPS + QUEUE_DICT_GROUPS
+
+EMPTY_QUEUE_GROUPS = {**{group: [] for group in QUEUE_LIST_GROUPS}, **{group: {} for group in QUEUE_DICT_GROUPS}}
+
+# Columns of the CSV and XLSX exports, one row per queue
+QUEUE_EXPORT_FIELDS = ("queue", "total_calls", "answered_calls", "abandoned_count",
+                       *(f"service_level_{seconds}_seconds" for seconds in SERVICE_LEVEL_THRESHOLDS),
+                       "avg_handle_time", "avg_after_contact_work_time", "avg_interaction_time",
+                       "avg_queue_answer_time", "contacts_handled_incoming", "contacts_handled_outbound")
+
+QUEUE_SECONDS_COLUMNS = {'acw_seconds', 'interaction_seconds', 'aht_seconds', 'answer_wait_seconds'}
+
+
+def service_level_column(seconds: int) -> str:
+    return f"service_level_{int(seconds)}"
+
+
+def queue_aggregates(thresholds: Tuple[int, ...] = SERVICE_LEVEL_THRESHOLDS) -> str:
+    service_levels = "".join(
+        f",\n        COUNT(*) FILTER (WHERE wait_seconds <= {int(seconds)})"
+        f" AS {service_level_column(seconds)}"
+        for seconds in thresholds
+    )
+    return QUEUE_AGGREGATES + service_levels
+
+
+def queue_total_columns(thresholds: Tuple[int, ...] = SERVICE_LEVEL_THRESHOLDS) -> Tuple[str, ...]:
+    return QUEUE_TOTAL_COLUMNS + tuple(service_level_column(seconds) for seconds in thresholds)
+
+
+@lru_cache(maxsize=None)
+def queue_totals_query(thresholds: Tuple[int, ...] = SERVICE_LEVEL_THRESHOLDS):
+    return text(QUEUE_TOTALS_SELECT.format(aggregates=queue_aggregates(thresholds), calls=call_facts.CALLS_SQL))
+
+
+# 15 minute rollups of the same totals at SERVICE_LEVEL_THRESHOLDS, see app/rollups.py
+QUEUE_CALL_ROLLUP_QUERY = rollups.upsert_query(
+    "queue_call_rollup_15m", ("bucket_start", "cc_queue"), queue_total_columns(), f"""
+    SELECT
+        {rollups.CDR_BUCKET_SQL} AS bucket_start,
+        cc_queue,{queue_aggregates()}
+    FROM call_facts
+    WHERE timestamp >= :start_time AND timestamp < :end_time
+      AND cc_queue IS NOT NULL
+    GROUP BY 1, 2
+""")
+
+QUEUE_CALL_ROLLUP_TOTALS_QUERY = rollups.sum_query(
+    "queue_call_rollup_15m", "cc_queue", queue_total_columns())
+
+
+# Per-interval totals for the series endpoint, see app/series.py
+QUEUE_CALL_SERIES_QUERY = text(QUEUE_SERIES_SELECT.format(
+    interval_start=series.BUCKET_SQL.format(column="timestamp"), aggregates=queue_aggregates(),
+    calls=call_facts.CALLS_SQL))
+
+QUEUE_CALL_ROLLUP_SERIES_QUERY = series.rollup_series_query(
+    "queue_call_rollup_15m", "cc_queue", queue_total_columns())
+
+# The same totals over the Parquet snapshot of the closed days, see app/analytics.py
+QUEUE_CALL_SNAPSHOT_QUERY = analytics.query(QUEUE_TOTALS_SELECT.format(
+    aggregates=queue_aggregates(), calls=analytics.CALLS_SQL))
+
+# Every queued call up during [window_start, window_end), as epoch seconds for the
+# concurrency timeline (see app/timeline.py). Calls are written at hangup, so they
+# are looked for up to timeline.LONGEST_CALL past the window.
+QUEUE_CALL_SPANS_QUERY = text(f"""
+    SELECT
+        cc_queue,
+        EXTRACT(EPOCH FROM start_stamp)::float8,
+        EXTRACT(EPOCH FROM COALESCE(answer_stamp, end_stamp))::float8,
+        EXTRACT(EPOCH FROM end_stamp)::float8
+    FROM ({call_facts.CALLS_SQL}) AS calls
+    WHERE cc_queue IS NOT NULL
+      AND start_stamp < :window_end AND end_stamp > :window_start
+""")
+
+
+# Working with the calls.
+def queue_totals_from_rows(rows, thresholds: Sequence[int] = SERVICE_LEVEL_THRESHOLDS) -> Dict[str, dict]:
+    columns = queue_total_columns(tuple(thresholds))
+    totals = {}
+    for row in rows:
+        totals[row[0]] = {
+            column: float(value or 0) if column in QUEUE_SECONDS_COLUMNS else int(value or 0)
+            for column, value in zip(columns, row[1:])
+        }
+    return totals
 
-    # Fetch distinct queue names from the 'cdr' table
-    query = text("""
-        SELECT DISTINCT cc_queue
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-    """)
 
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} unique queues from the database.")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-        return []
-
-    # Collect unique queue names
-    queue_names = {row[0] for row in data}  # Using a set to ensure uniqueness
-
-    print("Unique queue names:", queue_names)  # Check what names were added
-    return list(queue_names)  # Convert set back to list if needed
-
-# Working with the cdr table.
-def fetch_service_level_60_seconds_per_queue_last_30_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '60 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_60_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        print(f"Executing query with start_time: {start_time_utc}, end_time: {end_time_utc}")
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        print(f"Query results: {results}")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"service_level_60_seconds": {"error": str(e)}}]
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_60_seconds": f"{int(row[1])}%",  # Service level rounded down to nearest whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels
-
-# Working with the cdr table.
-def fetch_service_level_120_seconds_per_queue_last_30_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '120 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_120_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []  # Return an empty list on error
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_120_seconds": f"{int(row[1])}%",  # Service level rounded down to nearest whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels if service_levels else []  # Return empty list if no data
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_for_queues_last_30_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(COALESCE(end_stamp - answer_stamp, interval '0 seconds')) AS total_acw,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
+# Since-today totals, topped up with the calls of each poll (see app/today.py)
+queue_call_today = today.TodayAggregator(
+    "queue_call_15m", queue_totals_query(), QUEUE_CALL_ROLLUP_TOTALS_QUERY, queue_totals_from_rows,
+    naive_utc=True)
+
 
+async def fetch_queue_window_totals_async(window: ReportWindow) -> Dict[str, dict]:
+    """Per-queue totals of a window; rollup and edge queries run concurrently."""
     try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": None, "avg_time": 0, "avg_time_formatted": "00:00:00"}]
-
-    avg_aacw_results = []
-
-    for row in results:
-        total_acw = row[1] if row[1] is not None else timedelta(seconds=0)
-        total_calls = row[2] if row[2] is not None else 0
-
-        # Calculate average ACW, handling division by zero
-        if total_calls > 0:
-            avg_acw_seconds = total_acw.total_seconds() / total_calls
+        if today.enabled_for(window):
+            totals = await queue_call_today.totals(window)
         else:
-            avg_acw_seconds = 0  # No calls, so average ACW is 0
-
-        # Convert average seconds to HH:MM:SS format
-        avg_acw_formatted = seconds_to_hms(int(avg_acw_seconds))
-
-        avg_aacw_results.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_acw_seconds,
-            "avg_time_formatted": avg_acw_formatted
-        })
-
-    return avg_aacw_results
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_for_queues_last_30_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Query to fetch the average agent interaction time and total calls per queue in the last 15 minutes
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,  -- Sum of interaction time in seconds
-            COUNT(*) AS total_calls  -- Total number of calls
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL  -- Only consider answered calls
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL  -- Filter by non-null queues
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    avg_interaction_times = []
-
-    # Loop through the results to calculate the average interaction time per queue
-    for row in results:
-        total_interaction_time = row[1]  # Total interaction time in seconds
-        total_calls = row[2]  # Total number of calls
-
-        # Calculate the average interaction time in seconds
-        avg_interaction_seconds = total_interaction_time / total_calls if total_calls > 0 else 0
-
-        # Convert the average time to HH:MM:SS format
-        avg_interaction_formatted = seconds_to_hms(int(avg_interaction_seconds))
-
-        avg_interaction_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_interaction_seconds,
-            "avg_time_formatted": avg_interaction_formatted,
-            "total_calls": total_calls
-        })
-
-    return avg_interaction_times
-
-# Working with the cdr table. 
-def fetch_average_queue_answer_time_per_queue_last_30_minutes(db: Session, user_time_zone: str) -> dict:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Print the time range being used for the query
-    print(f"Querying data from {start_time_utc} to {end_time_utc}")
-
-    query = text("""
-        SELECT cc_queue, AVG(EXTRACT(EPOCH FROM (answer_stamp - start_stamp))) AS avg_queue_answer_time
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Print the raw result for debugging
-        print(f"Raw result: {result}")
-
-        # Create a dictionary to store average answer time per queue
-        queue_avg_times = {}
-        for row in result:
-            queue_name = row[0]
-            avg_seconds = float(row[1]) if row[1] is not None else 0  # Convert decimal to float
-            avg_queue_answer_time = str(timedelta(seconds=avg_seconds))  # Convert to timedelta
-            queue_avg_times[queue_name] = avg_queue_answer_time
-
-        return queue_avg_times
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_average_handle_time_for_queues_last_30_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT 
-            cc_queue,
-            AVG(
-                (duration * INTERVAL '1 second') + (waitsec * INTERVAL '1 second') + (end_stamp - answer_stamp)
-            ) AS avg_aht,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    avg_handle_times = []
-
-    # If no results, return a default value for every queue
-    if not results:
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    for row in results:
-        avg_aht = row[1] if row[1] is not None else timedelta(seconds=0)
-        avg_aht_seconds = avg_aht.total_seconds()
-        avg_aht_formatted = seconds_to_hms(int(avg_aht_seconds))
-
-        avg_handle_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_aht_seconds,
-            "avg_time_formatted": avg_aht_formatted,
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return avg_handle_times
-
-# Working with the cdr table. 
-def fetch_contacts_handled_last_30_minutes_per_queue(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-        
-        # Convert result to a dictionary (queue -> contacts_handled)
-        queue_contacts_handled = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return queue_contacts_handled
-
+            totals = await analytics.fetch_window_totals_async(
+                "calls", QUEUE_CALL_SNAPSHOT_QUERY, window, queue_totals_from_rows,
+                lambda start_time, end_time: rollups.fetch_window_totals_async(
+                    "queue_call_15m", window.kind, start_time, end_time,
+                    queue_totals_query(), QUEUE_CALL_ROLLUP_TOTALS_QUERY, queue_totals_from_rows,
+                    naive_utc=True))
     except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_contacts_handled_incoming_last_30_minutes(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_incoming
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND (
-            direction = 'inbound'
-            OR bleg_uuid IS NOT NULL -- Transferred contacts
-        )
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
+        print(f"Error in fetch_queue_window_totals_async ({window.kind}): {e}")
+        raise
+    return totals
 
-        # Create a dictionary to store contacts handled incoming per queue
-        contacts_handled_incoming_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
 
-        return contacts_handled_incoming_per_queue
+@singleflight.coalesce_async("queue-metrics")
+@querystats.attributed
+async def fetch_queue_metrics_async(window: ReportWindow, fields: Optional[Tuple[str, ...]] = None) -> dict:
+    """Per-queue metrics of a window.
 
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of error
-
-# Working with the cdr table.
-def fetch_contacts_queued_last_30_minutes(db: Session, user_time_zone: str) -> dict:
-    """
-    Fetch the number of queued contacts for each queue in the last 30 minutes.
+    Metric groups outside fields come back empty.
     """
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time in the user's time zone for logging/debugging purposes
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
+    metrics = build_queue_metrics(await fetch_queue_window_totals_async(window))
+    return select_metric_groups(metrics, fields, EMPTY_QUEUE_GROUPS) if fields else metrics
 
-    # Convert to UTC for database querying (though we are using SQL's NOW() function directly in the query)
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Debugging logs to check calculated time ranges
-    print(f"Fetching queued contacts from {start_time_utc} to {end_time_utc} (UTC) using timestamp column.")
-
-    query = text("""
-        SELECT cc_queue, COUNT(*) AS contacts_queued
-        FROM cdr
-        WHERE cc_queue IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= (NOW() - INTERVAL '30 minutes')
-        GROUP BY cc_queue
-    """)
 
+@querystats.attributed
+async def fetch_queue_series_async(window: ReportWindow, step: str) -> dict:
+    """Per-interval queue metrics of a date range, for the intraday charts."""
     try:
-        result = db.execute(query).fetchall()
-
-        # Log the raw query result for debugging
-        print(f"Query results: {result}")
-
-        # Create a dictionary to store contacts queued per queue and divide by 3
-        queue_contacts_queued = {row[0]: row[1] // 3 for row in result}  # Dividing by 3
-
-        # Log the final processed result
-        print(f"Returned contacts queued data: {queue_contacts_queued}")
-
-        return queue_contacts_queued
-
+        intervals = await series.fetch_window_series_async(
+            "queue_call_15m", window, step,
+            QUEUE_CALL_SERIES_QUERY, QUEUE_CALL_ROLLUP_SERIES_QUERY, queue_totals_from_rows)
     except Exception as e:
-        # Log any exception that occurs during the query
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_contacts_abandoned_last_30_minutes(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(*) AS abandoned_contacts
-        FROM cdr
-        WHERE answer_stamp IS NULL
-        AND end_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
+        print(f"Error in fetch_queue_series_async ({step}): {e}")
+        raise
 
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        abandoned_contacts = []
-        for row in results:
-            count = row[1]
-            # Divide by 3 if count is greater than 0, else keep it 0
-            abandoned_contacts.append({
-                "queue": row[0],  # cc_queue
-                "abandoned_count": count // 3 if count > 0 else 0  # Conditional check for 0
-            })
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    return abandoned_contacts
-
-# Working with the cdr table.
-# def fetch_contacts_handled_outbound_last_30_minutes(db: Session, user_time_zone: str) -> Dict[str, int]:
-#     user_tz = pytz.timezone(user_time_zone)
-
-#     # Calculate the current time and start time in the user's time zone
-#     now_user_time = datetime.now(user_tz)
-#     start_time_user_time = now_user_time - timedelta(minutes=30)
-
-#     # Convert to UTC for database querying
-#     start_time_utc = start_time_user_time.astimezone(pytz.utc)
-#     end_time_utc = now_user_time.astimezone(pytz.utc)
-
-#     # query = text(""" 
-#     #     SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-#     #     FROM cdr
-#     #     WHERE direction = 'outbound'
-#     #     AND answer_stamp IS NULL
-#     #     AND timestamp >= :start_time AND timestamp <= :end_time
-#     #     GROUP BY cc_queue
-#     # """)
-
-#     query = text("""
-#     SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-#     FROM cdr
-#     WHERE direction = 'outbound'
-#     AND cc_queue IS NOT NULL
-#     AND start_stamp IS NOT NULL
-#     AND end_stamp IS NOT NULL
-#     AND answer_stamp IS NULL
-#     AND timestamp >= :start_time AND timestamp <= :end_time
-#     GROUP BY cc_queue
-# """)
-
-
-#     try:
-#         result = db.execute(query, {
-#             'start_time': start_time_utc,
-#             'end_time': end_time_utc
-#         }).fetchall()
-
-#         # Create a dictionary to store contacts handled outbound per queue
-#         contacts_handled_outbound_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-#         return contacts_handled_outbound_per_queue
-
-#     except Exception as e:
-#         print(f"Error executing query: {e}")
-#         return {}  # Return an empty dictionary in case of error
-
-
-def fetch_contacts_handled_outbound_last_30_minutes(db: Session, user_time_zone: str) -> Dict[str, int]:
-    # Set up the user's timezone
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate current time and start time in the user's timezone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=30)
-
-    # Convert the times to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Define the SQL query to count outbound contacts per queue
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-        FROM cdr
-        WHERE direction = 'outbound'
-        AND cc_queue IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with start and end times as parameters
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Store contacts handled outbound per queue in a dictionary
-        contacts_handled_outbound_per_queue = {row.cc_queue: row.contacts_handled_outbound for row in result if row.cc_queue is not None}
-
-        return contacts_handled_outbound_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of an error
-
-
-
-# ------------------------------------  Today(since 12 am)  ---------------------------------------------------->
-
-# today(since 12 AM interval)
-
-# Working with the cdr table.
-def fetch_unique_queue_names_for_today(db: Session, user_time_zone: str) -> list[str]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    
-    # Get today's date and set time to 00:00:00 (12 AM)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    return build_queue_series(window, step, intervals)
 
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
 
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {end_time_utc}")
+@querystats.attributed
+async def fetch_queue_export_async(window: ReportWindow) -> Iterator[dict]:
+    """Rows of the CSV/XLSX export: one per queue, however long the window."""
+    return queue_export_rows(await fetch_queue_window_totals_async(window))
 
-    # Fetch distinct queue names from the 'cdr' table
-    query = text("""
-        SELECT DISTINCT cc_queue
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-    """)
 
+@querystats.attributed
+async def fetch_queue_staffing_async(window: ReportWindow, answer_seconds: int, target_service_level: float,
+                                     max_occupancy: float = 100.0, volume_factor: float = 1.0,
+                                     aht_seconds: Optional[float] = None) -> dict:
+    """Agents needed per 15 minute interval and queue for a service level, see app/staffing.py."""
     try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} unique queues from the database.")
+        intervals = await series.fetch_window_series_async(
+            "queue_call_15m", window, staffing.STEP,
+            QUEUE_CALL_SERIES_QUERY, QUEUE_CALL_ROLLUP_SERIES_QUERY, queue_totals_from_rows)
     except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-        return []
-
-    # Collect unique queue names
-    queue_names = {row[0] for row in data}  # Using a set to ensure uniqueness
-
-    print("Unique queue names:", queue_names)  # Check what names were added
-    return list(queue_names)  # Convert set back to list if needed
-
-# Working with the cdr table.
-def fetch_service_level_60_seconds_per_queue_today(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-
-    # Get today's date and set time to 00:00:00 (12 AM)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '60 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_60_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
+        print(f"Error in fetch_queue_staffing_async ({window.kind}): {e}")
+        raise
 
-    try:
-        print(f"Executing query with start_time: {start_time_utc}, end_time: {end_time_utc}")
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
+    # CPU bound, kept off the event loop
+    return await asyncio.to_thread(staffing.build_staffing, window, intervals, answer_seconds,
+                                   target_service_level, max_occupancy, volume_factor, aht_seconds)
 
-        print(f"Query results: {results}")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"service_level_60_seconds": {"error": str(e)}}]
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_60_seconds": f"{int(row[1])}%",  # Service level as a whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels
- 
-# Working with the cdr table.
-def fetch_service_level_120_seconds_per_queue_today(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-
-    # Get today's date and set time to 00:00:00 (12 AM)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '120 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_120_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
 
+@querystats.attributed
+async def fetch_queue_concurrency_async(window: ReportWindow) -> list:
+    """Per-queue concurrent and waiting calls per minute of a window, see app/timeline.py."""
+    # cdr stamps are naive UTC
+    start_time = window.start_utc.astimezone(pytz.utc).replace(tzinfo=None)
+    end_time = window.end_utc.astimezone(pytz.utc).replace(tzinfo=None)
     try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []  # Return an empty list on error
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_120_seconds": f"{int(row[1])}%",  # Service level as a whole number
-            "total_calls": row[2]  # Total calls for the queue
+        rows = await fetch_rows_async(QUEUE_CALL_SPANS_QUERY, {
+            'start_time': start_time,
+            'end_time': end_time + timeline.LONGEST_CALL,
+            'window_start': start_time,
+            'window_end': end_time,
         })
-
-    return service_levels if service_levels else []  # Return empty list if no data
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_for_queues_today(db: Session, user_time_zone: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and set start time to today 00:00:00 (12 AM)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(COALESCE(end_stamp - answer_stamp, interval '0 seconds')) AS total_acw,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
     except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": None, "avg_time": 0, "avg_time_formatted": "00:00:00"}]
+        print(f"Error in fetch_queue_concurrency_async ({window.kind}): {e}")
+        raise
+    return timeline.build_queue_concurrency(window, rows)
 
-    avg_acw_results = []
 
-    for row in results:
-        total_acw = row[1] if row[1] is not None else timedelta(seconds=0)
-        total_calls = row[2] if row[2] is not None else 0
+# --------------------------------------- response formatting ---------------------------------->
 
-        # Calculate average ACW, handling division by zero
-        if total_calls > 0:
-            avg_acw_seconds = total_acw.total_seconds() / total_calls
-        else:
-            avg_acw_seconds = 0  # No calls, so average ACW is 0
-
-        # Convert average seconds to HH:MM:SS format
-        avg_acw_formatted = seconds_to_hms(int(avg_acw_seconds))
+def _service_levels(totals: Dict[str, dict], seconds: int) -> list[dict]:
+    column = service_level_column(seconds)
+    return [
+        {
+            "queue": queue,
+            # Rounded down to the nearest whole percent
+            f"service_level_{seconds}_seconds": f"{(row[column] * 100) // row['total_calls']}%",
+            "total_calls": row['total_calls']
+        }
+        for queue, row in totals.items()
+    ]
 
-        avg_acw_results.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_acw_seconds,
-            "avg_time_formatted": avg_acw_formatted
-        })
-
-    return avg_acw_results
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_for_queues_today(db: Session, user_time_zone: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and start time in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time - timedelta(minutes=15)
-
-    # Convert the user's local times to UTC for querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Query to fetch the average agent interaction time and total calls per queue in the last 15 minutes
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,  -- Sum of interaction time in seconds
-            COUNT(*) AS total_calls  -- Total number of calls
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL  -- Only consider answered calls
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL  -- Filter by non-null queues
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
 
+def build_queue_metrics(totals: Dict[str, dict]) -> dict:
+    """Shape per-queue totals into the schemas.QueueMetricsResponse layout."""
+    avg_after_contact_work_time = []
     avg_interaction_times = []
-
-    # Loop through the results to calculate the average interaction time per queue
-    for row in results:
-        total_interaction_time = row[1]  # Total interaction time in seconds
-        total_calls = row[2]  # Total number of calls
-
-        # Calculate the average interaction time in seconds
-        avg_interaction_seconds = total_interaction_time / total_calls if total_calls > 0 else 0
-
-        # Convert the average time to HH:MM:SS format
-        avg_interaction_formatted = seconds_to_hms(int(avg_interaction_seconds))
-
-        avg_interaction_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_interaction_seconds,
-            "avg_time_formatted": avg_interaction_formatted,
-            "total_calls": total_calls
-        })
-
-    return avg_interaction_times
-
-# Working with the cdr table.
-def fetch_average_queue_answer_time_per_queue_today(db: Session, user_time_zone: str) -> dict:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and set start time to today 00:00:00 (12 AM)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Print the time range being used for the query
-    print(f"Querying data from {start_time_utc} to {end_time_utc}")
-
-    query = text("""
-        SELECT cc_queue, AVG(EXTRACT(EPOCH FROM (answer_stamp - start_stamp))) AS avg_queue_answer_time
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Print the raw result for debugging
-        print(f"Raw result: {result}")
-
-        # Create a dictionary to store average answer time per queue
-        queue_avg_times = {}
-        for row in result:
-            queue_name = row[0]
-            avg_seconds = float(row[1]) if row[1] is not None else 0  # Convert decimal to float
-            avg_queue_answer_time = str(timedelta(seconds=avg_seconds))  # Convert to timedelta
-            queue_avg_times[queue_name] = avg_queue_answer_time
-
-        return queue_avg_times
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.    
-def fetch_average_handle_time_for_queues_today(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and set start time to today 00:00:00 (12 AM)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT 
-            cc_queue,
-            AVG(
-                (duration * INTERVAL '1 second') + (waitsec * INTERVAL '1 second') + (end_stamp - answer_stamp)
-            ) AS avg_aht,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
     avg_handle_times = []
 
-    # If no results, return a default value for every queue
-    if not results:
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    for row in results:
-        avg_aht = row[1] if row[1] is not None else timedelta(seconds=0)
-        avg_aht_seconds = avg_aht.total_seconds()
-        avg_aht_formatted = seconds_to_hms(int(avg_aht_seconds))
-
-        avg_handle_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_aht_seconds,
-            "avg_time_formatted": avg_aht_formatted,
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return avg_handle_times
-
-# Working with the cdr table.
-def fetch_contacts_handled_today(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Logging the result for debugging
-        print("Query Result for contacts handled today:", result)
-
-        # Create a dictionary to store contacts handled per queue,
-        # filtering out any rows where cc_queue is None
-        contacts_handled_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        # Return the dictionary (this should never be None)
-        return contacts_handled_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-
-# Working with the cdr table.
-def fetch_contacts_handled_incoming_today(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and set start time to today 00:00:00 (12 AM)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_incoming
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND (
-            direction = 'inbound'
-            OR bleg_uuid IS NOT NULL -- Transferred contacts
-        )
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts handled incoming per queue
-        contacts_handled_incoming_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return contacts_handled_incoming_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of error
-
-
-# Working with the cdr table.
-def fetch_contacts_queued_today(db: Session, user_time_zone: str) -> dict:
-    """
-    Fetch the number of queued contacts for each queue for the current day (from 12:00 AM today to now).
-    """
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and set start time to today 00:00:00 (12 AM) in the user's time zone
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying (though SQL's 'current_date' could handle this directly)
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    # Debugging logs to check time ranges
-    print(f"Fetching queued contacts from {start_time_utc} (UTC) to {end_time_utc} (UTC).")
-
-    query = text("""
-        SELECT cc_queue, COUNT(*) AS contacts_queued
-        FROM cdr
-        WHERE cc_queue IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= CURRENT_DATE
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query).fetchall()
-
-        # Log the raw query result for debugging
-        print(f"Query results: {result}")
-
-        # Create a dictionary to store contacts queued per queue and divide by 3
-        queue_contacts_queued = {row[0]: row[1] // 3 for row in result}  # Dividing by 3
-
-        # Log the final processed result
-        print(f"Returned contacts queued data: {queue_contacts_queued}")
-
-        return queue_contacts_queued
-
-    except Exception as e:
-        # Log any exception that occurs during the query
-        print(f"Error executing query: {e}")
-        return {}
-
-# Working with the cdr table.
-def fetch_contacts_abandoned_today(db: Session, user_time_zone: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Calculate the current time and set start time to today 00:00:00 (12 AM)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT cc_queue, COUNT(*) AS abandoned_contacts
-        FROM cdr
-        WHERE answer_stamp IS NULL
-        AND end_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        abandoned_contacts = []
-        for row in results:
-            count = row[1]
-            # Divide by 3 if count is greater than 0, else keep it 0
-            abandoned_contacts.append({
-                "queue": row[0],  # cc_queue
-                "abandoned_count": count // 3 if count > 0 else 0  # Conditional check for 0
-            })
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    return abandoned_contacts
-
-
-# Working with the cdr table.
-# def fetch_contacts_handled_outbound_today(db: Session, user_time_zone: str) -> Dict[str, int]:
-#     user_tz = pytz.timezone(user_time_zone)
-
-#     # Calculate the current time and set start time to today 00:00:00 (12 AM)
-#     now_user_time = datetime.now(user_tz)
-#     start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-
-#     # Convert to UTC for database querying
-#     start_time_utc = start_time_user_time.astimezone(pytz.utc)
-#     end_time_utc = now_user_time.astimezone(pytz.utc)
-
-#     # query = text(""" 
-#     #     SELECT COUNT(DISTINCT uuid) AS contacts_handled_outbound
-#     #     FROM cdr
-#     #     WHERE direction = 'outbound'
-#     #     AND answer_stamp IS NOT NULL
-#     #     AND timestamp >= :start_time AND timestamp <= :end_time
-#     # """)
-
-#     query = text("""
-#         SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-#         FROM cdr
-#         WHERE direction = 'outbound'
-#         AND cc_queue IS NOT NULL
-#         AND start_stamp IS NOT NULL
-#         AND end_stamp IS NOT NULL
-#         AND answer_stamp IS NULL
-#         AND timestamp >= :start_time AND timestamp <= :end_time
-#         GROUP BY cc_queue
-#     """)
-
-#     try:
-#         result = db.execute(query, {
-#             'start_time': start_time_utc,
-#             'end_time': end_time_utc
-#         }).fetchone()
-        
-#         contacts_handled_outbound = result[0] if result[0] is not None else 0
-
-#         # Return a dictionary with the appropriate format
-#         return {'total': contacts_handled_outbound}
-
-#     except Exception as e:
-#         print(f"Error executing query: {e}")
-#         return {'total': 0}  # In case of an error, return a dictionary with 'total' set to 0
-
-
-def fetch_contacts_handled_outbound_today(db: Session, user_time_zone: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-    now_user_time = datetime.now(user_tz)
-    start_time_user_time = now_user_time.replace(hour=0, minute=0, second=0, microsecond=0)
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = now_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-        FROM cdr
-        WHERE direction = 'outbound'
-        AND cc_queue IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-        
-        # Create a dictionary with queue names and counts
-        contacts_handled_outbound_per_queue = {row.cc_queue: row.contacts_handled_outbound for row in result}
-
-        return contacts_handled_outbound_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-
-# ------------------------------------------   custom date range  ---------------------------------------------->
-
-# date range metric 
-# Working with the cdr table.
-def fetch_unique_queue_names_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[str]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    print(f"Start Time (UTC): {start_time_utc}")
-    print(f"End Time (UTC): {end_time_utc}")
-
-    # Fetch distinct queue names from the 'cdr' table
-    query = text("""
-        SELECT DISTINCT cc_queue
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        })
-        data = result.fetchall()
-        print(f"Fetched {len(data)} unique queues from the database.")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    if not data:
-        print("No data found for the specified time range.")
-        return []
-
-    # Collect unique queue names
-    queue_names = {row[0] for row in data}  # Using a set to ensure uniqueness
-
-    print("Unique queue names:", queue_names)  # Check what names were added
-    return list(queue_names)  # Convert set back to list if needed
-
-
-# Working with the cdr table.
-def fetch_service_level_60_seconds_per_queue_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '60 seconds' THEN 1 ELSE 0 END) * 100.0 /
-             NULLIF(COUNT(*), 0)) AS service_level_60_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        print(f"Executing query with start_time: {start_time_utc}, end_time: {end_time_utc}")
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        print(f"Query results: {results}")
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"service_level_60_seconds": {"error": str(e)}}]
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_60_seconds": f"{int(row[1])}%",  # Service level as a whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels
-
-
-# Working with the cdr table.
-def fetch_service_level_120_seconds_per_queue_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            FLOOR(SUM(CASE WHEN (answer_stamp - start_stamp) <= interval '120 seconds' THEN 1 ELSE 0 END) * 100.0 / 
-            NULLIF(COUNT(*), 0)) AS service_level_120_seconds,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []  # Return an empty list on error
-
-    service_levels = []
-    
-    for row in results:
-        service_levels.append({
-            "queue": row[0],  # cc_queue
-            "service_level_120_seconds": f"{int(row[1])}%",  # Service level as a whole number
-            "total_calls": row[2]  # Total calls for the queue
-        })
-
-    return service_levels if service_levels else []  # Return empty list if no data
-
-# Working with the cdr table.
-def fetch_average_after_contact_work_time_for_queues_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(COALESCE(end_stamp - answer_stamp, interval '0 seconds')) AS total_acw,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": None, "avg_time": 0, "avg_time_formatted": "00:00:00"}]
-
-    avg_acw_results = []
-
-    for row in results:
-        total_acw = row[1] if row[1] is not None else timedelta(seconds=0)
-        total_calls = row[2] if row[2] is not None else 0
-
-        # Calculate average ACW, handling division by zero
-        if total_calls > 0:
-            avg_acw_seconds = total_acw.total_seconds() / total_calls
-        else:
-            avg_acw_seconds = 0  # No calls, so average ACW is 0
-
-        # Convert average seconds to HH:MM:SS format
-        avg_acw_formatted = seconds_to_hms(int(avg_acw_seconds))
-
-        avg_acw_results.append({
-            "queue": row[0],  # cc_queue
+    for queue, row in totals.items():
+        avg_acw_seconds = row['acw_seconds'] / row['total_calls']
+        avg_after_contact_work_time.append({
+            "queue": queue,
             "avg_time": avg_acw_seconds,
-            "avg_time_formatted": avg_acw_formatted
+            "avg_time_formatted": seconds_to_hms(int(avg_acw_seconds))
         })
 
-    return avg_acw_results
-
-
-# Working with the cdr table.
-def fetch_average_agent_interaction_time_for_queues_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[dict]:
-    # Set the user's timezone based on the input parameter
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    # Query to fetch the average agent interaction time and total calls per queue in the specified date range
-    query = text("""
-        SELECT 
-            cc_queue,
-            SUM(EXTRACT(EPOCH FROM (end_stamp - answer_stamp))) AS total_interaction_time,  -- Sum of interaction time in seconds
-            COUNT(*) AS total_calls  -- Total number of calls
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL  -- Only consider answered calls
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL  -- Filter by non-null queues
-        GROUP BY cc_queue
-    """)
-
-    try:
-        # Execute the query with UTC timestamps
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    avg_interaction_times = []
-
-    # Loop through the results to calculate the average interaction time per queue
-    for row in results:
-        total_interaction_time = row[1]  # Total interaction time in seconds
-        total_calls = row[2]  # Total number of calls
-
-        # Calculate the average interaction time in seconds
-        avg_interaction_seconds = total_interaction_time / total_calls if total_calls > 0 else 0
-
-        # Convert the average time to HH:MM:SS format
-        avg_interaction_formatted = seconds_to_hms(int(avg_interaction_seconds))
-
-        avg_interaction_times.append({
-            "queue": row[0],  # cc_queue
-            "avg_time": avg_interaction_seconds,
-            "avg_time_formatted": avg_interaction_formatted,
-            "total_calls": total_calls
-        })
-
-    return avg_interaction_times
-
-
-# Working with the cdr table.
-def fetch_average_queue_answer_time_per_queue_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> dict:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    # Print the time range being used for the query
-    print(f"Querying data from {start_time_utc} to {end_time_utc}")
-
-    query = text("""
-        SELECT cc_queue, AVG(EXTRACT(EPOCH FROM (answer_stamp - start_stamp))) AS avg_queue_answer_time
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Print the raw result for debugging
-        print(f"Raw result: {result}")
-
-        # Create a dictionary to store average answer time per queue
-        queue_avg_times = {}
-        for row in result:
-            queue_name = row[0]
-            avg_seconds = float(row[1]) if row[1] is not None else 0  # Convert decimal to float
-            avg_queue_answer_time = str(timedelta(seconds=avg_seconds))  # Convert to timedelta
-            queue_avg_times[queue_name] = avg_queue_answer_time
-
-        return queue_avg_times
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-
-# Working with the cdr table.
-def fetch_average_handle_time_for_queues_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT 
-            cc_queue,
-            AVG(
-                (duration * INTERVAL '1 second') + (waitsec * INTERVAL '1 second') + (end_stamp - answer_stamp)
-            ) AS avg_aht,
-            COUNT(*) AS total_calls
-        FROM cdr
-        WHERE timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    avg_handle_times = []
-
-    # If no results, return a default value for every queue
-    if not results:
-        return [{"queue": "N/A", "avg_time": 0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
-
-    for row in results:
-        avg_aht = row[1] if row[1] is not None else timedelta(seconds=0)
-        avg_aht_seconds = avg_aht.total_seconds()
-        avg_aht_formatted = seconds_to_hms(int(avg_aht_seconds))
+        if row['answered_calls'] > 0:
+            avg_interaction_seconds = row['interaction_seconds'] / row['answered_calls']
+            avg_interaction_times.append({
+                "queue": queue,
+                "avg_time": avg_interaction_seconds,
+                "avg_time_formatted": seconds_to_hms(int(avg_interaction_seconds)),
+                "total_calls": row['answered_calls']
+            })
 
+        avg_aht_seconds = row['aht_seconds'] / row['aht_calls'] if row['aht_calls'] > 0 else 0
         avg_handle_times.append({
-            "queue": row[0],  # cc_queue
+            "queue": queue,
             "avg_time": avg_aht_seconds,
-            "avg_time_formatted": avg_aht_formatted,
-            "total_calls": row[2]  # Total calls for the queue
+            "avg_time_formatted": seconds_to_hms(int(avg_aht_seconds)),
+            "total_calls": row['total_calls']
         })
 
-    return avg_handle_times
-
-
-# Working with the cdr table.
-def fetch_contacts_handled_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts handled per queue
-        contacts_handled_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return contacts_handled_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}
-
-
-# Working with the cdr table.
-def fetch_contacts_handled_incoming_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_incoming
-        FROM cdr
-        WHERE answer_stamp IS NOT NULL
-        AND (
-            direction = 'inbound'
-            OR bleg_uuid IS NOT NULL -- Transferred contacts
-        )
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts handled incoming per queue
-        contacts_handled_incoming_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return contacts_handled_incoming_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of error
-
-
-# Working with the cdr table.
-def fetch_contacts_queued_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> dict:
-    """
-    Fetch the number of queued contacts for each queue within the specified date range.
-    """
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    # Debugging logs to check time ranges
-    print(f"Fetching queued contacts from {start_time_utc} (UTC) to {end_time_utc} (UTC).")
-
-    query = text(""" 
-        SELECT cc_queue, COUNT(*) AS contacts_queued
-        FROM cdr
-        WHERE cc_queue IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Log the raw query result for debugging
-        print(f"Query results: {result}")
-
-        # Create a dictionary to store contacts queued per queue and divide by 3
-        queue_contacts_queued = {row[0]: row[1] // 3 for row in result}  # Dividing by 3
-
-        # Log the final processed result
-        print(f"Returned contacts queued data: {queue_contacts_queued}")
-
-        return queue_contacts_queued
-
-    except Exception as e:
-        # Log any exception that occurs during the query
-        print(f"Error executing query: {e}")
-        return {}
-
-
-# Working with the cdr table.
-def fetch_contacts_abandoned_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> list[dict]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    query = text(""" 
-        SELECT cc_queue, COUNT(*) AS abandoned_contacts
-        FROM cdr
-        WHERE answer_stamp IS NULL
-        AND end_stamp IS NOT NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        AND cc_queue IS NOT NULL
-        GROUP BY cc_queue
-    """)
-
-    try:
-        results = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        abandoned_contacts = []
-        for row in results:
-            count = row[1]
-            # Divide by 3 if count is greater than 0, else keep it 0
-            abandoned_contacts.append({
-                "queue": row[0],  # cc_queue
-                "abandoned_count": count // 3 if count > 0 else 0  # Conditional check for 0
-            })
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return []
-
-    return abandoned_contacts
-
-
-# Working with the cdr table.
-def fetch_contacts_handled_outbound_for_date_range(db: Session, user_time_zone: str, start_date: str, end_date: str) -> Dict[str, int]:
-    user_tz = pytz.timezone(user_time_zone)
-
-    # Convert the user-provided start and end dates to datetime objects in the user's timezone
-    start_time_user_time = datetime.fromisoformat(start_date).astimezone(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-    end_time_user_time = datetime.fromisoformat(end_date).astimezone(user_tz).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-    # Convert to UTC for database querying
-    start_time_utc = start_time_user_time.astimezone(pytz.utc)
-    end_time_utc = end_time_user_time.astimezone(pytz.utc)
-
-    # query = text(""" 
-    #     SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-    #     FROM cdr
-    #     WHERE direction = 'outbound'
-    #     AND answer_stamp IS NULL
-    #     AND timestamp >= :start_time AND timestamp <= :end_time
-    #     GROUP BY cc_queue
-    # """)
-
-    query = text("""
-        SELECT cc_queue, COUNT(DISTINCT uuid) AS contacts_handled_outbound
-        FROM cdr
-        WHERE direction = 'outbound'
-        AND cc_queue IS NOT NULL
-        AND start_stamp IS NOT NULL
-        AND end_stamp IS NOT NULL
-        AND answer_stamp IS NULL
-        AND timestamp >= :start_time AND timestamp <= :end_time
-        GROUP BY cc_queue
-    """)
-
-    try:
-        result = db.execute(query, {
-            'start_time': start_time_utc,
-            'end_time': end_time_utc
-        }).fetchall()
-
-        # Create a dictionary to store contacts handled outbound per queue
-        contacts_handled_outbound_per_queue = {row[0]: row[1] for row in result if row[0] is not None}
-
-        return contacts_handled_outbound_per_queue
-
-    except Exception as e:
-        print(f"Error executing query: {e}")
-        return {}  # Return an empty dictionary in case of error
-
-
-
-
-
-
-
+    if not avg_handle_times:
+        avg_handle_times = [{"queue": "N/A", "avg_time": 0.0, "avg_time_formatted": "00:00:00", "total_calls": 0}]
+
+    unanswered = {queue: row['unanswered_calls']
+                  for queue, row in totals.items() if row['unanswered_calls'] > 0}
+
+    return {
+        "unique_queue_names": list(totals),
+        "service_levels_60_seconds": _service_levels(totals, 60),
+        "service_levels_120_seconds": _service_levels(totals, 120),
+        "avg_after_contact_work_time": avg_after_contact_work_time,
+        "avg_interaction_times": avg_interaction_times,
+        "avg_handle_times": avg_handle_times,
+        "contacts_queued": unanswered,
+        "contacts_handled_per_queue": {queue: row['answered_calls']
+                                       for queue, row in totals.items() if row['answered_calls'] > 0},
+        "contacts_handled_incoming": {queue: row['handled_incoming']
+                                      for queue, row in totals.items() if row['handled_incoming'] > 0},
+        "contacts_handled_outbound": {queue: row['handled_outbound']
+                                      for queue, row in totals.items() if row['handled_outbound'] > 0},
+        "abandoned_contacts": [{"queue": queue, "abandoned_count": count}
+                               for queue, count in unanswered.items()],
+        "avg_queue_answer_time": {
+            queue: str(timedelta(seconds=row['answer_wait_seconds'] / row['answer_wait_calls']))
+            for queue, row in totals.items() if row['answer_wait_calls'] > 0
+        },
+    }
+
+
+def _series_entry(queue: str, row: dict) -> dict:
+    entry = {
+        "queue": queue,
+        "total_calls": row['total_calls'],
+        "answered_calls": row['answered_calls'],
+        "abandoned_count": row['unanswered_calls'],
+        "avg_handle_time": seconds_to_hms(int(row['aht_seconds'] / row['aht_calls'])) if row['aht_calls'] else "00:00:00",
+        "avg_queue_answer_time": seconds_to_hms(int(row['answer_wait_seconds'] / row['answer_wait_calls']))
+                                 if row['answer_wait_calls'] else "00:00:00",
+    }
+    for seconds in SERVICE_LEVEL_THRESHOLDS:
+        # Rounded down to the nearest whole percent, as in _service_levels
+        entry[f"service_level_{seconds}_seconds"] = \
+            f"{(row[service_level_column(seconds)] * 100) // row['total_calls']}%" if row['total_calls'] else "0%"
+    return entry
+
+
+def queue_export_rows(totals: Dict[str, dict]) -> Iterator[dict]:
+    """One flat row per queue with QUEUE_EXPORT_FIELDS, for the CSV and XLSX exports."""
+    for queue in sorted(totals):
+        row = totals[queue]
+        entry = _series_entry(queue, row)
+        entry.update({
+            "avg_after_contact_work_time": seconds_to_hms(int(row['acw_seconds'] / row['total_calls']))
+                                           if row['total_calls'] else "00:00:00",
+            "avg_interaction_time": seconds_to_hms(int(row['interaction_seconds'] / row['answered_calls']))
+                                    if row['answered_calls'] else "00:00:00",
+            "contacts_handled_incoming": row['handled_incoming'],
+            "contacts_handled_outbound": row['handled_outbound'],
+        })
+        yield entry
+
+
+def build_queue_series(window: ReportWindow, step: str, intervals: Dict[datetime, Dict[str, dict]]) -> dict:
+    """Shape per-interval totals into the schemas.QueueSeriesResponse layout, quiet intervals included."""
+    user_tz = pytz.timezone(window.user_time_zone)
+    return {
+        "status": "success",
+        "step": step,
+        "user_time_zone": window.user_time_zone,
+        "intervals": [
+            {
+                "interval_start": interval_start.astimezone(user_tz),
+                "queues": [_series_entry(queue, row) for queue, row in intervals.get(interval_start, {}).items()],
+            }
+            for interval_start in series.bucket_starts(window, step)
+        ],
+    }
@@ -0,0 +1,119 @@
+# app/crud/recordingCrud.py
+import os
+from typing import Iterator, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session, defer
+
+from app.models import Recording
+from database import SessionLocal
+
+# Bytes read from recordings.file_content per round trip while streaming
+RECORDING_CHUNK_BYTES = 256 * 1024
+
+RECORDINGS_PAGE_SIZE = 100
+
+
+# ------------------------------------------ Recordings ----------------------------------->
+
+def _recording_search(db: Session, agent: Optional[str] = None, caller_id_number: Optional[str] = None,
+                      destination_number: Optional[str] = None, queue_name: Optional[str] = None,
+                      call_log_id: Optional[str] = None):
+    # The audio itself is never needed for the list
+    query = db.query(Recording).options(defer(Recording.file_content))
+
+    # Substring matches stay index backed through the pg_trgm GIN indexes
+    # (migrations/002_recordings_search_indexes.sql)
+    for column, value in ((Recording.agent, agent),
+                          (Recording.caller_id_number, caller_id_number),
+                          (Recording.destination_number, destination_number),
+                          (Recording.queue_name, queue_name),
+                          (Recording.call_log_id, call_log_id)):
+        if value:
+            query = query.filter(column.ilike(f"%{_escape_like(value)}%", escape="\\"))
+    return query
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def fetch_recordings(db: Session, agent: Optional[str] = None, caller_id_number: Optional[str] = None,
+                     destination_number: Optional[str] = None, queue_name: Optional[str] = None,
+                     call_log_id: Optional[str] = None, limit: int = RECORDINGS_PAGE_SIZE,
+                     cursor: Optional[int] = None) -> Tuple[list, Optional[int]]:
+    """Newest recordings first, one page at a time; returns (rows, next cursor or None)."""
+    query = _recording_search(db, agent, caller_id_number, destination_number, queue_name, call_log_id)
+    if cursor is not None:
+        query = query.filter(Recording.id < cursor)
+
+    records = query.order_by(Recording.id.desc()).limit(limit + 1).all()
+    next_cursor = records[limit - 1].id if len(records) > limit else None
+    return records[:limit], next_cursor
+
+
+def estimate_recordings(db: Session, agent: Optional[str] = None, caller_id_number: Optional[str] = None,
+                        destination_number: Optional[str] = None, queue_name: Optional[str] = None,
+                        call_log_id: Optional[str] = None) -> Optional[int]:
+    """Planner estimate of the matching rows; an exact COUNT(*) would scan them all."""
+    query = _recording_search(db, agent, caller_id_number, destination_number, queue_name, call_log_id)
+    compiled = query.statement.compile(dialect=db.get_bind().dialect)
+    try:
+        plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    except Exception as e:
+        print(f"Error estimating recordings: {e}")
+        db.rollback()
+        return None
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def fetch_recording_meta(db: Session, record_id: int) -> Optional[dict]:
+    """Filename, stored file and size of a recording, without reading the audio."""
+    row = db.execute(text("""
+        SELECT id, record_filename, file_path, COALESCE(file_size, octet_length(file_content))
+        FROM recordings
+        WHERE id = :record_id
+    """), {'record_id': record_id}).first()
+
+    if row is None or not row[3]:
+        return None
+    return {'id': row[0], 'record_filename': row[1], 'file_path': row[2], 'size': row[3]}
+
+
+def recording_etag(meta: dict) -> str:
+    # Stored files are named by their SHA-256; blobs are written once, so id and size do
+    if meta['file_path']:
+        return f'"{os.path.basename(meta["file_path"])}"'
+    return f'"rec-{meta["id"]}-{meta["size"]}"'
+
+
+def iter_recording_bytes(record_id: int, start: int, end: int) -> Iterator[bytes]:
+    """Bytes start..end (inclusive) of a recording, read in chunks with substring().
+
+    Opens its own session: the generator outlives the request's get_db session.
+    """
+    query = text("""
+        SELECT substring(file_content FROM :offset FOR :length)
+        FROM recordings
+        WHERE id = :record_id
+    """)
+
+    db = SessionLocal()
+    try:
+        position = start
+        while position <= end:
+            length = min(RECORDING_CHUNK_BYTES, end - position + 1)
+            chunk = db.execute(query, {
+                'record_id': record_id,
+                'offset': position + 1,  # substring() counts from 1
+                'length': length
+            }).scalar()
+            if not chunk:
+                break
+            yield bytes(chunk)
+            position += length
+    except Exception as e:
+        print(f"Error streaming recording {record_id}: {e}")
+        raise
+    finally:
+        db.close()
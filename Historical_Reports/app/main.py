@@ -1,22 +1,25 @@
 # app/main.py
+import asyncio
 from datetime import datetime, timedelta
 import queue
-from typing import Dict, List
-from fastapi import FastAPI, Depends, HTTPException, Query, logger
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, logger
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app import schemas
-from app.crud import agentCrud, cdrCrud, loginlogoutCrud, queueCrud,agentnameCrud
-from app import utils
+from app.crud import agentCrud, cdrCrud, loginlogoutCrud, queueCrud,agentnameCrud, recordingCrud
+from app import conditional, recording_store, responses, series, staffing, timeline, utils
+from app.config import settings
+from app.cache import response_cache
+from app.querystats import query_stats
+from app.singleflight import async_report_flights
 from app.utils import seconds_to_hms
-from database import get_db
+from database import get_db, get_read_db, replica_stats
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Depends
 from sqlalchemy.orm import Session
 from database import get_db
-from .models import Recording
-from fastapi.responses import StreamingResponse
-from io import BytesIO
+from fastapi.responses import FileResponse, StreamingResponse
 
 app = FastAPI()
 
@@ -29,181 +32,78 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Or specify allowed methods like ["GET", "POST"]
     allow_headers=["*"],  # Or specify allowed headers
+    expose_headers=["X-Next-Cursor", "X-Total-Count-Estimate", "Content-Range", "ETag"],
 )
 
 
+AGENT_FIELDS_DESCRIPTION = ("Comma separated metric groups to compute, all by default; the others come back empty. "
+                            "One of: " + ", ".join(agentCrud.AGENT_METRIC_GROUPS))
+QUEUE_FIELDS_DESCRIPTION = ("Comma separated metric groups to return, all by default; the others come back empty. "
+                            "One of: " + ", ".join(queueCrud.QUEUE_METRIC_GROUPS))
+
+
+def _metric_fields(fields: Optional[str], groups) -> Optional[tuple]:
+    try:
+        return utils.parse_fields(fields, groups)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _fields_key(endpoint: str, selected: Optional[tuple]) -> str:
+    return f"{endpoint}:{','.join(selected)}" if selected else endpoint
+
+
+def _export_window(user_time_zone: str, start_date: str, end_date: str, format: str, **kwargs) -> utils.ReportWindow:
+    if format == "xlsx" and utils.xlsxwriter is None:
+        raise HTTPException(status_code=400, detail="XLSX exports need xlsxwriter installed, use format=csv")
+    try:
+        return utils.date_range_window(user_time_zone, start_date, end_date, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _export_response(request: Request, rows, fields, format: str, filename: str) -> StreamingResponse:
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    if format == "xlsx":
+        return StreamingResponse(utils.xlsx_stream(rows, fields), media_type=utils.XLSX_MEDIA_TYPE, headers=headers)
+
+    body = utils.csv_stream(rows, fields)
+    # XLSX is a zip already; CSV shrinks several times over
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = utils.gzip_stream(body)
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return StreamingResponse(body, media_type="text/csv", headers=headers)
+
+
 # app/main.py
 @app.get("/agents-performance/15-minutes-time-interval",
          response_model=schemas.AgentMetricsResponse)
-def get_agent_metrics(user_time_zone: str = Query(...),
-                      db: Session = Depends(get_db)):
+async def get_agent_metrics(request: Request, response: Response, user_time_zone: str = Query(...),
+                            fields: Optional[str] = Query(None, description=AGENT_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, agentCrud.AGENT_METRIC_GROUPS)
     try:
-        # Fetch all necessary data
-        recent_agents = agentCrud.get_recent_agent_names_last_15_minutes(
-            db, user_time_zone)
-        answer_rates = agentCrud.fetch_agent_answer_rate_last_15_minutes(
-            db, user_time_zone)
-        non_responses = agentCrud.fetch_agent_non_response_last_15_minutes(
-            db, user_time_zone)
-        on_contact_times = agentCrud.fetch_agent_on_contact_time_last_15_minutes(
-            db, user_time_zone)
-        online_times = agentCrud.fetch_agent_online_time_last_15_minutes(
-            db, user_time_zone)
-        non_productive_times = agentCrud.fetch_non_productive_time_last_15_minutes(
-            db, user_time_zone)
-        contacts_handled = agentCrud.fetch_agent_contacts_handled_last_15_minutes(
-            db, user_time_zone)
-        average_after_contact_work_time = agentCrud.fetch_average_after_contact_work_time_last_15_minutes(
-            db, user_time_zone)
-        average_agent_interaction_time = agentCrud.fetch_average_agent_interaction_time_last_15_minutes(
-            db, user_time_zone)
-        # average_agent_interaction_time = crud.fetch_average_agent_interaction_time_last_15_minutes(
-        #     db, user_time_zone)
-
-        # Format the data
-        response_data = schemas.AgentMetricsResponse(
-            recent_agents=schemas.AgentNamesResponse(agents=recent_agents),
-            answer_rates=schemas.AgentAnswerRateList(
-                status="success",
-                data=[
-                    schemas.AgentAnswerRateResponse(name=rate[0],
-                                                    agent_answer_rate=float(
-                                                        rate[1]))
-                    for rate in answer_rates
-                ]),
-            non_responses=schemas.AgentNonResponseList(agents=[
-                schemas.AgentNonResponse(name=row.name,
-                                         no_answer_count=row.no_answer_count)
-                for row in non_responses
-            ]),
-            on_contact_times=schemas.AgentOnContactTimeList(
-                status="success",
-                data=on_contact_times,
-                message="" if on_contact_times else
-                "No data available for the last 15 minutes."),
-            online_times=schemas.AgentOnlineTimeList(status="success",
-                                                     data=online_times,
-                                                     message=""),
-            non_productive_times=schemas.NonProductiveTimeList(
-                status="success",
-                data=[
-                    schemas.NonProductiveTimeResponse(
-                        name=row['name'],
-                        non_productive_time_seconds=row[
-                            'non_productive_time_seconds'])
-                    for row in non_productive_times
-                ]),
-            contacts_handled=schemas.AgentContactsHandledList(
-                status="success",
-                data=[
-                    schemas.AgentContactsHandledResponse(
-                        name=row['name'],
-                        contacts_handled=row['contacts_handled'])
-                    for row in contacts_handled
-                ]),
-            after_contact_work_time=schemas.AverageAfterContactWorkTimeList(
-                status="success",
-                data=[
-                    schemas.AverageAfterContactWorkTimeResponse(
-                        name=row['name'],
-                        average_after_contact_work_time_seconds=row[
-                            'average_after_contact_work_time_seconds'])
-                    for row in average_after_contact_work_time
-                ]),
-             agent_interaction_time=schemas.AverageAgentInteractionTimeList(
-            status="success" if average_agent_interaction_time else "error",
-            data=average_agent_interaction_time
-        ),)
-        return response_data
+        window = utils.last_minutes_window(user_time_zone, 15)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("agents-performance", selected), window),
+            lambda: agentCrud.fetch_agent_metrics_async(window, selected)),
+            states=agentCrud.reports_agent_states(selected))
 
     except Exception as e:
-        import traceback
-        print("\n? ERROR IN /agents-performance/15-minutes-time-interval ENDPOINT ?")
-        traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # to get the metrics for 30 minutes time interval
 @app.get("/agents-performance/30-minutes-time-interval",
          response_model=schemas.AgentMetricsResponse)
-def get_agent_metrics(user_time_zone: str = Query(...),
-                      db: Session = Depends(get_db)):
+async def get_agent_metrics(request: Request, response: Response, user_time_zone: str = Query(...),
+                            fields: Optional[str] = Query(None, description=AGENT_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, agentCrud.AGENT_METRIC_GROUPS)
     try:
-        # Fetch all necessary data
-        recent_agents = agentCrud.get_recent_agent_names_last_30_minutes(
-            db, user_time_zone)
-        answer_rates = agentCrud.fetch_agent_answer_rate_last_30_minutes(
-            db, user_time_zone)
-        non_responses = agentCrud.fetch_agent_non_response_last_30_minutes(
-            db, user_time_zone)
-        on_contact_times = agentCrud.fetch_agent_on_contact_time_last_30_minutes(
-            db, user_time_zone)
-        online_times = agentCrud.fetch_agent_online_time_last_30_minutes(
-            db, user_time_zone)
-        non_productive_times = agentCrud.fetch_non_productive_time_last_30_minutes(
-            db, user_time_zone)
-        contacts_handled = agentCrud.fetch_agent_contacts_handled_last_30_minutes(
-            db, user_time_zone)
-        average_after_contact_work_time = agentCrud.fetch_average_after_contact_work_time_last_30_minutes(
-            db, user_time_zone)
-        average_agent_interaction_time = agentCrud.fetch_average_agent_interaction_time_last_30_minutes(
-            db, user_time_zone)
-
-        # Format the data
-        response_data = schemas.AgentMetricsResponse(
-            recent_agents=schemas.AgentNamesResponse(agents=recent_agents),
-            answer_rates=schemas.AgentAnswerRateList(
-                status="success",
-                data=[
-                    schemas.AgentAnswerRateResponse(name=rate[0],
-                                                    agent_answer_rate=float(
-                                                        rate[1]))
-                    for rate in answer_rates
-                ]),
-            non_responses=schemas.AgentNonResponseList(agents=[
-                schemas.AgentNonResponse(name=row.name,
-                                         no_answer_count=row.no_answer_count)
-                for row in non_responses
-            ]),
-            on_contact_times=schemas.AgentOnContactTimeList(
-                status="success",
-                data=on_contact_times,
-                message="" if on_contact_times else
-                "No data available for the last 15 minutes."),
-            online_times=schemas.AgentOnlineTimeList(status="success",
-                                                     data=online_times,
-                                                     message=""),
-            non_productive_times=schemas.NonProductiveTimeList(
-                status="success",
-                data=[
-                    schemas.NonProductiveTimeResponse(
-                        name=row['name'],
-                        non_productive_time_seconds=row[
-                            'non_productive_time_seconds'])
-                    for row in non_productive_times
-                ]),
-            contacts_handled=schemas.AgentContactsHandledList(
-                status="success",
-                data=[
-                    schemas.AgentContactsHandledResponse(
-                        name=row['name'],
-                        contacts_handled=row['contacts_handled'])
-                    for row in contacts_handled
-                ]),
-            after_contact_work_time=schemas.AverageAfterContactWorkTimeList(
-                status="success",
-                data=[
-                    schemas.AverageAfterContactWorkTimeResponse(
-                        name=row['name'],
-                        average_after_contact_work_time_seconds=row[
-                            'average_after_contact_work_time_seconds'])
-                    for row in average_after_contact_work_time
-                ]),
-            agent_interaction_time=schemas.AverageAgentInteractionTimeList(
-            status="success" if average_agent_interaction_time else "error",
-            data=average_agent_interaction_time
-        ),)
-        return response_data
+        window = utils.last_minutes_window(user_time_zone, 30)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("agents-performance", selected), window),
+            lambda: agentCrud.fetch_agent_metrics_async(window, selected)),
+            states=agentCrud.reports_agent_states(selected))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -212,84 +112,15 @@ def get_agent_metrics(user_time_zone: str = Query(...),
 
 @app.get("/agents-performance/since_today",
          response_model=schemas.AgentMetricsResponse)
-def get_agent_metrics(user_time_zone: str = Query(...),
-                      db: Session = Depends(get_db)):
+async def get_agent_metrics(request: Request, response: Response, user_time_zone: str = Query(...),
+                            fields: Optional[str] = Query(None, description=AGENT_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, agentCrud.AGENT_METRIC_GROUPS)
     try:
-        # Fetch all necessary data
-        recent_agents = agentCrud.get_recent_agent_names_today(db, user_time_zone)
-        answer_rates = agentCrud.fetch_agent_answer_rate_today(db, user_time_zone)
-        non_responses = agentCrud.fetch_agent_non_response_today(db, user_time_zone)
-        on_contact_times = agentCrud.fetch_agent_on_contact_time_today(
-            db, user_time_zone)
-        online_times = agentCrud.fetch_agent_online_time_today(db, user_time_zone)
-        non_productive_times = agentCrud.fetch_non_productive_time_today(
-            db, user_time_zone)
-        contacts_handled = agentCrud.fetch_agent_contacts_handled_today(
-            db, user_time_zone)
-        average_after_contact_work_time = agentCrud.fetch_average_after_contact_work_time_today(
-            db, user_time_zone)
-        average_agent_interaction_time = agentCrud.fetch_average_agent_interaction_time_today(
-            db, user_time_zone)
-
-        # Format the data
-        response_data = schemas.AgentMetricsResponse(
-            recent_agents=schemas.AgentNamesResponse(agents=recent_agents),
-            answer_rates=schemas.AgentAnswerRateList(
-                status="success",
-                data=[
-                    schemas.AgentAnswerRateResponse(name=rate[0],
-                                                    agent_answer_rate=float(
-                                                        rate[1]))
-                    for rate in answer_rates
-                ]),
-            # non_responses=schemas.AgentNonResponseList(agents=[
-            #     schemas.AgentNonResponse(name=row.name, no_answer_count=row.no_answer_count)
-            #     for row in non_responses if row.name is not None  # Validate name
-            # ]),
-            non_responses=schemas.AgentNonResponseList(agents=[
-                schemas.AgentNonResponse(name=row.name,
-                                         no_answer_count=row.no_answer_count)
-                for row in non_responses  # No need for extra filtering here
-            ]),
-            on_contact_times=schemas.AgentOnContactTimeList(
-                status="success",
-                data=on_contact_times,
-                message=""
-                if on_contact_times else "No data available today."),
-            online_times=schemas.AgentOnlineTimeList(status="success",
-                                                     data=online_times,
-                                                     message=""),
-            non_productive_times=schemas.NonProductiveTimeList(
-                status="success",
-                data=[
-                    schemas.NonProductiveTimeResponse(
-                        name=row['name'],
-                        non_productive_time_seconds=row[
-                            'non_productive_time_seconds'])
-                    for row in non_productive_times
-                ]),
-            contacts_handled=schemas.AgentContactsHandledList(
-                status="success",
-                data=[
-                    schemas.AgentContactsHandledResponse(
-                        name=row['name'],
-                        contacts_handled=row['contacts_handled'])
-                    for row in contacts_handled
-                ]),
-            after_contact_work_time=schemas.AverageAfterContactWorkTimeList(
-                status="success",
-                data=[
-                    schemas.AverageAfterContactWorkTimeResponse(
-                        name=row['name'],
-                        average_after_contact_work_time_seconds=row[
-                            'average_after_contact_work_time_seconds'])
-                    for row in average_after_contact_work_time
-                ]),
-            agent_interaction_time=schemas.AverageAgentInteractionTimeList(
-            status="success" if average_agent_interaction_time else "error",
-            data=average_agent_interaction_time
-        ))
-        return response_data
+        window = utils.today_window(user_time_zone)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("agents-performance", selected), window),
+            lambda: agentCrud.fetch_agent_metrics_async(window, selected)),
+            states=agentCrud.reports_agent_states(selected))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -297,7 +128,9 @@ def get_agent_metrics(user_time_zone: str = Query(...),
 
 @app.get("/agents-performance/date-range",
          response_model=schemas.AgentMetricsResponse)
-def get_agent_metrics(
+async def get_agent_metrics(
+        request: Request,
+        response: Response,
         user_time_zone: str = Query(
             ..., description="User's time zone (e.g., 'UTC')"),
         start_date: str = Query(
@@ -308,95 +141,49 @@ def get_agent_metrics(
             ...,
             description="End date in ISO format (e.g., '2024-09-01T23:59:59')"
         ),
-        db: Session = Depends(get_db)):
+        fields: Optional[str] = Query(None, description=AGENT_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, agentCrud.AGENT_METRIC_GROUPS)
     try:
-        # Fetch recent agent names
-        recent_agents = agentCrud.get_recent_agent_names_for_date_range(
-            db, user_time_zone, start_date, end_date)
-
-        # Fetch non-responses
-        non_responses = agentCrud.fetch_agent_non_response_for_date_range(
-            db, user_time_zone, start_date, end_date)
-
-        # Fetch answer rates
-        answer_rates = agentCrud.fetch_agent_answer_rate_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        formatted_answer_rates = [
-            schemas.AgentAnswerRateResponse(name=row[0],
-                                            agent_answer_rate=row[1])
-            for row in answer_rates
-        ]
-
-        # Fetch on-contact time
-        contact_times = agentCrud.fetch_agent_on_contact_time_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        formatted_contact_times = [
-            schemas.AgentOnContactTime(name=agent["name"],
-                                       total_on_contact_time_seconds=agent[
-                                           "total_on_contact_time_seconds"])
-            for agent in contact_times
-        ]
-
-        # Fetch online time
-        online_times = agentCrud.fetch_agent_online_time_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        formatted_online_times = [
-            schemas.AgentOnlineTime(name=agent["name"],
-                                    online_time=agent["online_time"])
-            for agent in online_times
-        ]
-
-        # Fetch non-productive time
-        non_productive_times = agentCrud.fetch_non_productive_time_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        formatted_non_productive_times = [
-            schemas.NonProductiveTimeResponse(
-                name=agent["name"],
-                non_productive_time_seconds=agent[
-                    "non_productive_time_seconds"])
-            for agent in non_productive_times
-        ]
-
-        # Fetch contacts handled
-        contacts_handled_data = agentCrud.fetch_agent_contacts_handled_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        formatted_contacts_handled = [
-            schemas.AgentContactsHandledResponse(
-                name=agent["name"], contacts_handled=agent["contacts_handled"])
-            for agent in contacts_handled_data
-        ]
-        # Fetch average after contact work time
-        average_after_contact_work_time = agentCrud.fetch_average_after_contact_work_time_for_date_range(
-            db, user_time_zone, start_date, end_date)
-
-        # Fetch average agent interaction time
-        average_agent_interaction_time = agentCrud.fetch_average_agent_interaction_time_for_date_range(
-            db, user_time_zone, start_date, end_date)
-
-        # Construct the consolidated response
-        response_data = schemas.AgentMetricsResponse(
-            recent_agents=schemas.AgentNamesResponse(agents=recent_agents),
-            answer_rates=schemas.AgentAnswerRateList(
-                status="success", data=formatted_answer_rates),
-            non_responses=schemas.AgentNonResponseList(agents=non_responses),
-            on_contact_times=schemas.AgentOnContactTimeList(
-                status="success", data=formatted_contact_times, message=""),
-            online_times=schemas.AgentOnlineTimeList(
-                status="success", data=formatted_online_times, message=""),
-            non_productive_times=schemas.NonProductiveTimeList(
-                status="success", data=formatted_non_productive_times),
-            contacts_handled=schemas.AgentContactsHandledList(
-                status="success", data=formatted_contacts_handled),
-            after_contact_work_time=schemas.AverageAfterContactWorkTimeList(
-                status="success",
-                data=average_after_contact_work_time,
-                message="Data fetched successfully."),
-            agent_interaction_time=schemas.AverageAgentInteractionTimeList(
-                status="success",
-                data=average_agent_interaction_time,
-                message="Data fetched successfully."))
-        return response_data
+        window = utils.date_range_window(user_time_zone, start_date, end_date)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("agents-performance", selected), window),
+            lambda: agentCrud.fetch_agent_metrics_async(window, selected)),
+            states=agentCrud.reports_agent_states(selected))
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+@app.get("/agents-performance/date-range/export")
+async def export_agent_metrics(request: Request,
+                               user_time_zone: str = Query(...),
+                               start_date: str = Query(..., description="Start date in ISO format"),
+                               end_date: str = Query(..., description="End date in ISO format"),
+                               format: str = Query("csv", pattern="^(csv|xlsx)$")):
+    window = _export_window(user_time_zone, start_date, end_date, format)
+    try:
+        rows = await agentCrud.fetch_agent_export_async(window)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _export_response(request, rows, agentCrud.AGENT_EXPORT_FIELDS, format, "agent-report")
+
+
+@app.get("/agents-performance/series", response_model=schemas.AgentSeriesResponse)
+async def get_agent_series(request: Request, response: Response,
+                           user_time_zone: str = Query(...),
+                           start_date: str = Query(..., description="Start date in ISO format"),
+                           end_date: str = Query(..., description="End date in ISO format"),
+                           step: str = Query("15m", pattern="^(15m|30m|1h)$")):
+    try:
+        window = utils.date_range_window(user_time_zone, start_date, end_date)
+        series.bucket_starts(window, step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(f"agents-series:{step}", window),
+            lambda: agentCrud.fetch_agent_series_async(window, step)))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -405,50 +192,14 @@ def get_agent_metrics(
 
 @app.get("/queue-metrics/15-minutes-time-interval",
          response_model=schemas.QueueMetricsResponse)
-def get_queue_metrics(user_time_zone: str = Query(...),
-                      db: Session = Depends(get_db)):
+async def get_queue_metrics(request: Request, response: Response, user_time_zone: str = Query(...),
+                            fields: Optional[str] = Query(None, description=QUEUE_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, queueCrud.QUEUE_METRIC_GROUPS)
     try:
-        # Fetch all necessary data
-        unique_queue_names = queueCrud.fetch_unique_queue_names(db, user_time_zone)
-        service_levels_60_seconds = queueCrud.fetch_service_level_60_seconds_per_queue_last_15_minutes(
-            db, user_time_zone)
-        service_levels_120_seconds = queueCrud.fetch_service_level_120_seconds_per_queue_last_15_minutes(
-            db, user_time_zone)
-        avg_after_contact_work_time = queueCrud.fetch_average_after_contact_work_time_for_queues(
-            db, user_time_zone)
-        avg_queue_answer_time = queueCrud.fetch_average_queue_answer_time_per_queue(
-            db, user_time_zone)
-        avg_interaction_times = queueCrud.fetch_average_agent_interaction_time_for_queues(
-            db, user_time_zone)
-        avg_handle_times = queueCrud.fetch_average_handle_time_for_queues(
-            db, user_time_zone)
-        contacts_queued = queueCrud.fetch_contacts_queued(db, user_time_zone)
-        contacts_handled_per_queue = queueCrud.fetch_contacts_handled_per_queue(
-            db, user_time_zone)
-        contacts_handled_incoming = queueCrud.fetch_contacts_handled_incoming(
-            db, user_time_zone)
-        contacts_handled_outbound = queueCrud.fetch_contacts_handled_outbound(
-            db, user_time_zone)
-        abandoned_contacts = queueCrud.fetch_contacts_abandoned(db, user_time_zone)
-
-        # Format the response data
-        response_data = schemas.QueueMetricsResponse(
-            unique_queue_names=unique_queue_names,
-            service_levels_60_seconds=service_levels_60_seconds,
-            service_levels_120_seconds=service_levels_120_seconds,
-            avg_after_contact_work_time=avg_after_contact_work_time,
-            avg_interaction_times=avg_interaction_times,
-            avg_handle_times=avg_handle_times,
-            contacts_queued=contacts_queued,
-            contacts_handled_per_queue=contacts_handled_per_queue,
-            contacts_handled_incoming=contacts_handled_incoming,
-            contacts_handled_outbound=contacts_handled_outbound,
-            abandoned_contacts=abandoned_contacts,
-            average_queue_answer_times=
-            avg_queue_answer_time  # Add average_queue_answer_times
-        )
-
-        return response_data
+        window = utils.last_minutes_window(user_time_zone, 15)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("queue-metrics", selected), window),
+            lambda: queueCrud.fetch_queue_metrics_async(window, selected)))
 
     except Exception as e:
         # Handle any errors that may arise
@@ -458,108 +209,28 @@ def get_queue_metrics(user_time_zone: str = Query(...),
 
 @app.get("/queue-metrics/30-minutes-time-interval",
          response_model=schemas.QueueMetricsResponse)
-def get_queue_metrics_for_last_30_minutes(user_time_zone: str = Query(...),
-                                          db: Session = Depends(get_db)):
+async def get_queue_metrics_for_last_30_minutes(request: Request, response: Response, user_time_zone: str = Query(...),
+                                                fields: Optional[str] = Query(None, description=QUEUE_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, queueCrud.QUEUE_METRIC_GROUPS)
     try:
-        # Fetch all necessary data
-        unique_queue_names = queueCrud.fetch_unique_queue_names_for_30_minutes(
-            db, user_time_zone)
-        service_levels_60_seconds = queueCrud.fetch_service_level_60_seconds_per_queue_last_30_minutes(
-            db, user_time_zone)
-        service_levels_120_seconds = queueCrud.fetch_service_level_120_seconds_per_queue_last_30_minutes(
-            db, user_time_zone)
-        avg_after_contact_work_time = queueCrud.fetch_average_after_contact_work_time_for_queues_last_30_minutes(
-            db, user_time_zone)
-        avg_interaction_times = queueCrud.fetch_average_agent_interaction_time_for_queues_last_30_minutes(
-            db, user_time_zone)
-        avg_handle_times = queueCrud.fetch_average_handle_time_for_queues_last_30_minutes(
-            db, user_time_zone)
-        contacts_queued = queueCrud.fetch_contacts_queued_last_30_minutes(
-            db, user_time_zone)
-        contacts_handled_per_queue = queueCrud.fetch_contacts_handled_last_30_minutes_per_queue(
-            db, user_time_zone)
-        contacts_handled_incoming = queueCrud.fetch_contacts_handled_incoming_last_30_minutes(
-            db, user_time_zone)
-        contacts_handled_outbound = queueCrud.fetch_contacts_handled_outbound_last_30_minutes(
-            db, user_time_zone)
-        abandoned_contacts = queueCrud.fetch_contacts_abandoned_last_30_minutes(
-            db, user_time_zone)
-        avg_queue_answer_time = queueCrud.fetch_average_queue_answer_time_per_queue_last_30_minutes(
-            db, user_time_zone)
-
-        # Format the response data
-        response_data = {
-            "unique_queue_names": unique_queue_names,
-            "service_levels_60_seconds": service_levels_60_seconds,
-            "service_levels_120_seconds": service_levels_120_seconds,
-            "avg_after_contact_work_time": avg_after_contact_work_time,
-            "avg_interaction_times": avg_interaction_times,
-            "avg_handle_times": avg_handle_times,
-            "contacts_queued": contacts_queued,
-            "contacts_handled_per_queue": contacts_handled_per_queue,
-            "contacts_handled_incoming": contacts_handled_incoming,
-            "contacts_handled_outbound": contacts_handled_outbound,
-            "abandoned_contacts": abandoned_contacts,
-            "avg_queue_answer_time": avg_queue_answer_time
-        }
-
-        return response_data
+        window = utils.last_minutes_window(user_time_zone, 30)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("queue-metrics", selected), window),
+            lambda: queueCrud.fetch_queue_metrics_async(window, selected)))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/queue-metrics/today", response_model=schemas.QueueMetricsResponse)
-def get_queue_metrics_for_Today(user_time_zone: str = Query(...),
-                                db: Session = Depends(get_db)):
+async def get_queue_metrics_for_Today(request: Request, response: Response, user_time_zone: str = Query(...),
+                                      fields: Optional[str] = Query(None, description=QUEUE_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, queueCrud.QUEUE_METRIC_GROUPS)
     try:
-        # Fetch all necessary data
-        unique_queue_names = queueCrud.fetch_unique_queue_names_for_today(
-            db, user_time_zone)
-        service_levels_60_seconds = queueCrud.fetch_service_level_60_seconds_per_queue_today(
-            db, user_time_zone)
-        service_levels_120_seconds = queueCrud.fetch_service_level_120_seconds_per_queue_today(
-            db, user_time_zone)
-        avg_after_contact_work_time = queueCrud.fetch_average_after_contact_work_time_for_queues_today(
-            db, user_time_zone)
-        avg_interaction_times = queueCrud.fetch_average_agent_interaction_time_for_queues_today(
-            db, user_time_zone)
-        avg_handle_times = queueCrud.fetch_average_handle_time_for_queues_today(
-            db, user_time_zone)
-        contacts_queued = queueCrud.fetch_contacts_queued_today(
-            db, user_time_zone)
-        contacts_queued = queueCrud.fetch_contacts_queued_today(db, user_time_zone)
-        contacts_handled_per_queue = queueCrud.fetch_contacts_handled_today(
-            db, user_time_zone)
-        contacts_handled_incoming = queueCrud.fetch_contacts_handled_incoming_today(
-            db, user_time_zone)
-        contacts_handled_outbound = queueCrud.fetch_contacts_handled_outbound_today(
-            db, user_time_zone)
-        abandoned_contacts = queueCrud.fetch_contacts_abandoned_today(
-            db, user_time_zone)
-        avg_queue_answer_time = queueCrud.fetch_average_queue_answer_time_per_queue_today(
-            db, user_time_zone)
-
-        # Check if contacts_handled_per_queue is None and set to an empty dict if so
-        if contacts_handled_per_queue is None:
-            contacts_handled_per_queue = {}
-
-        # Format the response data
-        response_data = schemas.QueueMetricsResponse(
-            unique_queue_names=unique_queue_names,
-            service_levels_60_seconds=service_levels_60_seconds,
-            service_levels_120_seconds=service_levels_120_seconds,
-            avg_after_contact_work_time=avg_after_contact_work_time,
-            avg_interaction_times=avg_interaction_times,
-            avg_handle_times=avg_handle_times,
-            contacts_queued=contacts_queued,
-            contacts_handled_per_queue=contacts_handled_per_queue,
-            contacts_handled_incoming=contacts_handled_incoming,
-            contacts_handled_outbound=contacts_handled_outbound,
-            abandoned_contacts=abandoned_contacts,
-            avg_queue_answer_time=avg_queue_answer_time)
-
-        return response_data
+        window = utils.today_window(user_time_zone)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("queue-metrics", selected), window),
+            lambda: queueCrud.fetch_queue_metrics_async(window, selected)))
 
     except Exception as e:
         raise HTTPException(status_code=500,
@@ -568,10 +239,12 @@ def get_queue_metrics_for_Today(user_time_zone: str = Query(...),
 
 @app.get("/api/queue-metrics/daterange",
          response_model=schemas.QueueMetricsResponse)
-async def get_queue_metrics(user_time_zone: str,
+async def get_queue_metrics(request: Request, response: Response,
+                            user_time_zone: str,
                             start_date: str,
                             end_date: str,
-                            db: Session = Depends(get_db)):
+                            fields: Optional[str] = Query(None, description=QUEUE_FIELDS_DESCRIPTION)):
+    selected = _metric_fields(fields, queueCrud.QUEUE_METRIC_GROUPS)
     # Validate input dates
     try:
         datetime.fromisoformat(start_date)
@@ -583,63 +256,150 @@ async def get_queue_metrics(user_time_zone: str,
         )
 
     try:
-        # Fetch all required metrics
-        unique_queue_names = queueCrud.fetch_unique_queue_names_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        service_levels_60_seconds = queueCrud.fetch_service_level_60_seconds_per_queue_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        service_levels_120_seconds = queueCrud.fetch_service_level_120_seconds_per_queue_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        avg_after_contact_work_time = queueCrud.fetch_average_after_contact_work_time_for_queues_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        avg_interaction_times = queueCrud.fetch_average_agent_interaction_time_for_queues_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        avg_handle_times = queueCrud.fetch_average_handle_time_for_queues_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        contacts_queued = queueCrud.fetch_contacts_queued_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        contacts_handled_per_queue = queueCrud.fetch_contacts_handled_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        contacts_handled_incoming = queueCrud.fetch_contacts_handled_incoming_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        contacts_handled_outbound = queueCrud.fetch_contacts_handled_outbound_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        abandoned_contacts = queueCrud.fetch_contacts_abandoned_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        avg_queue_answer_time = queueCrud.fetch_average_queue_answer_time_per_queue_for_date_range(
-            db, user_time_zone, start_date, end_date)
-        # Create the response model
-        return schemas.QueueMetricsResponse(
-            unique_queue_names=unique_queue_names,
-            service_levels_60_seconds=service_levels_60_seconds,
-            service_levels_120_seconds=service_levels_120_seconds,
-            avg_after_contact_work_time=avg_after_contact_work_time,
-            avg_interaction_times=avg_interaction_times,
-            avg_handle_times=avg_handle_times,
-            contacts_queued=contacts_queued,
-            contacts_handled_per_queue=contacts_handled_per_queue,
-            contacts_handled_incoming=contacts_handled_incoming,
-            contacts_handled_outbound=contacts_handled_outbound,
-            abandoned_contacts=abandoned_contacts,
-            avg_queue_answer_time=avg_queue_answer_time)
+        window = utils.date_range_window(user_time_zone, start_date, end_date, whole_days=True)
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(_fields_key("queue-metrics", selected), window),
+            lambda: queueCrud.fetch_queue_metrics_async(window, selected)))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/queue-metrics/daterange/export")
+async def export_queue_metrics(request: Request,
+                               user_time_zone: str = Query(...),
+                               start_date: str = Query(..., description="Start date in ISO format"),
+                               end_date: str = Query(..., description="End date in ISO format"),
+                               format: str = Query("csv", pattern="^(csv|xlsx)$")):
+    window = _export_window(user_time_zone, start_date, end_date, format, whole_days=True)
+    try:
+        rows = await queueCrud.fetch_queue_export_async(window)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _export_response(request, rows, queueCrud.QUEUE_EXPORT_FIELDS, format, "queue-report")
+
+
+@app.get("/queue-metrics/series", response_model=schemas.QueueSeriesResponse)
+async def get_queue_series(request: Request, response: Response,
+                           user_time_zone: str = Query(...),
+                           start_date: str = Query(..., description="Start date in ISO format"),
+                           end_date: str = Query(..., description="End date in ISO format"),
+                           step: str = Query("15m", pattern="^(15m|30m|1h)$")):
+    try:
+        window = utils.date_range_window(user_time_zone, start_date, end_date)
+        series.bucket_starts(window, step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(f"queue-series:{step}", window),
+            lambda: queueCrud.fetch_queue_series_async(window, step)))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------------------     Capacity      --------------------------------------->
+
+@app.get("/capacity/concurrency", response_model=schemas.ConcurrencyTimelineResponse)
+async def get_concurrency_timeline(request: Request,
+                                   user_time_zone: str = Query(...),
+                                   start_date: str = Query(..., description="Start date in ISO format"),
+                                   end_date: str = Query(..., description="End date in ISO format")):
+    try:
+        window = utils.date_range_window(user_time_zone, start_date, end_date)
+        timeline.minute_grid(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def compute():
+        queues, agents = await asyncio.gather(queueCrud.fetch_queue_concurrency_async(window),
+                                              agentCrud.fetch_agent_occupancy_async(window))
+        return timeline.build_timeline(window, queues, agents)
+
+    try:
+        # No ETag: calls still up at the end of the window land in cdr after it
+        return responses.report_response(request, await response_cache.get_or_compute_async(
+            response_cache.report_key("capacity-concurrency", window), compute))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/capacity/staffing", response_model=schemas.StaffingResponse)
+async def get_staffing(request: Request, response: Response,
+                       user_time_zone: str = Query(...),
+                       start_date: str = Query(..., description="Start date in ISO format"),
+                       end_date: str = Query(..., description="End date in ISO format"),
+                       service_level_seconds: int = Query(queueCrud.SERVICE_LEVEL_THRESHOLDS[0], ge=1,
+                                                          description="Answer within this many seconds"),
+                       target_service_level: float = Query(80.0, gt=0, lt=100,
+                                                           description="Percent of calls to answer in time"),
+                       max_occupancy: float = Query(100.0, ge=50, le=100,
+                                                    description="Highest percent of agent time on calls"),
+                       volume_factor: float = Query(1.0, gt=0, le=10,
+                                                    description="What-if: scale the calls of every interval"),
+                       aht_seconds: Optional[float] = Query(None, gt=0,
+                                                            description="What-if: handle time instead of the measured one")):
+    try:
+        window = utils.date_range_window(user_time_zone, start_date, end_date)
+        series.bucket_starts(window, staffing.STEP)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    scenario = f"{service_level_seconds}:{target_service_level}:{max_occupancy}:{volume_factor}:{aht_seconds}"
+    try:
+        return await conditional.conditional_report(request, response, window, lambda: response_cache.get_or_compute_async(
+            response_cache.report_key(f"capacity-staffing:{scenario}", window),
+            lambda: queueCrud.fetch_queue_staffing_async(window, service_level_seconds, target_service_level,
+                                                         max_occupancy, volume_factor, aht_seconds)))
+    except ValueError as e:
+        # More agents than the solver sizes
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------------------     debug      --------------------------------------->
+
+@app.get("/debug/cache-stats")
+def get_cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/debug/singleflight-stats")
+def get_singleflight_stats():
+    return {"async": async_report_flights.stats()}
+
+
+@app.get("/debug/today-stats")
+async def get_today_stats():
+    # On the event loop, where the aggregators change
+    return {"agents": agentCrud.agent_call_today.stats(), "queues": queueCrud.queue_call_today.stats()}
+
+
+@app.get("/debug/query-stats")
+def get_query_stats(reset: bool = Query(False, description="Start counting afresh after this snapshot")):
+    return query_stats.snapshot(reset=reset)
+
+
+@app.get("/debug/replica-stats")
+def get_replica_stats():
+    return replica_stats()
+
+
 # ----------------------------------------     login/logout      --------------------------------------->
 
 
 @app.get("/agents-login-logout/today", response_model=schemas.AgentLoginLogoutList)
-def get_agent_login_logout_today(user_time_zone: str = Query(...), db: Session = Depends(get_db)):
+def get_agent_login_logout_today(request: Request, user_time_zone: str = Query(...), db: Session = Depends(get_read_db)):
     try:
         # Fetch the login/logout data for today
         login_logout_data = loginlogoutCrud.fetch_agent_login_logout_today(db, user_time_zone)
 
         if not login_logout_data:
-            return schemas.AgentLoginLogoutList(status="success", data=[], message="No data available for today.")
+            return responses.report_response(request, {"status": "success", "data": [], "message": "No data available for today."})
         
         # Return success message when data is available
-        return schemas.AgentLoginLogoutList(status="success", data=login_logout_data, message="Data retrieved successfully.")
+        return responses.report_response(request, {"status": "success", "data": login_logout_data, "message": "Data retrieved successfully."})
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -647,20 +407,21 @@ def get_agent_login_logout_today(user_time_zone: str = Query(...), db: Session =
 
 
 @app.get("/agents-performance/login_logout_custom_range", response_model=schemas.AgentLoginLogoutList)
-def get_agent_login_logout_for_date_range(user_time_zone: str = Query(...),
+def get_agent_login_logout_for_date_range(request: Request,
+                                          user_time_zone: str = Query(...),
                                           start_date: str = Query(...),
                                           end_date: str = Query(...),
-                                          db: Session = Depends(get_db)):
+                                          db: Session = Depends(get_read_db)):
     try:
         # Fetch agent login/logout data for the custom date range
         login_logout_data = loginlogoutCrud.fetch_agent_login_logout_for_date_range(db, user_time_zone, start_date, end_date)
 
         # Check if there is no data available for the given date range
         if not login_logout_data:
-            return schemas.AgentLoginLogoutList(status="success", data=[], message="No data available for the selected date range.")
+            return responses.report_response(request, {"status": "success", "data": [], "message": "No data available for the selected date range."})
         
         # Return the response with the retrieved data and a success message
-        return schemas.AgentLoginLogoutList(status="success", data=login_logout_data, message="Data retrieved successfully for the selected date range.")
+        return responses.report_response(request, {"status": "success", "data": login_logout_data, "message": "Data retrieved successfully for the selected date range."})
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -671,33 +432,63 @@ def get_agent_login_logout_for_date_range(user_time_zone: str = Query(...),
 # ------------------------------------------ CDR Reports ----------------------------------->
 
 @app.get("/cdr-reports/today", response_model=schemas.CDRReportList)
-def get_cdr_today(user_time_zone: str = Query(...), db: Session = Depends(get_db)):
+def get_cdr_today(request: Request, user_time_zone: str = Query(...), db: Session = Depends(get_read_db)):
     try:
         cdr_data = cdrCrud.fetch_cdr_today(db, user_time_zone)
         if not cdr_data:
-            return schemas.CDRReportList(status="success", data=[], message="No CDR data found for today.")
-        return schemas.CDRReportList(status="success", data=cdr_data, message="CDR data fetched successfully.")
+            return responses.report_response(request, {"status": "success", "data": [], "message": "No CDR data found for today.",
+                                                       "next_cursor": None})
+        return responses.report_response(request, {"status": "success", "data": cdr_data, "message": "CDR data fetched successfully.",
+                                                   "next_cursor": None})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/cdr-reports/custom-range", response_model=schemas.CDRReportList)
-def get_cdr_custom_range(user_time_zone: str = Query(...),
+def get_cdr_custom_range(request: Request,
+                         user_time_zone: str = Query(...),
                          start_date: str = Query(...),
                          end_date: str = Query(...),
-                         db: Session = Depends(get_db)):
+                         limit: Optional[int] = Query(None, ge=1, le=10000,
+                                                      description="Page size; pages are walked with next_cursor"),
+                         cursor: Optional[str] = Query(None),
+                         format: str = Query("json", pattern="^(json|ndjson|csv)$",
+                                             description="ndjson and csv stream every row of the range"),
+                         db: Session = Depends(get_read_db)):
     try:
-        cdr_data = cdrCrud.fetch_cdr_custom_range(db, user_time_zone, start_date, end_date)
+        datetime.fromisoformat(start_date)
+        datetime.fromisoformat(end_date)
+        if cursor:
+            cdrCrud.decode_cdr_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        if format == "ndjson":
+            rows = cdrCrud.iter_cdr_custom_range(user_time_zone, start_date, end_date)
+            return StreamingResponse(utils.ndjson_stream(rows), media_type="application/x-ndjson")
+        if format == "csv":
+            rows = cdrCrud.iter_cdr_custom_range(user_time_zone, start_date, end_date)
+            return StreamingResponse(utils.csv_stream(rows, cdrCrud.CDR_REPORT_FIELDS), media_type="text/csv",
+                                     headers={"Content-Disposition": 'attachment; filename="cdr-report.csv"'})
+
+        next_cursor = None
+        if limit:
+            cdr_data, next_cursor = cdrCrud.fetch_cdr_page(db, user_time_zone, start_date, end_date, limit, cursor)
+        else:
+            cdr_data = cdrCrud.fetch_cdr_custom_range(db, user_time_zone, start_date, end_date)
         if not cdr_data:
-            return schemas.CDRReportList(status="success", data=[], message="No CDR data found for selected date range.")
-        return schemas.CDRReportList(status="success", data=cdr_data, message="CDR data fetched successfully.")
+            return responses.report_response(request, {"status": "success", "data": [],
+                                                       "message": "No CDR data found for selected date range.",
+                                                       "next_cursor": None})
+        return responses.report_response(request, {"status": "success", "data": cdr_data,
+                                                   "message": "CDR data fetched successfully.", "next_cursor": next_cursor})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
     
 
 @app.get("/agents", response_model=schemas.AgentListResponse)
-def get_all_agents(db: Session = Depends(get_db)):
+def get_all_agents(db: Session = Depends(get_read_db)):
     try:
         data = agentnameCrud.get_all_agents(db)
         if not data:
@@ -708,27 +499,26 @@ def get_all_agents(db: Session = Depends(get_db)):
 
 @app.get("/api/recordings")
 def get_recordings(
+    response: Response,
     agent: str = Query(None),
     caller_id_number: str = Query(None),
     destination_number: str = Query(None),
     queue_name: str = Query(None),
     call_log_id: str = Query(None),   # ? correctly added
-    db: Session = Depends(get_db)
+    limit: int = Query(recordingCrud.RECORDINGS_PAGE_SIZE, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, description="X-Next-Cursor of the previous page"),
+    db: Session = Depends(get_read_db)
 ):
-    query = db.query(Recording)
+    filters = (agent, caller_id_number, destination_number, queue_name, call_log_id)
+    records, next_cursor = recordingCrud.fetch_recordings(db, *filters, limit=limit, cursor=cursor)
 
-    if agent:
-        query = query.filter(Recording.agent.ilike(f"%{agent}%"))
-    if caller_id_number:
-        query = query.filter(Recording.caller_id_number.ilike(f"%{caller_id_number}%"))
-    if destination_number:
-        query = query.filter(Recording.destination_number.ilike(f"%{destination_number}%"))
-    if queue_name:
-        query = query.filter(Recording.queue_name.ilike(f"%{queue_name}%"))
-    if call_log_id:
-        query = query.filter(Recording.call_log_id.ilike(f"%{call_log_id}%"))  # ? correct column
-
-    records = query.all()
+    # The body stays a plain list; paging travels in headers
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    if cursor is None:
+        estimate = recordingCrud.estimate_recordings(db, *filters)
+        if estimate is not None:
+            response.headers["X-Total-Count-Estimate"] = str(estimate)
 
     output = []
     for r in records:
@@ -748,21 +538,55 @@ def get_recordings(
 
 
 @app.get("/api/recordings/play/{record_id}")
-def play_recording(record_id: str, db: Session = Depends(get_db)):
-    rec = db.query(Recording).filter(Recording.id == record_id).first()
-
-    if not rec or not rec.file_content:
+def play_recording(record_id: int, request: Request, db: Session = Depends(get_db)):
+    meta = recordingCrud.fetch_recording_meta(db, record_id)
+    if not meta:
         raise HTTPException(status_code=404, detail="Recording not found")
 
-    audio_bytes = rec.file_content
-    file_size = len(audio_bytes)
+    size = meta["size"]
+    etag = recordingCrud.recording_etag(meta)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=86400",
+        "Content-Disposition": f'attachment; filename="{meta["record_filename"]}"'  # ? ENABLE DOWNLOAD
+    }
+
+    if conditional.etag_matches(etag, request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+
+    # Moved to the file store: nginx or the file response deal with ranges themselves
+    if meta["file_path"]:
+        if settings.RECORDINGS_ACCEL_PREFIX:
+            headers["X-Accel-Redirect"] = settings.RECORDINGS_ACCEL_PREFIX + meta["file_path"]
+            return Response(media_type="audio/mpeg", headers=headers)
+        return FileResponse(recording_store.absolute_path(meta["file_path"]),
+                            media_type="audio/mpeg", headers=headers)
+
+    # A Range is only honoured while the client's copy is still this one. recordings
+    # rows carry no timestamp, so the blob is validated by its ETag alone (it is written
+    # once): with no Last-Modified sent, a date in If-Range cannot be checked and the
+    # whole file is sent, and If-Modified-Since is ignored, as RFC 9110 has it.
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None
+
+    try:
+        byte_range = utils.parse_byte_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", **headers})
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
 
+    headers["Content-Length"] = str(end - start + 1)
     return StreamingResponse(
-        BytesIO(audio_bytes),
+        recordingCrud.iter_recording_bytes(record_id, start, end),
+        status_code=status_code,
         media_type="audio/mpeg",
-        headers={
-            "Content-Length": str(file_size),                # ? REQUIRED
-            "Accept-Ranges": "bytes",                        # ? REQUIRED FOR SEEK
-            "Content-Disposition": f'attachment; filename="{rec.record_filename}"'  # ? ENABLE DOWNLOAD
-        }
+        headers=headers
     )
@@ -1,4 +1,4 @@
-from sqlalchemy import INTEGER, TIMESTAMP, Column, ForeignKey, Integer, String, Float, DateTime, Time, BigInteger
+from sqlalchemy import INTEGER, TIMESTAMP, Boolean, Column, ForeignKey, Index, Integer, String, Float, DateTime, Time, BigInteger, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -196,4 +196,95 @@ class Recording(Base):
     record_filename = Column(String)
     file_content = Column(String)
     queue_name = Column(String)
+    # Set once the audio has moved to the file store, relative to RECORDINGS_STORE_DIR
+    file_path = Column(String, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
 
+
+
+# ------------------------------------------ 15 minute rollups ----------------------------------->
+
+class CallFact(Base):
+    """One row per call, merged from its cdr legs (see app/call_facts.py)."""
+    __tablename__ = "call_facts"
+
+    # uuid of the a-leg
+    call_uuid = Column(String, primary_key=True)
+    # Naive UTC, like cdr.timestamp
+    timestamp = Column(TIMESTAMP, index=True)
+    direction = Column(String)
+    cc_agent = Column(String)
+    cc_queue = Column(String)
+    start_stamp = Column(TIMESTAMP)
+    answer_stamp = Column(TIMESTAMP)
+    end_stamp = Column(TIMESTAMP)
+    duration = Column(INTEGER)
+    billsec = Column(INTEGER)
+    waitsec = Column(INTEGER)
+    legs = Column(Integer, nullable=False, default=1)
+    bridged = Column(Boolean, nullable=False, default=False)
+    wait_seconds = Column(Float)
+    talk_seconds = Column(Float)
+    # "answered", "abandoned" or, for outbound calls, "unanswered"
+    outcome = Column(String)
+
+
+class AgentCallRollup(Base):
+    __tablename__ = "agent_call_rollup_15m"
+
+    bucket_start = Column(TIMESTAMP, primary_key=True)
+    cc_agent = Column(String, primary_key=True)
+    calls_answered = Column(Integer, nullable=False, default=0)
+    calls_missed = Column(Integer, nullable=False, default=0)
+    unanswered_calls = Column(Integer, nullable=False, default=0)
+    contacts_handled = Column(Integer, nullable=False, default=0)
+    talk_calls = Column(Integer, nullable=False, default=0)
+    talk_seconds = Column(Float, nullable=False, default=0)
+
+
+class QueueCallRollup(Base):
+    __tablename__ = "queue_call_rollup_15m"
+
+    bucket_start = Column(TIMESTAMP, primary_key=True)
+    cc_queue = Column(String, primary_key=True)
+    total_calls = Column(Integer, nullable=False, default=0)
+    acw_seconds = Column(Float, nullable=False, default=0)
+    answered_calls = Column(Integer, nullable=False, default=0)
+    interaction_seconds = Column(Float, nullable=False, default=0)
+    aht_calls = Column(Integer, nullable=False, default=0)
+    aht_seconds = Column(Float, nullable=False, default=0)
+    answer_wait_calls = Column(Integer, nullable=False, default=0)
+    answer_wait_seconds = Column(Float, nullable=False, default=0)
+    handled_incoming = Column(Integer, nullable=False, default=0)
+    handled_outbound = Column(Integer, nullable=False, default=0)
+    unanswered_calls = Column(Integer, nullable=False, default=0)
+    service_level_60 = Column(Integer, nullable=False, default=0)
+    service_level_120 = Column(Integer, nullable=False, default=0)
+
+
+class AgentStateInterval(Base):
+    """One stretch of an agent in the same status and state, collapsed from the snapshots."""
+    __tablename__ = "agent_state_intervals"
+
+    name = Column(String, primary_key=True)
+    started_at = Column(TIMESTAMP(timezone=True), primary_key=True)
+    status = Column(String)
+    state = Column(String)
+    # NULL while the agent is still in it; last_seen_at is its latest snapshot
+    ended_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    last_seen_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # Range overlap lookups, see agentCrud.AGENT_STATE_INTERVAL_SPAN_SQL
+        Index("agent_state_intervals_span_idx",
+              text("tstzrange(started_at, ended_at, '[)')"),
+              postgresql_using="gist"),
+    )
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    # Every bucket starting before this instant has been rolled up
+    processed_until = Column(TIMESTAMP(timezone=True), nullable=False)
@@ -0,0 +1,306 @@
+# partitions.py
+"""Daily range partitions of cdr.
+
+Every report filters cdr on timestamp (naive UTC), so with one partition per
+UTC day a 15 minute or today window only touches a partition or two, whether
+the bounds are literals or bind parameters (pruned at execution time).
+
+    python -m app.partitions migrate    # once: move cdr onto a partitioned table
+    python -m app.partitions maintain   # daily: partitions ahead, detach old ones
+
+``migrate`` copies cdr into cdr_partitioned one day at a time (safe to re-run),
+then catches up and swaps the tables in one short transaction that holds
+writes back; the old table is kept as cdr_unpartitioned. Inserts that were
+waiting on the swap still land in the old table, so run ``migrate`` once more
+afterwards to bring them across. Grants on cdr are not carried over.
+
+The partitioned table needs a timestamp on every row (it defaults to now). Old
+rows without one are filed under their start_stamp, but while recent rows
+still arrive without one the writer is passing NULL explicitly, which the new
+table would reject, so ``migrate`` stops before copying. Rows already in the
+new table under the same (uuid, timestamp) are skipped and counted.
+
+Indexes are declared on the partitioned table, so every partition gets them.
+A default partition catches rows outside the partitions created so far.
+"""
+import argparse
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+import pytz
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from database import SessionLocal, engine
+
+PARTITIONED_TABLE = "cdr"
+STAGING_TABLE = "cdr_partitioned"
+LEGACY_TABLE = "cdr_unpartitioned"
+DEFAULT_PARTITION = "cdr_default"
+
+PARTITION_NAME = re.compile(r"^cdr_p(\d{8})$")
+
+# Per partition: the agent and queue report scans, and the leg lookups of app/call_facts.py
+PARTITION_INDEXES = {
+    "cdr_part_timestamp_cc_agent_idx": "(timestamp, cc_agent)",
+    "cdr_part_timestamp_cc_queue_idx": "(timestamp, cc_queue)",
+    "cdr_part_bleg_uuid_idx": "(bleg_uuid, timestamp)",
+}
+
+
+def partition_name(day: date) -> str:
+    return f"cdr_p{day:%Y%m%d}"
+
+
+def utc_today() -> date:
+    return datetime.now(pytz.utc).date()
+
+
+def table_exists(db: Session, table: str) -> bool:
+    return db.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {'table': table}).scalar()
+
+
+def is_partitioned(db: Session, table: str = PARTITIONED_TABLE) -> bool:
+    return db.execute(text("""
+        SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)
+    """), {'table': table}).scalar() or False
+
+
+def list_partitions(db: Session, table: str = PARTITIONED_TABLE) -> List[date]:
+    names = db.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:table)
+    """), {'table': table}).scalars()
+    days = [datetime.strptime(match.group(1), "%Y%m%d").date()
+            for match in map(PARTITION_NAME.match, names) if match]
+    return sorted(days)
+
+
+def create_partitioned_table(db: Session, table: str) -> None:
+    """Empty partitioned copy of cdr's columns, keyed on (uuid, timestamp)."""
+    if table_exists(db, table):
+        return
+    db.execute(text(f"CREATE TABLE {table} (LIKE cdr INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"))
+    # The partition key has to be part of the primary key, and so NOT NULL
+    db.execute(text(f"ALTER TABLE {table} ALTER COLUMN timestamp SET DEFAULT (now() AT TIME ZONE 'UTC')"))
+    db.execute(text(f"ALTER TABLE {table} ALTER COLUMN timestamp SET NOT NULL"))
+    db.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (uuid, timestamp)"))
+    for index, columns in PARTITION_INDEXES.items():
+        db.execute(text(f"CREATE INDEX IF NOT EXISTS {index} ON {table} {columns}"))
+    db.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {table} DEFAULT"))
+
+
+def create_partition(db: Session, table: str, day: date) -> bool:
+    """Partition for one UTC day; rows that already landed in the default partition move in."""
+    name = partition_name(day)
+    if table_exists(db, name):
+        return False
+
+    bounds = {'start_time': datetime.combine(day, datetime.min.time()),
+              'end_time': datetime.combine(day + timedelta(days=1), datetime.min.time())}
+    for_values = f"FOR VALUES FROM ('{bounds['start_time']}') TO ('{bounds['end_time']}')"
+    stray = db.execute(text(f"""
+        SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION}
+                       WHERE timestamp >= :start_time AND timestamp < :end_time)
+    """), bounds).scalar()
+
+    if not stray:
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {for_values}"))
+        return True
+
+    db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE timestamp >= :start_time AND timestamp < :end_time
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), bounds)
+    db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {for_values}"))
+    return True
+
+
+def ensure_partitions(db: Session, table: str, first_day: date, last_day: date) -> int:
+    created = 0
+    day = first_day
+    while day <= last_day:
+        created += create_partition(db, table, day)
+        db.commit()
+        day += timedelta(days=1)
+    return created
+
+
+def detach_old_partitions(db: Session, retention_days: int, today: Optional[date] = None) -> List[str]:
+    """Detach partitions wholly past the retention and park them in the archive schema."""
+    cutoff = (today or utc_today()) - timedelta(days=retention_days)
+    detached = []
+    for day in list_partitions(db):
+        if day + timedelta(days=1) > cutoff:
+            break
+        name = partition_name(day)
+        db.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}"))
+        db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {settings.CDR_ARCHIVE_SCHEMA}"))
+        db.execute(text(f"ALTER TABLE {name} SET SCHEMA {settings.CDR_ARCHIVE_SCHEMA}"))
+        db.commit()
+        detached.append(name)
+    return detached
+
+
+def maintain(db: Session, today: Optional[date] = None) -> dict:
+    today = today or utc_today()
+    if not is_partitioned(db):
+        raise RuntimeError("cdr is not partitioned yet, run: python -m app.partitions migrate")
+
+    created = ensure_partitions(db, PARTITIONED_TABLE, today,
+                                today + timedelta(days=settings.CDR_PARTITIONS_AHEAD_DAYS))
+    detached = []
+    if settings.CDR_RETENTION_DAYS is not None:
+        detached = detach_old_partitions(db, settings.CDR_RETENTION_DAYS, today)
+    return {'created': created, 'detached': detached}
+
+
+# ------------------------------------------ migration ----------------------------------->
+
+# Rows without a timestamp: all of them, and those written since :start_time (or
+# without a start either, so of unknown age)
+NULL_TIMESTAMP_QUERY = text("""
+    SELECT COUNT(*), COUNT(*) FILTER (WHERE start_stamp IS NULL OR start_stamp >= :start_time)
+    FROM cdr
+    WHERE timestamp IS NULL
+""")
+
+
+def _copy_query(columns: List[str], where: str, source: str = "cdr", target: str = STAGING_TABLE):
+    """Copy the rows matching where; selects (rows read, rows copied)."""
+    # Rows without a timestamp are filed under their start (or now)
+    select = ", ".join(
+        "COALESCE(timestamp, start_stamp, now() AT TIME ZONE 'UTC')" if column == "timestamp" else column
+        for column in columns
+    )
+    return text(f"""
+        WITH source AS (
+            SELECT {select}
+            FROM {source}
+            WHERE {where}
+        ), copied AS (
+            INSERT INTO {target} ({', '.join(columns)})
+            SELECT * FROM source
+            ON CONFLICT DO NOTHING
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM source), (SELECT COUNT(*) FROM copied)
+    """)
+
+
+def _copy(db: Session, query, params: dict, label: str, counts: dict) -> int:
+    read, copied = db.execute(query, params).one()
+    if read > copied:
+        print(f"Skipped {read - copied} rows of {label} already copied under the same (uuid, timestamp)")
+    counts["copied"] += copied
+    counts["skipped"] += read - copied
+    return copied
+
+
+def _check_null_timestamps(db: Session, since: datetime) -> None:
+    """RuntimeError while rows still arrive without a timestamp; the partitioned table rejects them."""
+    total, recent = db.execute(NULL_TIMESTAMP_QUERY, {'start_time': since}).one()
+    if recent:
+        raise RuntimeError(f"{recent} cdr rows since {since:%Y-%m-%d} (or without a start_stamp) have no "
+                           "timestamp; have the writer set it, or leave it out for the default, then migrate")
+    if total:
+        print(f"{total} older cdr rows without a timestamp are filed under their start_stamp")
+
+
+def migrate() -> int:
+    """Move cdr onto a partitioned table; returns the rows copied."""
+    # One connection throughout, so the session settings below hold across commits
+    connection = engine.connect()
+    db = Session(bind=connection)
+    try:
+        # A day of cdr can take longer than the API's statement timeout
+        db.execute(text("SET statement_timeout = 0"))
+
+        columns = list(db.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'cdr'
+            ORDER BY ordinal_position
+        """)).scalars())
+        catch_up_from = datetime.combine(utc_today() - timedelta(days=1), datetime.min.time())
+        counts = {"copied": 0, "skipped": 0}
+
+        if is_partitioned(db):
+            if not table_exists(db, LEGACY_TABLE):
+                return 0
+            # Rows that reached the old table while the swap was waiting
+            _copy(db, _copy_query(columns, "timestamp >= :start_time OR timestamp IS NULL",
+                                  source=LEGACY_TABLE, target=PARTITIONED_TABLE),
+                  {'start_time': catch_up_from}, "the catch-up", counts)
+            db.commit()
+            print(f"Rows skipped as already copied: {counts['skipped']}")
+            return counts["copied"]
+
+        # Before hours of copying, and again just before the swap
+        _check_null_timestamps(db, catch_up_from)
+
+        first = db.execute(text("SELECT MIN(timestamp) FROM cdr")).scalar()
+        today = utc_today()
+        first_day = first.date() if first is not None else today
+
+        create_partitioned_table(db, STAGING_TABLE)
+        db.commit()
+        ensure_partitions(db, STAGING_TABLE, first_day, today + timedelta(days=settings.CDR_PARTITIONS_AHEAD_DAYS))
+
+        by_day = _copy_query(columns, "timestamp >= :start_time AND timestamp < :end_time")
+        day = first_day
+        while day < today:
+            _copy(db, by_day, {
+                'start_time': datetime.combine(day, datetime.min.time()),
+                'end_time': datetime.combine(day + timedelta(days=1), datetime.min.time())
+            }, str(day), counts)
+            db.commit()
+            day += timedelta(days=1)
+
+        _check_null_timestamps(db, catch_up_from)
+
+        # Today, late rows of yesterday and the rows still being written go across
+        # with writers held back
+        db.execute(text("LOCK TABLE cdr IN EXCLUSIVE MODE"))
+        _copy(db, _copy_query(columns, "timestamp >= :start_time OR timestamp IS NULL"),
+              {'start_time': catch_up_from}, "the catch-up", counts)
+        db.execute(text(f"ALTER TABLE cdr RENAME TO {LEGACY_TABLE}"))
+        db.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO {PARTITIONED_TABLE}"))
+        db.commit()
+        print(f"Rows skipped as already copied: {counts['skipped']}")
+        return counts["copied"]
+    except Exception as e:
+        print(f"Error partitioning cdr: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily partitions of the cdr table.")
+    parser.add_argument("command", choices=("migrate", "maintain"))
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(f"Rows moved to the partitioned cdr: {migrate()}")
+        return
+
+    db = SessionLocal()
+    try:
+        print(f"cdr partitions: {maintain(db)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
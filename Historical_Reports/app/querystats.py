@@ -0,0 +1,216 @@
+# querystats.py
+"""Per-statement timings from SQLAlchemy engine events, served at /debug/query-stats.
+
+Every statement is put down to the report function marked with @attributed
+that it runs under, across the tasks that function gathers, and otherwise to
+the innermost app.* frame on the stack. Per caller and statement it keeps a latency histogram, row counts
+and errors; connection checkouts are timed per pool. With SLOW_QUERY_MS set,
+slower statements are logged and the latest of them kept as samples.
+"""
+import contextvars
+import functools
+import hashlib
+import inspect
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SLOW_SAMPLES = 50
+STATEMENT_PREVIEW = 200
+
+current_caller: contextvars.ContextVar = contextvars.ContextVar("query_caller", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, percent: float) -> float:
+        # Upper bound of the bucket the percentile falls in
+        wanted, seen = self.count * percent / 100, 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "max_ms": round(self.max_ms, 1),
+            "histogram": {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements: Dict[Tuple[str, str], dict] = {}
+            self._pool_waits: Dict[str, Histogram] = {}
+            self._slow = deque(maxlen=SLOW_SAMPLES)
+
+    def record(self, caller: str, statement: str, ms: float, rows: Optional[int], failed: bool = False) -> None:
+        text = " ".join(statement.split())
+        statement_id = hashlib.sha1(text.encode()).hexdigest()[:10]
+        with self._lock:
+            entry = self._statements.get((caller, statement_id))
+            if entry is None:
+                entry = self._statements[(caller, statement_id)] = {
+                    "statement": text[:STATEMENT_PREVIEW], "latency": Histogram(), "rows": 0, "errors": 0}
+            entry["latency"].add(ms)
+            entry["rows"] += rows or 0
+            entry["errors"] += failed
+
+        if settings.SLOW_QUERY_MS is not None and ms >= settings.SLOW_QUERY_MS:
+            sample = {"caller": caller, "statement_id": statement_id, "ms": round(ms, 1), "rows": rows,
+                      "failed": failed, "statement": text[:STATEMENT_PREVIEW], "at": time.time()}
+            self._slow.append(sample)
+            logger.warning("Slow query %.0fms in %s (%s rows): %s", ms, caller, rows, text[:STATEMENT_PREVIEW])
+
+    def record_pool_wait(self, pool: str, ms: float) -> None:
+        with self._lock:
+            self._pool_waits.setdefault(pool, Histogram()).add(ms)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        with self._lock:
+            statements = []
+            callers = {}
+            for (caller, statement_id), entry in self._statements.items():
+                latency = entry["latency"].as_dict()
+                statements.append({"caller": caller, "statement_id": statement_id, "statement": entry["statement"],
+                                   "rows": entry["rows"], "errors": entry["errors"], **latency})
+                totals = callers.setdefault(caller, {"count": 0, "total_ms": 0.0, "rows": 0})
+                totals["count"] += latency["count"]
+                totals["total_ms"] = round(totals["total_ms"] + latency["total_ms"], 1)
+                totals["rows"] += entry["rows"]
+            result = {
+                "statements": sorted(statements, key=lambda entry: entry["total_ms"], reverse=True),
+                "callers": dict(sorted(callers.items(), key=lambda item: item[1]["total_ms"], reverse=True)),
+                "pool_wait": {pool: histogram.as_dict() for pool, histogram in self._pool_waits.items()},
+                "slow_samples": list(self._slow),
+            }
+        if reset:
+            self.reset()
+        return result
+
+
+query_stats = QueryStats()
+
+
+# ------------------------------------------ attribution ----------------------------------->
+
+def attributed(fn):
+    """Put the statements run under fn down to it, across the tasks it gathers."""
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            token = current_caller.set(name)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                current_caller.reset(token)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = current_caller.set(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current_caller.reset(token)
+    return wrapper
+
+
+def caller_name(frame=None) -> str:
+    # An attributed() report function wins over the helper frames it runs through
+    caller = current_caller.get()
+    if caller is not None:
+        return caller
+    frame = frame or sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and module != __name__:
+            return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unattributed"
+
+
+# ------------------------------------------ engine hooks ----------------------------------->
+
+def instrument(engine) -> None:
+    """Time every statement of a (sync) Engine; pass async_engine.sync_engine for the async one."""
+    if not settings.QUERY_STATS_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        caller = context.execution_options.get("query_caller") or caller_name()
+        conn.info.setdefault("query_stats", []).append((time.perf_counter(), caller))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started, caller = conn.info["query_stats"].pop()
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        query_stats.record(caller, statement, (time.perf_counter() - started) * 1000, rows)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        pending = exception_context.connection.info.get("query_stats") if exception_context.connection else None
+        if pending:
+            started, caller = pending.pop()
+            query_stats.record(caller, exception_context.statement or "", (time.perf_counter() - started) * 1000,
+                               None, failed=True)
+
+
+class _TimedCheckout:
+    pool_name = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if settings.QUERY_STATS_ENABLED:
+                query_stats.record_pool_wait(self.pool_name, (time.perf_counter() - started) * 1000)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pool_name = "sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pool_name = "async"
@@ -0,0 +1,125 @@
+# recording_store.py
+"""Content-addressed file store for call recordings.
+
+Each file lives at <RECORDINGS_STORE_DIR>/ab/cd/<sha256>, named after the
+SHA-256 of its bytes, so a recording stored twice takes the space once and a
+stored file never changes. recordings.file_path keeps the path relative to the
+store and recordings.file_size its size.
+
+Existing rows are moved out of recordings.file_content with
+``python -m app.recording_store``; it is safe to re-run, for instance from
+cron while recordings are still written as blobs.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+
+from app.config import settings
+from database import SessionLocal
+
+
+def relative_path(digest: str) -> str:
+    return os.path.join(digest[:2], digest[2:4], digest)
+
+
+def absolute_path(file_path: str) -> str:
+    path = os.path.realpath(os.path.join(settings.RECORDINGS_STORE_DIR, file_path))
+    # file_path comes from the database; never let it point outside the store
+    if os.path.commonpath([path, os.path.realpath(settings.RECORDINGS_STORE_DIR)]) != \
+            os.path.realpath(settings.RECORDINGS_STORE_DIR):
+        raise ValueError(f"Recording path outside the store: {file_path}")
+    return path
+
+
+def store_bytes(data: bytes) -> Tuple[str, int]:
+    """Write data into the store (once per content) and return (file_path, size)."""
+    digest = hashlib.sha256(data).hexdigest()
+    file_path = relative_path(digest)
+    path = absolute_path(file_path)
+    if os.path.exists(path):
+        return file_path, len(data)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written beside the target and renamed, so readers never see half a file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return file_path, len(data)
+
+
+# ------------------------------------------ migration ----------------------------------->
+
+NEXT_BLOB_QUERY = text("""
+    SELECT id, file_content
+    FROM recordings
+    WHERE id > :after_id
+      AND file_path IS NULL
+      AND file_content IS NOT NULL
+    ORDER BY id
+    LIMIT 1
+""")
+
+SET_PATH_QUERY = text("""
+    UPDATE recordings
+    SET file_path = :file_path,
+        file_size = :file_size,
+        file_content = CASE WHEN :clear_blob THEN NULL ELSE file_content END
+    WHERE id = :id
+""")
+
+
+def migrate_blobs(clear_blobs: bool = False, limit: Optional[int] = None) -> int:
+    """Move recordings.file_content into the store, one row (and one blob in memory) at a time."""
+    db = SessionLocal()
+    moved, after_id = 0, 0
+    try:
+        while limit is None or moved < limit:
+            row = db.execute(NEXT_BLOB_QUERY, {'after_id': after_id}).first()
+            if row is None:
+                break
+            after_id = row[0]
+
+            file_path, file_size = store_bytes(bytes(row[1]))
+            db.execute(SET_PATH_QUERY, {
+                'id': row[0],
+                'file_path': file_path,
+                'file_size': file_size,
+                'clear_blob': clear_blobs
+            })
+            db.commit()
+            moved += 1
+    except Exception as e:
+        print(f"Error migrating recording {after_id}: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move recording blobs out of Postgres into the file store.")
+    parser.add_argument("--clear-blobs", action="store_true",
+                        help="set file_content to NULL once the file is stored (run VACUUM afterwards)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many recordings")
+    args = parser.parse_args()
+
+    moved = migrate_blobs(clear_blobs=args.clear_blobs, limit=args.limit)
+    print(f"Recordings moved to {settings.RECORDINGS_STORE_DIR}: {moved}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# responses.py
+"""Fast response path for the report payloads.
+
+Report endpoints keep their response_model, so the OpenAPI schema is
+unchanged, but return report_response(request, content). FastAPI passes a
+Response through untouched, skipping the pydantic validation and
+re-serialisation of the whole payload. Bodies are encoded with orjson (json
+when it is not installed), or with msgpack for clients sending
+"Accept: application/x-msgpack" while msgpack is installed.
+
+With FAST_RESPONSES_ENABLED off, the content goes back to FastAPI as before.
+"""
+import dataclasses
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+def _default(value):
+    # Everything orjson does natively, for json and msgpack
+    if isinstance(value, (datetime, date, time)):
+        if isinstance(value, datetime) and value.utcoffset() is not None and not value.utcoffset():
+            return value.replace(tzinfo=None).isoformat() + "Z"
+        return value.isoformat()
+    if dataclasses.is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _orjson_default(value):
+    # Decimals (from NUMERIC columns) are numbers in the schemas
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """JSON the way pydantic writes it for these schemas (UTC as "Z"), without the models."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_default, use_bin_type=True)
+
+
+def wants_msgpack(request: Request) -> bool:
+    return msgpack is not None and MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def report_response(request: Request, content: Any, headers: Optional[dict] = None) -> Any:
+    """Content encoded as the client asked, or left to FastAPI when fast responses are off."""
+    if not settings.FAST_RESPONSES_ENABLED:
+        return content
+    headers = dict(headers or {}, Vary="Accept")
+    if wants_msgpack(request):
+        return MsgpackResponse(content, headers=headers)
+    return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,277 @@
+# rollups.py
+"""15 minute rollups of the calls in cdr and of historical_agents_metrics.
+
+The rollup job (``python -m app.rollups``) folds every settled 15 minute bucket
+past a watermark into per-agent and per-queue tables. Reports then read complete
+buckets from the rollups and only the ragged edges of their window from the raw
+tables, so a month long report costs a few thousand rollup rows.
+
+The same job first brings call_facts (app/call_facts.py) up to date, which the
+call rollups are built from, and keeps agent_state_intervals up to date from the
+agent snapshots; those are read by range overlap rather than by bucket (see
+split_at_watermark).
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from database import SessionLocal, engine, fetch_rows_async
+
+BUCKET = timedelta(minutes=15)
+BUCKET_SECONDS = int(BUCKET.total_seconds())
+
+# Reports shorter than a few buckets are cheaper straight from the raw tables
+ROLLUP_WINDOW_KINDS = ("today", "range")
+
+# Largest slice of source rows rolled up in one transaction
+REFRESH_CHUNK = timedelta(days=1)
+
+# SQL for the start of the UTC bucket a row falls in, for naive UTC and timestamptz columns
+CDR_BUCKET_SQL = f"(to_timestamp(floor(extract(epoch FROM timestamp) / {BUCKET_SECONDS}) * {BUCKET_SECONDS}) AT TIME ZONE 'UTC')"
+STATE_BUCKET_SQL = f"to_timestamp(floor(extract(epoch FROM timestamp) / {BUCKET_SECONDS}) * {BUCKET_SECONDS})"
+
+WATERMARK_QUERY = text("SELECT processed_until FROM rollup_watermarks WHERE name = :name")
+
+SET_WATERMARK_QUERY = text("""
+    INSERT INTO rollup_watermarks (name, processed_until)
+    VALUES (:name, :processed_until)
+    ON CONFLICT (name) DO UPDATE SET processed_until = EXCLUDED.processed_until
+""")
+
+
+def _as_utc(value: datetime) -> datetime:
+    # cdr.timestamp is a naive UTC column
+    if value.tzinfo is None:
+        return pytz.utc.localize(value)
+    return value.astimezone(pytz.utc)
+
+
+def floor_bucket(value: datetime) -> datetime:
+    value = _as_utc(value)
+    epoch = int(value.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % BUCKET_SECONDS, pytz.utc)
+
+
+def ceil_bucket(value: datetime) -> datetime:
+    start = floor_bucket(value)
+    return start if start == _as_utc(value) else start + BUCKET
+
+
+def upsert_query(table: str, keys: Iterable[str], columns: Iterable[str], select: str):
+    """INSERT ... SELECT into a rollup table, replacing buckets that are rolled up again."""
+    keys, columns = tuple(keys), tuple(columns)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns)
+    return text(f"""
+        INSERT INTO {table} ({', '.join(keys + columns)})
+        {select.strip()}
+        ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}
+    """)
+
+
+def sum_query(table: str, key: str, columns: Iterable[str]):
+    """Per-key totals of a rollup table over [start_time, end_time)."""
+    sums = ", ".join(f"SUM({column})" for column in columns)
+    return text(f"""
+        SELECT {key}, {sums}
+        FROM {table}
+        WHERE bucket_start >= :start_time AND bucket_start < :end_time
+        GROUP BY {key}
+    """)
+
+
+# ------------------------------------------ reading ----------------------------------->
+
+def get_watermark(db: Session, name: str) -> Optional[datetime]:
+    if not settings.ROLLUPS_ENABLED:
+        return None
+    try:
+        processed_until = db.execute(WATERMARK_QUERY, {'name': name}).scalar()
+    except Exception as e:
+        # Rollup tables not created yet, keep serving from the raw tables
+        print(f"Error reading rollup watermark {name}: {e}")
+        db.rollback()
+        return None
+    return _as_utc(processed_until) if processed_until is not None else None
+
+
+def combine_totals(parts: Iterable[Dict[str, dict]]) -> Dict[str, dict]:
+    """Add up per-key totals; None (no such periods) only survives if every part has it."""
+    combined = {}
+    for part in parts:
+        for key, totals in part.items():
+            if key not in combined:
+                combined[key] = dict(totals)
+                continue
+            row = combined[key]
+            for column, value in totals.items():
+                if value is None:
+                    continue
+                row[column] = value if row.get(column) is None else row[column] + value
+    return combined
+
+
+def plan_window(start_time: datetime, end_time: datetime,
+                watermark: Optional[datetime]) -> List[Tuple[bool, datetime, datetime]]:
+    """Split [start_time, end_time] into (from_rollup, start, end) parts.
+
+    Rollup parts cover complete buckets below the watermark as [start, end);
+    raw parts are the ragged edges, read inclusively from the source table.
+    """
+    if watermark is None:
+        return [(False, start_time, end_time)]
+
+    rollup_start = ceil_bucket(start_time)
+    rollup_end = min(floor_bucket(end_time), watermark)
+    if rollup_start >= rollup_end:
+        return [(False, start_time, end_time)]
+
+    parts = [(True, rollup_start, rollup_end)]
+    if _as_utc(start_time) < rollup_start:
+        parts.append((False, start_time, rollup_start - timedelta(microseconds=1)))
+    parts.append((False, rollup_end, end_time))
+    return parts
+
+
+def split_at_watermark(start_time: datetime, end_time: datetime,
+                       watermark: Optional[datetime]) -> List[Tuple[bool, datetime, datetime]]:
+    """plan_window for derived tables that can be cut at any instant, not only on bucket edges."""
+    if watermark is None or watermark <= _as_utc(start_time):
+        return [(False, start_time, end_time)]
+    if watermark > _as_utc(end_time):
+        return [(True, start_time, end_time)]
+    return [(True, start_time, watermark), (False, watermark, end_time)]
+
+
+async def get_watermark_async(name: str) -> Optional[datetime]:
+    if not settings.ROLLUPS_ENABLED:
+        return None
+    try:
+        rows = await fetch_rows_async(WATERMARK_QUERY, {'name': name})
+    except Exception as e:
+        print(f"Error reading rollup watermark {name}: {e}")
+        return None
+    return _as_utc(rows[0][0]) if rows else None
+
+
+async def fetch_window_totals_async(name: str, kind: str, start_time: datetime, end_time: datetime,
+                                    raw_query, rollup_query, from_rows: Callable,
+                                    naive_utc: bool = False, plan: Callable = plan_window,
+                                    kinds: Tuple[str, ...] = ROLLUP_WINDOW_KINDS) -> Dict[str, dict]:
+    """Totals for [start_time, end_time]: complete rolled up buckets plus raw rows at the edges.
+
+    raw_query reads the source table inclusively and rollup_query sums the
+    buckets in [start, end); every part runs concurrently on its own connection.
+
+    asyncpg binds datetimes by column type, so naive_utc strips the zone for
+    queries against naive TIMESTAMP columns such as cdr.timestamp.
+    """
+    watermark = await get_watermark_async(name) if kind in kinds else None
+    parts_plan = plan(start_time, end_time, watermark)
+
+    def bounds(value: datetime) -> datetime:
+        value = _as_utc(value)
+        return value.replace(tzinfo=None) if naive_utc else value
+
+    results = await asyncio.gather(*(
+        fetch_rows_async(rollup_query if from_rollup else raw_query,
+                         {'start_time': bounds(start), 'end_time': bounds(end)})
+        for from_rollup, start, end in parts_plan
+    ))
+    parts = [from_rows(rows) for rows in results]
+    return parts[0] if len(parts) == 1 else combine_totals(parts)
+
+
+# ------------------------------------------ refreshing ----------------------------------->
+
+def _rollup_jobs():
+    # Imported here, the crud modules read through this one
+    from app import call_facts
+    from app.crud import agentCrud, queueCrud
+    # call_facts first: the call rollups read it
+    return (
+        ("call_facts", "cdr", call_facts.CALL_FACTS_REFRESH_QUERY),
+        ("agent_call_15m", "call_facts", agentCrud.AGENT_CALL_ROLLUP_QUERY),
+        ("queue_call_15m", "call_facts", queueCrud.QUEUE_CALL_ROLLUP_QUERY),
+        ("agent_state_intervals", "historical_agents_metrics", agentCrud.AGENT_STATE_INTERVALS_QUERY),
+    )
+
+
+def refresh_rollup(db: Session, name: str, source_table: str, query, until: datetime) -> int:
+    """Roll up every bucket between the watermark of ``name`` and ``until``. Returns buckets done."""
+    watermark = db.execute(WATERMARK_QUERY, {'name': name}).scalar()
+    if watermark is None:
+        first_row = db.execute(text(f"SELECT MIN(timestamp) FROM {source_table}")).scalar()
+        if first_row is None:
+            return 0
+        watermark = first_row
+    watermark = floor_bucket(watermark)
+
+    buckets = 0
+    while watermark < until:
+        chunk_end = min(watermark + REFRESH_CHUNK, until)
+        db.execute(query, {
+            'start_time': watermark,
+            'end_time': chunk_end,
+            'lookahead_time': chunk_end + REFRESH_CHUNK
+        })
+        db.execute(SET_WATERMARK_QUERY, {'name': name, 'processed_until': chunk_end})
+        db.commit()
+        buckets += int((chunk_end - watermark) / BUCKET)
+        watermark = chunk_end
+    return buckets
+
+
+def refresh_rollups(db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+    # Buckets are only rolled up once late cdr rows have had time to land
+    now = now or datetime.now(pytz.utc)
+    until = floor_bucket(now - timedelta(seconds=settings.ROLLUP_SETTLE_SECONDS))
+
+    done = {}
+    for name, source_table, query in _rollup_jobs():
+        try:
+            done[name] = refresh_rollup(db, name, source_table, query, until)
+        except Exception as e:
+            print(f"Error refreshing rollup {name}: {e}")
+            db.rollback()
+            raise
+    return done
+
+
+def create_rollup_tables(engine) -> None:
+    from app.models import AgentCallRollup, AgentStateInterval, CallFact, QueueCallRollup, RollupWatermark
+    tables = [model.__table__ for model in (CallFact, AgentCallRollup, QueueCallRollup,
+                                            AgentStateInterval, RollupWatermark)]
+    AgentCallRollup.metadata.create_all(engine, tables=tables, checkfirst=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the 15 minute report rollups.")
+    parser.add_argument("--loop", action="store_true",
+                        help=f"keep refreshing every ROLLUP_INTERVAL_SECONDS ({settings.ROLLUP_INTERVAL_SECONDS}s)")
+    args = parser.parse_args()
+
+    create_rollup_tables(engine)
+
+    while True:
+        db = SessionLocal()
+        try:
+            print(f"Rollups refreshed: {refresh_rollups(db)}")
+        except Exception:
+            if not args.loop:
+                raise
+        finally:
+            db.close()
+        if not args.loop:
+            break
+        time.sleep(settings.ROLLUP_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
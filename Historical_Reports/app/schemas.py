@@ -71,6 +71,16 @@ class NonProductiveTimeList(BaseModel):
     data: List[NonProductiveTimeResponse]
 
 
+class AgentOccupancyTime(BaseModel):
+    name: str
+    occupancy_time: str
+
+
+class AgentOccupancyTimeList(BaseModel):
+    status: str
+    data: List[AgentOccupancyTime]
+
+
 class AgentContactsHandledResponse(BaseModel):
     name: str
     contacts_handled: int
@@ -109,6 +119,7 @@ class AgentMetricsResponse(BaseModel):
     on_contact_times: Optional[AgentOnContactTimeList]
     online_times: Optional[AgentOnlineTimeList]
     non_productive_times: Optional[NonProductiveTimeList]
+    occupancy_times: Optional[AgentOccupancyTimeList] = None
     contacts_handled: Optional[AgentContactsHandledList]
     after_contact_work_time: Optional[AverageAfterContactWorkTimeList]
     agent_interaction_time: Optional[AverageAgentInteractionTimeList]
@@ -161,6 +172,13 @@ class AgentMetricsResponse(BaseModel):
                         "non_productive_time_seconds": 300
                     }]
                 },
+                "occupancy_times": {
+                    "status": "success",
+                    "data": [{
+                        "name": "Agent A",
+                        "occupancy_time": "00:07:30"
+                    }]
+                },
                 "contacts_handled": {
                     "data": [{
                         "name": "Agent A",
@@ -325,6 +343,118 @@ class QueueMetricsResponse(BaseModel):
     contacts_handled_outbound: Dict[str, int]
     abandoned_contacts: List[QueueAbandonedContactsForQueues]
     contacts_handled_per_queue: Dict[str, int]
+    avg_queue_answer_time: Dict[str, str] = {}
+
+
+# ------------------------------------------ series  ----------------------------------->
+
+
+class AgentSeriesEntry(BaseModel):
+    name: str
+    contacts_handled: int
+    calls_answered: int
+    calls_missed: int
+    unanswered_calls: int
+    agent_answer_rate: float
+    talk_time: str
+    average_talk_time: str
+
+
+class AgentSeriesInterval(BaseModel):
+    # In the user's time zone
+    interval_start: datetime
+    agents: List[AgentSeriesEntry]
+
+
+class AgentSeriesResponse(BaseModel):
+    status: str
+    step: str
+    user_time_zone: str
+    intervals: List[AgentSeriesInterval]
+
+
+class QueueSeriesEntry(BaseModel):
+    queue: str
+    total_calls: int
+    answered_calls: int
+    abandoned_count: int
+    service_level_60_seconds: str
+    service_level_120_seconds: str
+    avg_handle_time: str
+    avg_queue_answer_time: str
+
+
+class QueueSeriesInterval(BaseModel):
+    # In the user's time zone
+    interval_start: datetime
+    queues: List[QueueSeriesEntry]
+
+
+class QueueSeriesResponse(BaseModel):
+    status: str
+    step: str
+    user_time_zone: str
+    intervals: List[QueueSeriesInterval]
+
+
+# ------------------------------------------ capacity  ----------------------------------->
+
+
+class QueueConcurrency(BaseModel):
+    queue: str
+    peak_concurrent_calls: int
+    # In the user's time zone
+    peak_at: datetime
+    # One value per minute from ConcurrencyTimelineResponse.start
+    concurrent_calls: List[int]
+    average_concurrent_calls: List[float]
+    waiting_calls: List[int]
+
+
+class AgentOccupancyTimeline(BaseModel):
+    # Average agents per minute, and occupancy in percent
+    agents_available: List[float]
+    agents_on_calls: List[float]
+    occupancy: List[float]
+
+
+class ConcurrencyTimelineResponse(BaseModel):
+    status: str
+    user_time_zone: str
+    start: datetime
+    step_seconds: int
+    minutes: int
+    queues: List[QueueConcurrency]
+    agents: AgentOccupancyTimeline
+
+
+class StaffingEntry(BaseModel):
+    queue: str
+    calls: float
+    # None when the queue answered no call in the window, so its handle time is unknown
+    aht_seconds: Optional[float] = None
+    erlangs: Optional[float] = None
+    required_agents: Optional[int] = None
+    # Percentages reached with required_agents
+    service_level: Optional[float] = None
+    wait_probability: Optional[float] = None
+    occupancy: Optional[float] = None
+
+
+class StaffingInterval(BaseModel):
+    # In the user's time zone; only intervals with calls
+    interval_start: datetime
+    queues: List[StaffingEntry]
+
+
+class StaffingResponse(BaseModel):
+    status: str
+    step: str
+    user_time_zone: str
+    service_level_seconds: int
+    target_service_level: float
+    peak_required_agents: Dict[str, int]
+    intervals: List[StaffingInterval]
 
 
 # ------------------------------------------ login/logout  ----------------------------------->
@@ -364,6 +494,8 @@ class CDRReportList(BaseModel):
     status: str
     data: List[CDRReportEntry]
     message: Optional[str] = None
+    # Set on paginated responses while more rows follow
+    next_cursor: Optional[str] = None
 
 class Agent(BaseModel):
     extension: str
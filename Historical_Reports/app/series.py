@@ -0,0 +1,93 @@
+# series.py
+"""Per-interval totals over a date range, for the intraday charts.
+
+One grouped query per source binds every row to its interval with date_bin,
+origin at local midnight so that intervals start on the user's quarter hours
+and hours. Complete 15 minute buckets come from the rollup tables and only the
+edges past the watermark from the raw calls, as for the window totals (see
+app/rollups.py); every step is a whole number of rollup buckets, so a rollup
+row always falls in a single interval.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List
+
+import pytz
+from sqlalchemy import text
+
+from app import rollups
+from app.utils import ReportWindow
+from database import fetch_rows_async
+
+SERIES_STEPS = {
+    "15m": timedelta(minutes=15),
+    "30m": timedelta(minutes=30),
+    "1h": timedelta(hours=1),
+}
+
+# A month of 15 minute intervals
+SERIES_MAX_BUCKETS = 31 * 96
+
+# SQL for the start of the interval a naive UTC column falls in
+BUCKET_SQL = "date_bin(CAST(:step AS interval), {column}, CAST(:origin AS timestamp))"
+
+
+def rollup_series_query(table: str, key: str, columns: Iterable[str]):
+    """Per-interval, per-key totals of a rollup table over [start_time, end_time)."""
+    sums = ", ".join(f"SUM({column})" for column in columns)
+    return text(f"""
+        SELECT {BUCKET_SQL.format(column="bucket_start")} AS interval_start, {key}, {sums}
+        FROM {table}
+        WHERE bucket_start >= :start_time AND bucket_start < :end_time
+        GROUP BY 1, 2
+    """)
+
+
+def series_origin(window: ReportWindow) -> datetime:
+    # Midnight is resolved through localize() so DST days start at the right offset
+    user_tz = pytz.timezone(window.user_time_zone)
+    midnight = user_tz.localize(datetime.combine(window.start_user.date(), datetime.min.time()))
+    return midnight.astimezone(pytz.utc)
+
+
+def bucket_starts(window: ReportWindow, step: str) -> List[datetime]:
+    """UTC starts of every interval touching the window; ValueError past SERIES_MAX_BUCKETS."""
+    size = SERIES_STEPS[step]
+    origin = series_origin(window)
+    first = origin + ((window.start_utc - origin) // size) * size
+    count = int((window.end_utc - first) // size) + 1
+    if count > SERIES_MAX_BUCKETS:
+        raise ValueError(f"{count} intervals of {step} requested, at most {SERIES_MAX_BUCKETS} are served")
+    return [first + size * index for index in range(count)]
+
+
+def _naive(value: datetime) -> datetime:
+    # The sources are naive UTC columns, which asyncpg binds naive datetimes to
+    return value.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+async def fetch_window_series_async(name: str, window: ReportWindow, step: str,
+                                    raw_query, rollup_query, from_rows: Callable) -> Dict[datetime, Dict[str, dict]]:
+    """Per-key totals of every interval with calls, keyed by the interval's UTC start.
+
+    raw_query and rollup_query are the naive UTC sources of
+    rollups.fetch_window_totals_async, with the interval start selected first.
+    """
+    watermark = await rollups.get_watermark_async(name)
+    params = {'step': SERIES_STEPS[step], 'origin': _naive(series_origin(window))}
+
+    results = await asyncio.gather(*(
+        fetch_rows_async(rollup_query if from_rollup else raw_query,
+                         dict(params, start_time=_naive(start), end_time=_naive(end)))
+        for from_rollup, start, end in rollups.plan_window(window.start_utc, window.end_utc, watermark)
+    ))
+
+    # An interval cut by the watermark has a part from each source
+    parts: Dict[datetime, list] = {}
+    for rows in results:
+        by_interval: Dict[datetime, list] = {}
+        for row in rows:
+            by_interval.setdefault(pytz.utc.localize(row[0]), []).append(row[1:])
+        for interval_start, interval_rows in by_interval.items():
+            parts.setdefault(interval_start, []).append(from_rows(interval_rows))
+    return {interval_start: rollups.combine_totals(totals) for interval_start, totals in parts.items()}
@@ -0,0 +1,62 @@
+# singleflight.py
+"""Coalesce identical in-flight report computations.
+
+When several requests ask for the same report at the same time, the first one
+runs the queries and the others wait for its result instead of sending the same
+query set to Postgres again.
+"""
+import asyncio
+from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable
+
+from app.utils import ReportWindow
+
+
+class AsyncSingleFlight:
+    """In-flight computations by key, for coroutines on one event loop."""
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {"leaders": 0, "shared": 0}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is not None:
+            self._stats["shared"] += 1
+            # A follower giving up must not cancel the run the others wait on
+            return await asyncio.shield(call)
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't log an unretrieved exception for it
+        call.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._stats["leaders"] += 1
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except Exception as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return dict(self._stats, in_flight=len(self._calls))
+
+
+async_report_flights = AsyncSingleFlight()
+
+
+def coalesce_async(name: str):
+    """Decorator for async report entry points taking (window); identical windows share one run."""
+    def decorator(fetch):
+        @wraps(fetch)
+        async def wrapper(window: ReportWindow, *args, **kwargs):
+            key = (name, window.key) + args + tuple(sorted(kwargs.items()))
+            return await async_report_flights.do(key, lambda: fetch(window, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,148 @@
+# staffing.py
+"""Agents needed per 15 minute interval and queue to meet a service level, by Erlang C.
+
+The offered load of an interval is its calls times their average handle time
+over the interval's length, in Erlangs (A). With N agents, Erlang C gives the
+chance a call waits at all, from Erlang B by its recurrence
+
+    B(0) = 1,   B(n) = A B(n-1) / (n + A B(n-1)),   C(N) = N B(N) / (N - A (1 - B(N)))
+
+and the service level, the share of calls answered within T seconds, is
+1 - C(N) exp(-(N - A) T / AHT). The required agents are the smallest N above A
+meeting the target, within the occupancy cap A / N.
+
+The recurrence steps every interval of every queue at once as NumPy arrays:
+one step per agent count, each interval settling at the first count that
+meets its target and dropping out of the arrays, so a week of intervals
+across all queues takes a few hundred vector operations. B(N) needs every
+step below N, so the count cannot start at A / occupancy; the occupancy cap
+has a floor instead (see main.get_staffing) and loads needing more than
+STAFFING_MAX_AGENTS are refused.
+
+An interval with calls but no known handle time (none answered in its queue
+over the window) has no load to size, and comes back without figures.
+
+The load can be scaled (volume_factor) and the handle time replaced
+(aht_seconds) to ask what a busier day or a longer call would need.
+"""
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pytz
+
+from app.utils import ReportWindow
+
+STEP = "15m"
+INTERVAL_SECONDS = 15 * 60
+
+# Bounds the recurrence, one pass per agent
+STAFFING_MAX_AGENTS = 5000
+
+
+def required_agents(erlangs: np.ndarray, aht_seconds: np.ndarray, answer_seconds: float, target: float,
+                    max_occupancy: float = 1.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Agents needed, the service level and the chance of waiting they reach, per element.
+
+    target and max_occupancy are fractions; elements with no load need no agents.
+    ValueError when a load needs more than STAFFING_MAX_AGENTS.
+    """
+    erlangs = np.asarray(erlangs, dtype=float)
+    aht_seconds = np.asarray(aht_seconds, dtype=float)
+    agents = np.zeros(erlangs.shape, dtype=np.int64)
+    service_level = np.ones(erlangs.shape)
+    wait_probability = np.zeros(erlangs.shape)
+    if erlangs.size and erlangs.max() > max_occupancy * STAFFING_MAX_AGENTS:
+        raise ValueError(f"{erlangs.max():.0f} Erlangs at {max_occupancy:.0%} occupancy need more than "
+                         f"{STAFFING_MAX_AGENTS} agents")
+
+    # Indexes still short of their target, with their load and Erlang B so far
+    pending = np.flatnonzero(erlangs > 0)
+    load, handle, blocking = erlangs[pending], aht_seconds[pending], np.ones(len(pending))
+    n = 0
+    while len(pending):
+        n += 1
+        if n > STAFFING_MAX_AGENTS:
+            raise ValueError(f"the target needs more than {STAFFING_MAX_AGENTS} agents")
+        blocking = load * blocking / (n + load * blocking)
+        # Below the load the queue only grows
+        stable = n > load
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            waits = np.where(stable, n * blocking / (n - load * (1 - blocking)), 1.0)
+            reached = np.where(stable, 1 - waits * np.exp(-(n - load) * answer_seconds / handle), 0.0)
+        met = stable & (reached >= target) & (load <= max_occupancy * n)
+        agents[pending[met]] = n
+        service_level[pending[met]] = reached[met]
+        wait_probability[pending[met]] = waits[met]
+        left = ~met
+        pending, load, handle, blocking = pending[left], load[left], handle[left], blocking[left]
+    return agents, service_level, wait_probability
+
+
+def build_staffing(window: ReportWindow, intervals: Dict[datetime, Dict[str, dict]], answer_seconds: int,
+                   target_service_level: float, max_occupancy: float = 100.0, volume_factor: float = 1.0,
+                   aht_seconds: Optional[float] = None) -> dict:
+    """The schemas.StaffingResponse layout, from 15 minute queue totals (see queueCrud.fetch_queue_series_async).
+
+    Percentages are given and returned as 0-100. An interval whose calls were
+    all unanswered takes the average handle time of its queue over the window;
+    one without any gets None figures.
+    """
+    keys = [(interval_start, queue) for interval_start in sorted(intervals)
+            for queue in sorted(intervals[interval_start]) if intervals[interval_start][queue]['total_calls']]
+    rows = [intervals[interval_start][queue] for interval_start, queue in keys]
+
+    calls = np.array([row['total_calls'] for row in rows], dtype=float)
+    handled = np.array([row['aht_calls'] for row in rows], dtype=float)
+    handled_seconds = np.array([row['aht_seconds'] for row in rows], dtype=float)
+    if aht_seconds is not None:
+        aht = np.full(len(rows), float(aht_seconds))
+    else:
+        queues, index = np.unique(np.array([queue for _, queue in keys], dtype=str), return_inverse=True)
+        queue_handled = np.bincount(index, handled, len(queues))
+        queue_seconds = np.bincount(index, handled_seconds, len(queues))
+        queue_aht = np.divide(queue_seconds, queue_handled, out=np.zeros(len(queues)), where=queue_handled > 0)
+        aht = np.divide(handled_seconds, handled, out=queue_aht[index], where=handled > 0)
+
+    calls = calls * volume_factor
+    erlangs = calls * aht / INTERVAL_SECONDS
+    # No handle time is no load to size, not a zero load
+    known = aht > 0
+    agents = np.zeros(len(rows), dtype=np.int64)
+    service_level, wait_probability = np.zeros(len(rows)), np.zeros(len(rows))
+    agents[known], service_level[known], wait_probability[known] = required_agents(
+        erlangs[known], aht[known], answer_seconds, target_service_level / 100, max_occupancy / 100)
+    occupancy = np.divide(erlangs * 100, agents, out=np.zeros(len(rows)), where=agents > 0)
+
+    def figure(values: np.ndarray, position: int, scale: float = 1, digits: int = 1) -> Optional[float]:
+        return round(float(values[position]) * scale, digits) if known[position] else None
+
+    user_tz = pytz.timezone(window.user_time_zone)
+    by_interval: Dict[datetime, list] = {}
+    peaks: Dict[str, int] = {}
+    for position, (interval_start, queue) in enumerate(keys):
+        by_interval.setdefault(interval_start, []).append({
+            "queue": queue,
+            "calls": round(float(calls[position]), 2),
+            "aht_seconds": figure(aht, position),
+            "erlangs": figure(erlangs, position, digits=2),
+            "required_agents": int(agents[position]) if known[position] else None,
+            "service_level": figure(service_level, position, 100),
+            "wait_probability": figure(wait_probability, position, 100),
+            "occupancy": figure(occupancy, position),
+        })
+        if known[position]:
+            peaks[queue] = max(peaks.get(queue, 0), int(agents[position]))
+
+    return {
+        "status": "success",
+        "step": STEP,
+        "user_time_zone": window.user_time_zone,
+        "service_level_seconds": answer_seconds,
+        "target_service_level": target_service_level,
+        "peak_required_agents": peaks,
+        "intervals": [
+            {"interval_start": interval_start.astimezone(user_tz), "queues": queues}
+            for interval_start, queues in by_interval.items()
+        ],
+    }
@@ -0,0 +1,153 @@
+# timeline.py
+"""Concurrent calls and agent occupancy at one minute resolution, for capacity planning.
+
+Each call (or agent state stretch) is an interval [start, end). A sweep adds
+one at every start and takes one away at every end: with the events sorted,
+their cumulative sum is the number of open intervals after each event. Per
+minute, the peak is the highest level reached in it, the level carried in
+from the previous minute included, and the average is the area under the
+level over 60 seconds (busy seconds per minute, i.e. Erlangs).
+
+All groups (queues) are swept at once, each on its own stretch of the time
+axis, so one sort and one cumulative sum serve them all, in a fraction of a
+second for a month of a busy site's calls.
+
+cdr rows are written when a call ends, so calls still up are not counted yet.
+"""
+from datetime import datetime, timedelta
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pytz
+
+from app.utils import ReportWindow
+
+STEP_SECONDS = 60
+
+# A month of minutes
+TIMELINE_MAX_MINUTES = 31 * 24 * 60
+
+# Calls are found by cdr.timestamp, written at hangup; calls still up at the end of
+# the window are looked for up to this much later
+LONGEST_CALL = timedelta(hours=4)
+
+
+def minute_grid(window: ReportWindow) -> Tuple[int, int]:
+    """(epoch second of the first minute, number of minutes); ValueError past TIMELINE_MAX_MINUTES."""
+    origin = int(window.start_utc.timestamp()) // STEP_SECONDS * STEP_SECONDS
+    minutes = -(-(int(window.end_utc.timestamp()) + 1 - origin) // STEP_SECONDS)
+    if minutes > TIMELINE_MAX_MINUTES:
+        raise ValueError(f"{minutes} minutes requested, at most {TIMELINE_MAX_MINUTES} are served")
+    return origin, minutes
+
+
+def sweep(groups: np.ndarray, starts: np.ndarray, ends: np.ndarray, group_count: int,
+          origin: int, minutes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Peak and average number of open intervals per group and minute, as (group_count, minutes) arrays.
+
+    groups are indexes below group_count; starts and ends epoch seconds, clipped to the grid.
+    """
+    span = minutes * STEP_SECONDS
+    # A minute of nothing between groups keeps each group's events to its own minutes
+    stride = span + STEP_SECONDS
+    starts = np.clip(starts - origin, 0, span)
+    ends = np.clip(ends - origin, 0, span)
+    kept = ends > starts
+    if not kept.any():
+        return np.zeros((group_count, minutes), dtype=np.int64), np.zeros((group_count, minutes))
+    offsets = groups[kept] * stride
+
+    times = np.concatenate((starts[kept] + offsets, ends[kept] + offsets))
+    deltas = np.concatenate((np.ones(kept.sum(), dtype=np.int64), -np.ones(kept.sum(), dtype=np.int64)))
+    # By time, ends before starts: back-to-back calls do not overlap
+    order = np.lexsort((deltas, times))
+    times, levels = times[order], np.cumsum(deltas[order])
+
+    # Level and area under it at every minute edge of every group
+    edges = (np.arange(group_count)[:, None] * stride
+             + np.arange(minutes + 1)[None, :] * STEP_SECONDS).astype(float)
+    areas = np.concatenate(([0.0], np.cumsum(levels[:-1] * np.diff(times))))
+    last = np.searchsorted(times, edges, side="right") - 1
+    known = last >= 0
+    last = np.maximum(last, 0)
+    edge_levels = np.where(known, levels[last], 0)
+    edge_areas = np.where(known, areas[last] + edge_levels * (edges - times[last]), 0.0)
+
+    average = np.diff(edge_areas, axis=1) / STEP_SECONDS
+    # The level carried into each minute, raised by the events inside it
+    peak = edge_levels[:, :-1].copy()
+    group = (times // stride).astype(np.int64)
+    minute = ((times - group * stride) // STEP_SECONDS).astype(np.int64)
+    inside = minute < minutes
+    np.maximum.at(peak, (group[inside], minute[inside]), levels[inside])
+    return peak, average
+
+
+def build_queue_concurrency(window: ReportWindow, rows: Sequence) -> List[dict]:
+    """Per queue, calls up (start to end) and waiting (start to answer) per minute.
+
+    rows are (queue, start, answer or end, end) in epoch seconds.
+    """
+    origin, minutes = minute_grid(window)
+    if not rows:
+        return []
+    names, groups = np.unique(np.array([row[0] for row in rows], dtype=object).astype(str), return_inverse=True)
+    columns = np.array([row[1:] for row in rows], dtype=float)
+    starts, answers, ends = columns[:, 0], columns[:, 1], columns[:, 2]
+
+    peak, average = sweep(groups, starts, ends, len(names), origin, minutes)
+    waiting, _ = sweep(groups, starts, answers, len(names), origin, minutes)
+
+    user_tz = pytz.timezone(window.user_time_zone)
+    queues = []
+    for index, name in enumerate(names):
+        busiest = int(np.argmax(peak[index]))
+        queues.append({
+            "queue": str(name),
+            "peak_concurrent_calls": int(peak[index, busiest]),
+            "peak_at": datetime.fromtimestamp(origin + busiest * STEP_SECONDS, user_tz),
+            "concurrent_calls": peak[index].tolist(),
+            "average_concurrent_calls": np.round(average[index], 2).tolist(),
+            "waiting_calls": waiting[index].tolist(),
+        })
+    return queues
+
+
+def build_agent_occupancy(window: ReportWindow, rows: Sequence) -> dict:
+    """Agents available and, of them, on a queue call, per minute; occupancy as their ratio in percent.
+
+    rows are (on a queue call, start, end) in epoch seconds, one per Available stretch.
+    """
+    origin, minutes = minute_grid(window)
+    if rows:
+        columns = np.array([row[1:] for row in rows], dtype=float)
+        busy = np.array([bool(row[0]) for row in rows])
+        # Group 0 is every available agent, group 1 those on a call
+        groups = np.concatenate((np.zeros(len(rows), dtype=np.int64), np.ones(busy.sum(), dtype=np.int64)))
+        starts = np.concatenate((columns[:, 0], columns[busy, 0]))
+        ends = np.concatenate((columns[:, 1], columns[busy, 1]))
+        _, average = sweep(groups, starts, ends, 2, origin, minutes)
+    else:
+        average = np.zeros((2, minutes))
+
+    online, on_calls = average
+    occupancy = np.divide(on_calls * 100, online, out=np.zeros(minutes), where=online > 0)
+    return {
+        "agents_available": np.round(online, 2).tolist(),
+        "agents_on_calls": np.round(on_calls, 2).tolist(),
+        "occupancy": np.round(occupancy, 1).tolist(),
+    }
+
+
+def build_timeline(window: ReportWindow, queues: List[dict], agents: dict) -> dict:
+    """The schemas.ConcurrencyTimelineResponse layout."""
+    origin, minutes = minute_grid(window)
+    return {
+        "status": "success",
+        "user_time_zone": window.user_time_zone,
+        "start": datetime.fromtimestamp(origin, pytz.timezone(window.user_time_zone)),
+        "step_seconds": STEP_SECONDS,
+        "minutes": minutes,
+        "queues": queues,
+        "agents": agents,
+    }
@@ -0,0 +1,97 @@
+# today.py
+"""Running "today" totals, kept in process and topped up on every poll.
+
+The since-today reports are polled every minute, and each poll used to re-add
+everything since local midnight. A TodayAggregator keeps the per-key totals of
+a report for each (time zone, local day) up to a settled instant, and a poll
+only folds in the rows past it: the cost follows the calls since the last
+poll, not the hour of the day.
+
+Rows settle ROLLUP_SETTLE_SECONDS behind now, like the rollup job's buckets;
+the unsettled tail is re-read on every poll and never folded. The first poll
+of a day (per worker) reads the day so far through the rollups. The totals
+must be plain counts and sums, as the rollups' are.
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Tuple
+
+from app import rollups
+from app.config import settings
+from app.utils import ReportWindow
+from database import fetch_rows_async
+
+
+class _DayTotals:
+    def __init__(self, settled_until: datetime):
+        # Totals cover [day start, settled_until)
+        self.settled_until = settled_until
+        self.totals: Dict[str, dict] = {}
+        self.lock = asyncio.Lock()
+
+
+class TodayAggregator:
+    def __init__(self, name: str, raw_query, rollup_query, from_rows: Callable, naive_utc: bool = False):
+        """name, queries and from_rows as for rollups.fetch_window_totals_async."""
+        self.name = name
+        self.raw_query = raw_query
+        self.rollup_query = rollup_query
+        self.from_rows = from_rows
+        self.naive_utc = naive_utc
+        self._days: Dict[Tuple[str, date], _DayTotals] = {}
+        self._stats = {"polls": 0, "folds": 0, "days_started": 0}
+
+    def _day(self, window: ReportWindow) -> _DayTotals:
+        key = (window.user_time_zone, window.start_user.date())
+        day = self._days.get(key)
+        if day is None:
+            # Yesterday's totals of this zone are done with
+            for old in [old for old in self._days if old[0] == window.user_time_zone]:
+                del self._days[old]
+            day = self._days[key] = _DayTotals(window.start_utc)
+            self._stats["days_started"] += 1
+        return day
+
+    def _bound(self, value: datetime) -> datetime:
+        # Bounds are aware UTC; asyncpg wants naive ones for naive columns
+        return value.replace(tzinfo=None) if self.naive_utc else value
+
+    async def _fold(self, day: _DayTotals, until: datetime) -> None:
+        # [settled_until, until) in the inclusive bounds of the report queries
+        new = await rollups.fetch_window_totals_async(
+            self.name, "today", day.settled_until, until - timedelta(microseconds=1),
+            self.raw_query, self.rollup_query, self.from_rows, naive_utc=self.naive_utc)
+        day.totals = rollups.combine_totals([day.totals, new])
+        day.settled_until = until
+        self._stats["folds"] += 1
+
+    async def _tail(self, start_time: datetime, end_time: datetime) -> Dict[str, dict]:
+        rows = await fetch_rows_async(self.raw_query, {'start_time': self._bound(start_time),
+                                                       'end_time': self._bound(end_time)})
+        return self.from_rows(rows)
+
+    async def totals(self, window: ReportWindow) -> Dict[str, dict]:
+        """Per-key totals of a "today" window, as fetch_window_totals_async would return them."""
+        day = self._day(window)
+        end_time = window.end_utc
+        settle_until = end_time - timedelta(seconds=settings.ROLLUP_SETTLE_SECONDS)
+
+        async with day.lock:
+            self._stats["polls"] += 1
+            if settle_until > day.settled_until:
+                _, tail = await asyncio.gather(self._fold(day, settle_until),
+                                               self._tail(settle_until, end_time))
+            else:
+                tail = await self._tail(day.settled_until, end_time)
+            # combine_totals copies, so the running totals are not handed out
+            return rollups.combine_totals([day.totals, tail])
+
+    def stats(self) -> dict:
+        return dict(self._stats, days=[{"user_time_zone": zone, "day": day.isoformat(),
+                                        "settled_until": totals.settled_until.isoformat(),
+                                        "keys": len(totals.totals)}
+                                       for (zone, day), totals in self._days.items()])
+
+
+def enabled_for(window: ReportWindow) -> bool:
+    return window.kind == "today" and settings.TODAY_AGGREGATES_ENABLED
@@ -1,5 +1,209 @@
 # utils.py
+import csv
+import io
+import json
+import tempfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import pytz
+
+try:
+    import xlsxwriter
+except ImportError:  # optional dependency
+    xlsxwriter = None
+
+
 def seconds_to_hms(seconds: int) -> str:
     hours, remainder = divmod(seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
-    return f"{hours:02}:{minutes:02}:{seconds:02}"
\ No newline at end of file
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
+# ------------------------------------------ report windows ----------------------------------->
+
+@dataclass(frozen=True)
+class ReportWindow:
+    """A reporting window, held in the user's time zone and queried in UTC."""
+    kind: str  # "15m", "30m", "today" or "range"
+    user_time_zone: str
+    start_user: datetime
+    end_user: datetime
+
+    @property
+    def start_utc(self) -> datetime:
+        return self.start_user.astimezone(pytz.utc)
+
+    @property
+    def end_utc(self) -> datetime:
+        return self.end_user.astimezone(pytz.utc)
+
+    @property
+    def params(self) -> dict:
+        return {'start_time': self.start_utc, 'end_time': self.end_utc}
+
+    @property
+    def key(self) -> str:
+        # Rolling windows asked for at the same moment are the same report
+        if self.kind == "range":
+            return f"range:{self.user_time_zone}:{self.start_user.isoformat()}/{self.end_user.isoformat()}"
+        return f"{self.kind}:{self.user_time_zone}"
+
+
+def last_minutes_window(user_time_zone: str, minutes: int) -> ReportWindow:
+    user_tz = pytz.timezone(user_time_zone)
+    now_user = datetime.now(user_tz)
+    return ReportWindow(f"{minutes}m", user_time_zone,
+                        now_user - timedelta(minutes=minutes), now_user)
+
+
+def today_window(user_time_zone: str) -> ReportWindow:
+    user_tz = pytz.timezone(user_time_zone)
+    now_user = datetime.now(user_tz)
+    # Midnight is resolved through localize() so DST days start at the right offset
+    start_user = user_tz.localize(datetime.combine(now_user.date(), datetime.min.time()))
+    return ReportWindow("today", user_time_zone, start_user, now_user)
+
+
+def date_range_window(user_time_zone: str, start_date: str, end_date: str,
+                      whole_days: bool = False) -> ReportWindow:
+    user_tz = pytz.timezone(user_time_zone)
+    start_user = datetime.fromisoformat(start_date).astimezone(user_tz)
+    end_user = datetime.fromisoformat(end_date).astimezone(user_tz)
+
+    # Queue reports always covered whole days of the selected range
+    if whole_days:
+        start_user = start_user.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_user = end_user.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    return ReportWindow("range", user_time_zone, start_user, end_user)
+
+
+# ------------------------------------------ metric groups ----------------------------------->
+
+def parse_fields(fields: Optional[str], groups: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """The metric groups named in a comma separated fields= parameter, None for all of them."""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(groups)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(groups)}")
+    return tuple(sorted(requested)) or None
+
+
+def select_metric_groups(metrics: dict, fields: Iterable[str], empty: dict) -> dict:
+    """Metrics with every group outside fields replaced by its empty form."""
+    fields = set(fields)
+    return {group: section if group in fields else empty[group] for group, section in metrics.items()}
+
+
+# ------------------------------------------ streaming exports ----------------------------------->
+
+# Bytes buffered before a chunk is handed to the response, so rows are not sent one by one
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _chunked(lines: Iterator[str]) -> Iterator[bytes]:
+    # The first line goes out on its own so the client sees bytes straight away
+    for line in lines:
+        yield line.encode()
+        break
+
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def ndjson_stream(rows: Iterable[dict]) -> Iterator[bytes]:
+    return _chunked(json.dumps(row, default=_json_default) + "\n" for row in rows)
+
+
+def csv_stream(rows: Iterable[dict], fields: Sequence[str]) -> Iterator[bytes]:
+    def lines():
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: value.isoformat() if isinstance(value, datetime) else value
+                             for field, value in row.items()})
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        yield out.getvalue()
+    return _chunked(lines())
+
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def xlsx_stream(rows: Iterable[dict], fields: Sequence[str], sheet_name: str = "Report") -> Iterator[bytes]:
+    """The rows as an XLSX workbook.
+
+    In constant_memory mode xlsxwriter flushes every row to a temporary file as
+    it is written. A zip can't be sent before it is complete, so the workbook is
+    put together on disk and streamed from there.
+    """
+    with tempfile.TemporaryFile() as out:
+        workbook = xlsxwriter.Workbook(out, {"constant_memory": True})
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, fields)
+        for index, row in enumerate(rows, start=1):
+            sheet.write_row(index, 0, [row[field].isoformat() if isinstance(row.get(field), datetime)
+                                       else row.get(field) for field in fields])
+        workbook.close()
+
+        out.seek(0)
+        while chunk := out.read(STREAM_CHUNK_BYTES):
+            yield chunk
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Content-Encoding: gzip of a streamed body, compressed chunk by chunk."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single "bytes=" Range header, None to send the whole body.
+
+    Malformed and multi-range headers are ignored; raises ValueError when the
+    range cannot be satisfied (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
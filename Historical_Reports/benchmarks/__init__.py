@@ -0,0 +1,11 @@
+"""Benchmarks for the report API.
+
+    python -m benchmarks.generate --database-url postgresql://localhost/zconnect_bench --rows 1000000
+    python -m benchmarks.run --database-url postgresql://localhost/zconnect_bench --json bench.json
+
+generate fills a throwaway Postgres with synthetic cdr, historical_agents_metrics,
+login_logout and recordings rows; run starts the API on it and times every
+endpoint, per window, with p50/p95 latency, rows scanned and peak RSS. Pass
+--baseline with an earlier --json to fail on regressions. Both refuse to run
+without an explicit --database-url, so they never touch the configured database.
+"""
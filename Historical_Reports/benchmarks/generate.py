@@ -0,0 +1,252 @@
+# benchmarks/generate.py
+"""Synthetic report data for benchmarking, generated inside Postgres.
+
+Calls are spread uniformly over the last --days. An answered call leaves an
+a-leg and a b-leg in cdr (linked through bleg_uuid), a missed one only its
+a-leg, so --rows (cdr legs, 10k to 50M) is about calls * (1 + answer rate).
+Agents post a historical_agents_metrics snapshot every few seconds, log in
+and out once a day, and a share of the answered calls has a recording.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from app.models import CDR, HistoricalAgent, LoginLogout
+
+# Calls (or snapshots, recordings) per INSERT ... SELECT, committed one by one
+BATCH = 200_000
+
+ANSWER_RATE = 0.8
+
+# Tables filled here and the ones derived from them, emptied by --reset
+BENCH_TABLES = ("cdr", "historical_agents_metrics", "login_logout", "recordings", "directory_search")
+DERIVED_TABLES = ("call_facts", "agent_call_rollup_15m", "queue_call_rollup_15m",
+                  "agent_state_intervals", "rollup_watermarks")
+
+# file_content is bytea in production, whatever the model says
+RECORDINGS_DDL = """
+    CREATE TABLE IF NOT EXISTS recordings (
+        id SERIAL PRIMARY KEY,
+        call_log_id VARCHAR,
+        caller_id_number VARCHAR,
+        destination_number VARCHAR,
+        agent VARCHAR,
+        duration INTEGER,
+        record_filename VARCHAR,
+        file_content BYTEA,
+        queue_name VARCHAR,
+        file_path VARCHAR,
+        file_size BIGINT
+    )
+"""
+
+DIRECTORY_SEARCH_DDL = """
+    CREATE TABLE IF NOT EXISTS directory_search (
+        extension VARCHAR(20),
+        firstname VARCHAR(100),
+        lastname VARCHAR(100)
+    )
+"""
+
+CDR_INSERT = text("""
+    INSERT INTO cdr (uuid, bleg_uuid, direction, cc_agent, cc_queue, caller_id_number, destination_number,
+                     start_stamp, answer_stamp, end_stamp, duration, billsec, waitsec, hangup_cause, timestamp)
+    WITH calls AS (
+        SELECT
+            i,
+            CAST(:start_time AS timestamp) + random() * :span_seconds * interval '1 second' AS start_stamp,
+            random() < :answer_rate AS answered,
+            floor(random() * 90)::int AS wait,
+            30 + floor(random() * 570)::int AS talk,
+            1 + floor(random() * :agents)::int AS agent,
+            'queue-' || (1 + floor(random() * :queues)::int) AS queue,
+            '9' || lpad(floor(random() * 1000000000)::bigint::text, 9, '0') AS caller
+        FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS i
+    )
+    SELECT
+        md5('a' || i)::uuid::text,
+        CASE WHEN answered THEN md5('b' || i)::uuid::text END,
+        'inbound',
+        CASE WHEN answered THEN 'Agent ' || agent END,
+        queue,
+        caller,
+        '8000',
+        start_stamp,
+        CASE WHEN answered THEN start_stamp + wait * interval '1 second' END,
+        start_stamp + (wait + CASE WHEN answered THEN talk ELSE 0 END) * interval '1 second',
+        wait + CASE WHEN answered THEN talk ELSE 0 END,
+        CASE WHEN answered THEN talk ELSE 0 END,
+        wait,
+        CASE WHEN answered THEN 'NORMAL_CLEARING' ELSE 'ORIGINATOR_CANCEL' END,
+        start_stamp + (wait + CASE WHEN answered THEN talk ELSE 0 END) * interval '1 second'
+    FROM calls
+    UNION ALL
+    SELECT
+        md5('b' || i)::uuid::text,
+        NULL,
+        'outbound',
+        'Agent ' || agent,
+        queue,
+        caller,
+        (1000 + agent)::text,
+        start_stamp + wait * interval '1 second',
+        start_stamp + wait * interval '1 second',
+        start_stamp + (wait + talk) * interval '1 second',
+        talk,
+        talk,
+        0,
+        'NORMAL_CLEARING',
+        start_stamp + (wait + talk) * interval '1 second'
+    FROM calls
+    WHERE answered
+""")
+
+STATE_INSERT = text("""
+    INSERT INTO historical_agents_metrics (timestamp, agent_id, name, type, contact, status, state)
+    SELECT
+        CAST(:start_time AS timestamptz) + k * :interval_seconds * interval '1 second',
+        a,
+        'Agent ' || a,
+        'callback',
+        'user/' || (1000 + a),
+        CASE
+            WHEN (k / 40 + a) % 9 = 0 THEN 'On Break'
+            WHEN (k / 40 + a) % 13 = 0 THEN 'Logged Out'
+            ELSE 'Available'
+        END,
+        CASE WHEN (k / 4 + a) % 3 = 0 THEN 'In a queue call' ELSE 'Waiting' END
+    FROM generate_series(1, :agents) AS a,
+         generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS k
+""")
+
+LOGIN_INSERT = text("""
+    INSERT INTO login_logout (agent_name, agent_status, login_timestamp, logout_timestamp, duration, role, timestamp)
+    SELECT
+        'Agent ' || a,
+        'Logged Out',
+        shift.login,
+        shift.login + shift.length,
+        shift.length::time,
+        'Agent',
+        shift.login + shift.length
+    FROM generate_series(1, :agents) AS a,
+         generate_series(0, :days - 1) AS d,
+         LATERAL (SELECT
+                      CAST(:start_time AS timestamp) + d * interval '1 day' + (6 + a % 6) * interval '1 hour' AS login,
+                      (4 + (a + d) % 5) * interval '1 hour' AS length) AS shift
+""")
+
+RECORDING_INSERT = text("""
+    INSERT INTO recordings (call_log_id, caller_id_number, destination_number, agent, duration,
+                            record_filename, file_content, queue_name)
+    SELECT
+        md5('a' || i)::uuid::text,
+        '9' || lpad((i * 7919 % 1000000000)::text, 9, '0'),
+        '8000',
+        'Agent ' || (1 + i % :agents),
+        30 + i % 570,
+        'rec-' || i || '.mp3',
+        decode(repeat(md5(i::text), :recording_kb * 64), 'hex'),
+        'queue-' || (1 + i % :queues)
+    FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS i
+""")
+
+DIRECTORY_INSERT = text("""
+    INSERT INTO directory_search (extension, firstname, lastname)
+    SELECT (1000 + a)::text, 'Agent', a::text
+    FROM generate_series(1, :agents) AS a
+""")
+
+
+def _batched(conn, query, total: int, params: dict, label: str) -> None:
+    started = time.monotonic()
+    for first in range(1, total + 1, BATCH):
+        last = min(first + BATCH - 1, total)
+        conn.execute(query, {**params, 'first': first, 'last': last})
+        conn.commit()
+        print(f"  {label}: {last:,}/{total:,} ({time.monotonic() - started:.0f}s)")
+
+
+def create_tables(engine) -> None:
+    tables = [model.__table__ for model in (CDR, HistoricalAgent, LoginLogout)]
+    CDR.metadata.create_all(engine, tables=tables, checkfirst=True)
+    with engine.begin() as conn:
+        # Read by the login/logout reports, missing from the model
+        conn.execute(text("ALTER TABLE login_logout ADD COLUMN IF NOT EXISTS timestamp TIMESTAMP"))
+        conn.execute(text(RECORDINGS_DDL))
+        conn.execute(text(DIRECTORY_SEARCH_DDL))
+
+
+def reset(engine) -> None:
+    with engine.begin() as conn:
+        for table in BENCH_TABLES + DERIVED_TABLES:
+            conn.execute(text(f"""
+                DO $$ BEGIN
+                    IF to_regclass('{table}') IS NOT NULL THEN TRUNCATE {table}; END IF;
+                END $$
+            """))
+
+
+def generate(database_url: str, rows: int, days: int, agents: int, queues: int,
+             state_rows: int, recording_share: float, recording_kb: int, clear: bool) -> None:
+    engine = create_engine(database_url)
+    create_tables(engine)
+    if clear:
+        reset(engine)
+
+    now = datetime.utcnow().replace(microsecond=0)
+    start_time = now - timedelta(days=days)
+    span_seconds = days * 86400
+    calls = max(1, int(rows / (1 + ANSWER_RATE)))
+    snapshots = max(1, state_rows // agents)
+    recordings = int(calls * ANSWER_RATE * recording_share)
+
+    with engine.connect() as conn:
+        _batched(conn, CDR_INSERT, calls, {
+            'start_time': start_time, 'span_seconds': span_seconds, 'answer_rate': ANSWER_RATE,
+            'agents': agents, 'queues': queues
+        }, "cdr calls")
+        _batched(conn, STATE_INSERT, snapshots, {
+            'start_time': start_time, 'interval_seconds': span_seconds / snapshots, 'agents': agents
+        }, "agent snapshots per agent")
+        conn.execute(LOGIN_INSERT, {'start_time': start_time, 'agents': agents, 'days': days})
+        conn.execute(DIRECTORY_INSERT, {'agents': agents})
+        conn.commit()
+        if recordings:
+            _batched(conn, RECORDING_INSERT, recordings, {
+                'agents': agents, 'queues': queues, 'recording_kb': recording_kb
+            }, "recordings")
+
+    # Plans are only realistic with fresh statistics
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for table in BENCH_TABLES:
+            conn.execute(text(f"ANALYZE {table}"))
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a benchmark database with synthetic report data.")
+    parser.add_argument("--database-url", required=True,
+                        help="a throwaway database, e.g. postgresql://localhost/zconnect_bench")
+    parser.add_argument("--rows", type=int, default=100_000, help="cdr rows (legs), 10k to 50M")
+    parser.add_argument("--days", type=int, default=30, help="days of history ending now")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--queues", type=int, default=8)
+    parser.add_argument("--state-rows", type=int, default=None,
+                        help="historical_agents_metrics snapshots (default: same as --rows)")
+    parser.add_argument("--recording-share", type=float, default=0.1,
+                        help="share of answered calls with a recording")
+    parser.add_argument("--recording-kb", type=int, default=32, help="size of every recording")
+    parser.add_argument("--reset", action="store_true", help="empty the tables first")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    generate(args.database_url, args.rows, args.days, args.agents, args.queues,
+             args.state_rows or args.rows, args.recording_share, args.recording_kb, args.reset)
+    print(f"Generated in {time.monotonic() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# benchmarks/run.py
+"""Time every API endpoint, per window, against the benchmark database.
+
+The API runs under uvicorn in a child process pointed at --database-url, with
+the response cache off unless --with-cache, so every request reaches Postgres.
+For each case it reports:
+
+- p50/p95 latency over --repeat requests, after one warm-up request
+- rows scanned per request: sequential plus index tuple reads of every table,
+  from pg_stat_user_tables (the statistics are flushed about once a second,
+  so the figure is taken after a pause)
+- peak RSS of the API process while serving the case (VmHWM, reset per case)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIME_ZONE = "Asia/Kolkata"
+
+STATS_FLUSH_SECONDS = 1.1
+
+ROWS_READ_QUERY = text("""
+    SELECT COALESCE(SUM(COALESCE(seq_tup_read, 0) + COALESCE(idx_tup_fetch, 0)), 0)
+    FROM pg_stat_user_tables
+""")
+
+
+def endpoint_cases(recording_id: Optional[int]) -> List[dict]:
+    """(name, path, query, headers) of every endpoint and window the dashboards use."""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    week = {'start_date': (now - timedelta(days=7)).isoformat(), 'end_date': now.isoformat()}
+    tz = {'user_time_zone': TIME_ZONE}
+
+    cases = []
+    for prefix, windows in (
+        ("/agents-performance", ("15-minutes-time-interval", "30-minutes-time-interval", "since_today")),
+        ("/queue-metrics", ("15-minutes-time-interval", "30-minutes-time-interval", "today")),
+    ):
+        for window in windows:
+            cases.append({'name': f"{prefix}/{window}", 'path': f"{prefix}/{window}", 'query': tz})
+    cases += [
+        {'name': "/agents-performance/date-range (7d)", 'path': "/agents-performance/date-range",
+         'query': {**tz, **week}},
+        {'name': "/api/queue-metrics/daterange (7d)", 'path': "/api/queue-metrics/daterange",
+         'query': {**tz, **week}},
+        {'name': "/agents-login-logout/today", 'path': "/agents-login-logout/today", 'query': tz},
+        {'name': "/agents-performance/login_logout_custom_range (7d)",
+         'path': "/agents-performance/login_logout_custom_range", 'query': {**tz, **week}},
+        {'name': "/cdr-reports/today", 'path': "/cdr-reports/today", 'query': tz},
+        {'name': "/cdr-reports/custom-range (7d, page of 500)", 'path': "/cdr-reports/custom-range",
+         'query': {**tz, **week, 'limit': 500}},
+        {'name': "/cdr-reports/custom-range (7d, ndjson)", 'path': "/cdr-reports/custom-range",
+         'query': {**tz, **week, 'format': "ndjson"}},
+        {'name': "/agents-performance/date-range/export (7d, csv)", 'path': "/agents-performance/date-range/export",
+         'query': {**tz, **week}},
+        {'name': "/agents-performance/date-range/export (7d, xlsx)", 'path': "/agents-performance/date-range/export",
+         'query': {**tz, **week, 'format': "xlsx"}},
+        {'name': "/api/queue-metrics/daterange/export (7d, csv)", 'path': "/api/queue-metrics/daterange/export",
+         'query': {**tz, **week}},
+        {'name': "/agents-performance/series (7d, 15m)", 'path': "/agents-performance/series",
+         'query': {**tz, **week, 'step': "15m"}},
+        {'name': "/queue-metrics/series (7d, 15m)", 'path': "/queue-metrics/series",
+         'query': {**tz, **week, 'step': "15m"}},
+        {'name': "/capacity/concurrency (7d)", 'path': "/capacity/concurrency", 'query': {**tz, **week}},
+        {'name': "/capacity/staffing (7d)", 'path': "/capacity/staffing", 'query': {**tz, **week}},
+        {'name': "/agents", 'path': "/agents", 'query': {}},
+        {'name': "/api/recordings", 'path': "/api/recordings", 'query': {}},
+        {'name': "/api/recordings?agent=", 'path': "/api/recordings", 'query': {'agent': "Agent 1"}},
+    ]
+    if recording_id is not None:
+        cases += [
+            {'name': "/api/recordings/play", 'path': f"/api/recordings/play/{recording_id}", 'query': {}},
+            {'name': "/api/recordings/play (64KiB range)", 'path': f"/api/recordings/play/{recording_id}",
+             'query': {}, 'headers': {'Range': "bytes=0-65535"}},
+        ]
+    return cases
+
+
+def start_api(database_url: str, port: int, with_cache: bool) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=database_url, CACHE_ENABLED=str(with_cache).lower())
+    env.pop("ASYNC_DATABASE_URL", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/debug/cache-stats", timeout=1).read()
+            return process
+        except (urllib.error.URLError, ConnectionError):
+            if process.poll() is not None:
+                raise RuntimeError("The API exited while starting")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The API did not start within 30s")
+
+
+def _request(port: int, case: dict) -> float:
+    url = f"http://127.0.0.1:{port}{case['path']}"
+    if case['query']:
+        url += "?" + urllib.parse.urlencode(case['query'])
+    request = urllib.request.Request(url, headers=case.get('headers', {}))
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        while response.read(1 << 16):
+            pass
+    return time.perf_counter() - started
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def _reset_peak_rss(pid: int) -> None:
+    # "5" resets VmHWM to the current RSS (Linux)
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _rows_read(engine) -> int:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_stat_clear_snapshot()"))
+        return int(conn.execute(ROWS_READ_QUERY).scalar())
+
+
+def run_case(engine, port: int, pid: int, case: dict, repeat: int) -> dict:
+    try:
+        _request(port, case)
+    except urllib.error.HTTPError as e:
+        return {'name': case['name'], 'error': f"HTTP {e.code}"}
+
+    time.sleep(STATS_FLUSH_SECONDS)
+    rows_before = _rows_read(engine)
+    _reset_peak_rss(pid)
+    samples = [_request(port, case) for _ in range(repeat)]
+    peak_rss = _peak_rss_mb(pid)
+    time.sleep(STATS_FLUSH_SECONDS)
+    rows_after = _rows_read(engine)
+
+    return {
+        'name': case['name'],
+        'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+        'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+        'rows_scanned': (rows_after - rows_before) // repeat,
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+    }
+
+
+def print_results(results: List[dict]) -> None:
+    width = max(len(result['name']) for result in results)
+    print(f"{'endpoint':<{width}}  {'p50 ms':>9}  {'p95 ms':>9}  {'rows/req':>12}  {'peak RSS MB':>11}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['name']:<{width}}  {result['error']}")
+            continue
+        rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else "-"
+        print(f"{result['name']:<{width}}  {result['p50_ms']:>9.1f}  {result['p95_ms']:>9.1f}  "
+              f"{result['rows_scanned']:>12,}  {rss:>11}")
+
+
+def regressions(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Cases whose p95 or rows scanned grew past the baseline by more than tolerance."""
+    previous: Dict[str, dict] = {result['name']: result for result in baseline if 'error' not in result}
+    found = []
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None or 'error' in result:
+            continue
+        for metric in ('p95_ms', 'rows_scanned'):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                found.append(f"{result['name']}: {metric} {before[metric]} -> {result[metric]}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every API endpoint against a benchmark database.")
+    parser.add_argument("--database-url", required=True, help="the database filled by benchmarks.generate")
+    parser.add_argument("--repeat", type=int, default=20, help="timed requests per case")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--with-cache", action="store_true", help="leave the response cache on")
+    parser.add_argument("--rollups", action="store_true",
+                        help="bring call_facts, the rollups and the state intervals up to date first")
+    parser.add_argument("--only", default=None, help="only cases whose name contains this")
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    parser.add_argument("--baseline", default=None, help="results of an earlier --json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed growth over the baseline")
+    args = parser.parse_args()
+
+    if args.rollups:
+        subprocess.run([sys.executable, "-m", "app.rollups"], cwd=ROOT, check=True,
+                       env=dict(os.environ, DATABASE_URL=args.database_url))
+
+    engine = create_engine(args.database_url)
+    with engine.connect() as conn:
+        recording_id = conn.execute(text("SELECT MIN(id) FROM recordings")).scalar()
+    if recording_id is None:
+        print("No recordings in the database: the /api/recordings/play cases are skipped")
+    cases = [case for case in endpoint_cases(recording_id) if not args.only or args.only in case['name']]
+
+    api = start_api(args.database_url, args.port, args.with_cache)
+    try:
+        results = []
+        for case in cases:
+            results.append(run_case(engine, args.port, api.pid, case, args.repeat))
+            print(f"  {case['name']} done")
+    finally:
+        api.terminate()
+        api.wait()
+        engine.dispose()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'generated_at': datetime.now(timezone.utc).isoformat(), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f)['results'], args.tolerance)
+        if found:
+            print("\nRegressions against the baseline:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,193 @@
 # database.py
 
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import pytz
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from app import querystats
 from app.config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def _create_engine(url: str, **connect_args):
+    return create_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        poolclass=querystats.TimedQueuePool,
+        connect_args={"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}", **connect_args},
+    )
+
+
+def _create_async_engine(url: str, **connect_args):
+    return create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        poolclass=querystats.TimedAsyncQueuePool,
+        connect_args={"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)},
+                      **connect_args},
+    )
+
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine on asyncpg, used by the report endpoints to run their queries concurrently
+async_engine = _create_async_engine(settings.ASYNC_DATABASE_URL)
+
+# Statement timings for /debug/query-stats
+querystats.instrument(engine)
+querystats.instrument(async_engine.sync_engine)
+
+
+# ---- read replicas ---->
+#
+# Reports can read from streaming replicas of freeswitchcore instead of the
+# primary FreeSWITCH writes into (READ_REPLICA_URLS). Each replica is checked
+# at most every REPLICA_CHECK_INTERVAL_SECONDS, on the first read that finds
+# its last check stale, for whether it answers and how far its replay is
+# behind. A read goes to a replica that is up and whose lag still covers what
+# it reads: up to REPLICA_MAX_LAG_SECONDS for windows ending now, more for
+# windows that ended a while ago. Otherwise it goes to the primary.
+#
+# Each worker prefers its replicas in its own order and sticks to the first
+# usable one, so the reads of one report (watermark, rollups, raw edges) see
+# the same replica and the workers spread over all of them.
+
+REPLICA_HEALTH_QUERY = text("""
+    SELECT pg_is_in_recovery(),
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+           END
+""")
+
+
+class Replica:
+    """A read replica's engines and what its last health check found."""
+
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        timeout = settings.REPLICA_CONNECT_TIMEOUT_SECONDS
+        self.engine = _create_engine(url, connect_timeout=timeout)
+        self.async_engine = _create_async_engine(
+            url.replace("postgresql://", "postgresql+asyncpg://", 1), timeout=timeout)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        querystats.instrument(self.engine)
+        querystats.instrument(self.async_engine.sync_engine)
+
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def record(self, row=None, error: Optional[Exception] = None) -> None:
+        if error is not None:
+            self.healthy, self.lag_seconds, self.error = False, None, str(error)
+            print(f"Read replica {self.name} is unavailable: {error}")
+            return
+        in_recovery, lag = row
+        if not in_recovery:
+            # Promoted, so behind nothing
+            lag = 0
+        self.healthy = lag is not None
+        self.lag_seconds = float(lag) if lag is not None else None
+        self.error = None if self.healthy else "replay has not started"
+
+    def stats(self) -> dict:
+        return {"name": self.name, "healthy": self.healthy, "lag_seconds": self.lag_seconds, "error": self.error,
+                "checked_seconds_ago": None if self.checked_at is None
+                else round(time.monotonic() - self.checked_at, 1)}
+
+
+replicas: List[Replica] = [Replica(url) for url in settings.READ_REPLICA_URLS]
+# Each worker starts its preference at a different replica
+_offset = os.getpid() % len(replicas) if replicas else 0
+_replica_order = replicas[_offset:] + replicas[:_offset]
+_check_lock = threading.Lock()
+_read_counts = {"replica": 0, "primary": 0, "replica_errors": 0}
+
+
+def _check_due(replica: Replica) -> bool:
+    # Claims the check, so concurrent reads don't all run it
+    with _check_lock:
+        now = time.monotonic()
+        if replica.checked_at is not None and now - replica.checked_at < settings.REPLICA_CHECK_INTERVAL_SECONDS:
+            return False
+        replica.checked_at = now
+        return True
+
+
+def _check_replica(replica: Replica) -> None:
+    if not _check_due(replica):
+        return
+    try:
+        with replica.engine.connect() as conn:
+            replica.record(conn.execute(REPLICA_HEALTH_QUERY).first())
+    except Exception as e:
+        replica.record(error=e)
+
+
+async def _check_replica_async(replica: Replica) -> None:
+    if not _check_due(replica):
+        return
+    try:
+        async with replica.async_engine.connect() as conn:
+            replica.record((await conn.execute(REPLICA_HEALTH_QUERY)).first())
+    except Exception as e:
+        replica.record(error=e)
+
+
+def replica_lag_allowance(end_time: Optional[datetime] = None) -> float:
+    """Seconds a replica may lag and still hold every row up to end_time (naive means UTC)."""
+    if end_time is None:
+        return settings.REPLICA_MAX_LAG_SECONDS
+    if end_time.tzinfo is None:
+        end_time = pytz.utc.localize(end_time)
+    behind = (datetime.now(pytz.utc) - end_time).total_seconds()
+    return max(settings.REPLICA_MAX_LAG_SECONDS, behind)
+
+
+def _usable(replica: Replica, max_lag: float) -> bool:
+    return replica.healthy and replica.lag_seconds <= max_lag
+
+
+def pick_replica(max_lag: Optional[float] = None) -> Optional[Replica]:
+    """The replica to read from, or None for the primary."""
+    max_lag = settings.REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+    for replica in _replica_order:
+        _check_replica(replica)
+        if _usable(replica, max_lag):
+            return replica
+    return None
+
+
+async def pick_replica_async(max_lag: Optional[float] = None) -> Optional[Replica]:
+    max_lag = settings.REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+    for replica in _replica_order:
+        await _check_replica_async(replica)
+        if _usable(replica, max_lag):
+            return replica
+    return None
+
+
+def replica_stats() -> dict:
+    return dict(_read_counts, replicas=[replica.stats() for replica in replicas])
+
+
 # app/database.py
 def get_db():
     db = SessionLocal()
@@ -18,5 +197,52 @@ def get_db():
         db.close()
 
 
+def read_session(max_lag: Optional[float] = None):
+    """A session for read-only queries, on a replica when one is usable."""
+    replica = pick_replica(max_lag)
+    _read_counts["replica" if replica else "primary"] += 1
+    return (replica.SessionLocal if replica else SessionLocal)()
+
+
+def get_read_db():
+    """get_db for read-only report endpoints: a replica when one is up and caught up."""
+    db = read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _replica_gone(error: Exception) -> bool:
+    # Lost or refused connections, not errors in the statement
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error.orig, (OSError, TimeoutError))
+    return isinstance(error, (OSError, TimeoutError))
+
+
+async def fetch_rows_async(query, params: dict) -> list:
+    """Run one read query on its own pooled connection, so callers can gather several.
 
+    Reads go to a replica holding everything up to params['end_time'] when
+    there is one; a replica that drops the connection is marked down and the
+    query rerun on the primary.
+    """
+    # Statements of gathered tasks can't be traced back through the stack
+    caller = querystats.caller_name()
+    replica = await pick_replica_async(replica_lag_allowance(params.get('end_time'))) if replicas else None
+    if replica is not None:
+        try:
+            async with replica.async_engine.connect() as conn:
+                result = await conn.execute(query, params, execution_options={"query_caller": caller})
+                _read_counts["replica"] += 1
+                return result.fetchall()
+        except Exception as e:
+            if not _replica_gone(e):
+                raise
+            _read_counts["replica_errors"] += 1
+            replica.record(error=e)
 
+    _read_counts["primary"] += 1
+    async with async_engine.connect() as conn:
+        result = await conn.execute(query, params, execution_options={"query_caller": caller})
+        return result.fetchall()
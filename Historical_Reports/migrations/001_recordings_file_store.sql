@@ -0,0 +1,9 @@
+-- Recording audio moves from recordings.file_content to the content-addressed
+-- file store (app/recording_store.py). Rows keep the relative path and size.
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS file_path TEXT;
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS file_size BIGINT;
+
+-- The migration tool walks the rows that still hold a blob
+CREATE INDEX CONCURRENTLY IF NOT EXISTS recordings_pending_blob_idx
+    ON recordings (id)
+    WHERE file_path IS NULL AND file_content IS NOT NULL;
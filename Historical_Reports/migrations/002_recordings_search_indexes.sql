@@ -0,0 +1,17 @@
+-- Trigram indexes keep the ILIKE '%...%' recording filters off sequential scans.
+-- CONCURRENTLY cannot run inside a transaction: apply with plain psql.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS recordings_agent_trgm_idx
+    ON recordings USING gin (agent gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS recordings_caller_id_number_trgm_idx
+    ON recordings USING gin (caller_id_number gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS recordings_destination_number_trgm_idx
+    ON recordings USING gin (destination_number gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS recordings_queue_name_trgm_idx
+    ON recordings USING gin (queue_name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS recordings_call_log_id_trgm_idx
+    ON recordings USING gin (call_log_id gin_trgm_ops);
+
+-- Fresh statistics for the X-Total-Count-Estimate planner estimate
+ANALYZE recordings;
@@ -0,0 +1,45 @@
+-- Reports count calls from call_facts (app/call_facts.py) instead of cdr legs.
+-- The rollup job fills call_facts and creates the new rollups; its first run
+-- rebuilds them from the whole of cdr.
+
+-- Every report query reads these through call_facts.CALLS_SQL, so they have to
+-- exist before the job first runs (or when it never does, ROLLUPS_ENABLED off):
+-- empty and without a watermark, the calls are all merged from cdr on the fly.
+-- Same definitions as app/models.py.
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR PRIMARY KEY,
+    processed_until TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS call_facts (
+    call_uuid VARCHAR PRIMARY KEY,
+    timestamp TIMESTAMP WITHOUT TIME ZONE,
+    direction VARCHAR,
+    cc_agent VARCHAR,
+    cc_queue VARCHAR,
+    start_stamp TIMESTAMP WITHOUT TIME ZONE,
+    answer_stamp TIMESTAMP WITHOUT TIME ZONE,
+    end_stamp TIMESTAMP WITHOUT TIME ZONE,
+    duration INTEGER,
+    billsec INTEGER,
+    waitsec INTEGER,
+    legs INTEGER NOT NULL,
+    bridged BOOLEAN NOT NULL,
+    wait_seconds FLOAT,
+    talk_seconds FLOAT,
+    outcome VARCHAR
+);
+CREATE INDEX IF NOT EXISTS ix_call_facts_timestamp ON call_facts (timestamp);
+
+-- Finds the a-leg of a b-leg when legs are merged into calls
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cdr_bleg_uuid_idx ON cdr (bleg_uuid);
+
+-- Superseded by agent_call_rollup_15m, queue_call_rollup_15m and agent_state_intervals.
+-- The cdr rollups (added with the 15 minute rollups) hold per-leg counts that
+-- cannot be added to per-call counts from the raw edges, and their watermarks
+-- mark those buckets done, so they are replaced under new names that the job
+-- rebuilds from call_facts rather than altered in place.
+DROP TABLE IF EXISTS agent_cdr_rollup_15m;
+DROP TABLE IF EXISTS queue_cdr_rollup_15m;
+DROP TABLE IF EXISTS agent_state_rollup_15m;
+DELETE FROM rollup_watermarks WHERE name IN ('agent_cdr_15m', 'queue_cdr_15m', 'agent_state_15m');
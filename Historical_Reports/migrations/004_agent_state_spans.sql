@@ -0,0 +1,13 @@
+-- Open agent_state_intervals now span on past their latest snapshot, up to the
+-- watermark (see agentCrud.AGENT_STATE_INTERVAL_SPAN_SQL), so the overlap index
+-- is rebuilt on the new span. The rollup job creates the table with it when it
+-- does not exist yet. Same definition as app/models.py.
+DO $$
+BEGIN
+    IF to_regclass('agent_state_intervals') IS NOT NULL THEN
+        DROP INDEX IF EXISTS agent_state_intervals_span_idx;
+        CREATE INDEX agent_state_intervals_span_idx
+            ON agent_state_intervals USING gist (tstzrange(started_at, ended_at, '[)'));
+    END IF;
+END
+$$;
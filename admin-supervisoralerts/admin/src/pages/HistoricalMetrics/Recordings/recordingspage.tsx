@@ -14,6 +14,8 @@ import { Loader2, Filter, Download } from "lucide-react";
 const RecordingsPage: React.FC = () => {
   const [recordings, setRecordings] = useState<any[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [totalEstimate, setTotalEstimate] = useState<number | null>(null);
 
   const [searchAgent, setSearchAgent] = useState("");
   const [searchCaller, setSearchCaller] = useState("");
@@ -22,7 +24,8 @@ const RecordingsPage: React.FC = () => {
 
   const [showFilters, setShowFilters] = useState(false);
 
-  const fetchRecordings = async () => {
+  // Pass a cursor to append the next page, omit it to start a new search
+  const fetchRecordings = async (cursor?: string) => {
     setLoading(true);
     try {
       const params = new URLSearchParams();
@@ -30,13 +33,19 @@ const RecordingsPage: React.FC = () => {
       if (searchCaller) params.append("caller_id_number", searchCaller);
       if (searchDest) params.append("destination_number", searchDest);
       if (searchQueue) params.append("queue_name", searchQueue);
+      if (cursor) params.append("cursor", cursor);
 
       const response = await fetch(
         `${import.meta.env.VITE_API_BASE_URL}/api/recordings?${params.toString()}`
       );
 
       const data = await response.json();
-      setRecordings(data || []);
+      setRecordings((prev) => (cursor ? [...prev, ...(data || [])] : data || []));
+      setNextCursor(response.headers.get("X-Next-Cursor"));
+      if (!cursor) {
+        const estimate = response.headers.get("X-Total-Count-Estimate");
+        setTotalEstimate(estimate ? Number(estimate) : null);
+      }
     } catch (err) {
       console.error("Error loading recordings:", err);
     }
@@ -112,7 +121,7 @@ const RecordingsPage: React.FC = () => {
     {/* BUTTONS */}
     <div className="flex gap-3 mt-4">
       <button
-        onClick={fetchRecordings}
+        onClick={() => fetchRecordings()}
         className="bg-blue-600 text-white px-4 py-1.5 text-sm rounded-md shadow hover:bg-blue-700"
       >
         Search
@@ -136,7 +145,7 @@ const RecordingsPage: React.FC = () => {
 )}
 
           {/* 🔹 LOADING */}
-          {loading ? (
+          {loading && recordings.length === 0 ? (
             <div className="flex justify-center items-center p-10">
               <Loader2 className="animate-spin h-6 w-6 text-gray-500" />
               <span className="ml-2 text-gray-600">Loading recordings...</span>
@@ -202,6 +211,23 @@ const RecordingsPage: React.FC = () => {
                   ))}
                 </TableBody>
               </Table>
+
+              {/* 🔹 PAGING */}
+              <div className="flex items-center justify-between mt-4 text-sm text-gray-600">
+                <span>
+                  Showing {recordings.length}
+                  {totalEstimate !== null && ` of about ${totalEstimate}`} recordings
+                </span>
+                {nextCursor && (
+                  <button
+                    onClick={() => fetchRecordings(nextCursor)}
+                    disabled={loading}
+                    className="bg-blue-600 text-white px-4 py-1.5 rounded-md shadow hover:bg-blue-700 disabled:opacity-50"
+                  >
+                    {loading ? "Loading..." : "Load more"}
+                  </button>
+                )}
+              </div>
             </div>
           )}
         </CardContent>